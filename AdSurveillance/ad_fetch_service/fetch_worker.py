@@ -0,0 +1,192 @@
+"""
+Fetch Worker - Standalone process that drains the ads fetch job queue
+
+Run any number of these on any number of nodes:
+    python -m AdSurveillance.ad_fetch_service.fetch_worker --concurrency 2
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, Any, Tuple
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.ad_fetch_service.job_executor import run_fetch, build_result, run_post_ingest
+from AdSurveillance.ad_fetch_service.job_queue import create_job_queue
+from AdSurveillance.service_metrics import metrics
+
+
+class LeaseKeeper:
+    """Renews a job lease in the background while the job runs"""
+
+    def __init__(self, queue, job_id: str, owner: str, lease_seconds: int):
+        self.queue = queue
+        self.job_id = job_id
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        # Renew well before expiry so one slow round trip doesn't lose the lease
+        interval = max(1, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            if not self.queue.renew(self.job_id, self.owner, self.lease_seconds):
+                self.lost = True
+                print(f"⚠️  FetchWorker: Lost lease on job {self.job_id}")
+                return
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name=f'lease-{self.job_id[:8]}', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        return False
+
+
+class FetchWorker:
+    """Claims jobs from the queue and runs them until stopped"""
+
+    def __init__(self,
+                 queue=None,
+                 concurrency: int = None,
+                 poll_interval: float = None,
+                 lease_seconds: int = None,
+                 runner: Callable[[str, str], Tuple[bool, str, int]] = None,
+                 worker_id: str = None):
+        """
+        Args:
+            queue: SupabaseJobQueue or LocalJobQueue
+            concurrency: Number of jobs run in parallel
+            poll_interval: Seconds to wait when the queue is empty
+            lease_seconds: Lease length for claimed jobs
+            runner: Function (user_id, platform) -> (success, logs, ads_count)
+            worker_id: Unique identity used as lease owner prefix
+        """
+        self.queue = queue or create_job_queue()
+        self.concurrency = concurrency or Config.WORKER_CONCURRENCY
+        self.poll_interval = poll_interval or Config.WORKER_POLL_INTERVAL
+        self.lease_seconds = lease_seconds or Config.JOB_LEASE_SECONDS
+        self.runner = runner or run_fetch
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+        self._stop = threading.Event()
+        self._threads = []
+
+    def process(self, job: Dict[str, Any], owner: str) -> bool:
+        """
+        Run a claimed job and store its result
+
+        Returns:
+            True if the result was stored under our lease
+        """
+        job_id = job['job_id']
+        print(f"🚀 FetchWorker[{owner}]: Running job {job_id} (attempt {job.get('attempts')})")
+
+        try:
+            started_at = datetime.now(timezone.utc)
+            with LeaseKeeper(self.queue, job_id, owner, self.lease_seconds) as lease:
+                success, logs, ads_count = self.runner(job['user_id'], job.get('platform') or 'all')
+                run_post_ingest(job['user_id'], started_at)
+        except Exception as e:
+            success, logs, ads_count = False, f"Error running ads fetcher: {e}", 0
+
+        status, fields = build_result(success, logs, ads_count)
+        stored = self.queue.complete(job_id, owner, status, **fields)
+
+        if stored:
+            metrics.incr(f'fetch_worker.jobs_{status}')
+            print(f"✅ FetchWorker[{owner}]: Job {job_id} {status}")
+        else:
+            metrics.incr('fetch_worker.leases_lost')
+            print(f"⚠️  FetchWorker[{owner}]: Result for job {job_id} dropped, lease lost={lease.lost}")
+
+        return stored
+
+    def run_once(self, owner: str = None) -> bool:
+        """
+        Claim and run at most one job
+
+        Returns:
+            True if a job was claimed
+        """
+        owner = owner or self.worker_id
+        job = self.queue.claim(owner, self.lease_seconds)
+        if not job:
+            return False
+
+        metrics.incr('fetch_worker.jobs_claimed')
+        self.process(job, owner)
+        return True
+
+    def _loop(self, slot: int):
+        owner = f"{self.worker_id}/{slot}"
+        while not self._stop.is_set():
+            try:
+                if not self.run_once(owner):
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                metrics.incr('fetch_worker.errors')
+                print(f"❌ FetchWorker[{owner}]: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """Start the worker threads"""
+        for slot in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, args=(slot,), name=f'fetch-worker-{slot}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"✅ FetchWorker {self.worker_id}: {self.concurrency} slot(s), lease {self.lease_seconds}s")
+
+    def stop(self, timeout: float = None):
+        """Stop claiming new jobs and wait for running ones to finish"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_forever(self):
+        """Run until SIGINT/SIGTERM, then drain in-flight jobs"""
+        def handle_signal(signum, frame):
+            print(f"🛑 FetchWorker {self.worker_id}: Shutting down after current jobs...")
+            self._stop.set()
+
+        signal.signal(signal.SIGINT, handle_signal)
+        signal.signal(signal.SIGTERM, handle_signal)
+
+        self.start()
+        while not self._stop.wait(1):
+            pass
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AdSurveillance fetch worker')
+    parser.add_argument('--concurrency', type=int, default=Config.WORKER_CONCURRENCY)
+    parser.add_argument('--poll-interval', type=float, default=Config.WORKER_POLL_INTERVAL)
+    parser.add_argument('--lease-seconds', type=int, default=Config.JOB_LEASE_SECONDS)
+    parser.add_argument('--backend', choices=['supabase', 'local'], default=Config.JOB_QUEUE_BACKEND)
+    args = parser.parse_args()
+
+    worker = FetchWorker(
+        queue=create_job_queue(args.backend),
+        concurrency=args.concurrency,
+        poll_interval=args.poll_interval,
+        lease_seconds=args.lease_seconds
+    )
+    worker.run_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+"""
+Job Archive - Moves old finished jobs out of ads_fetch_jobs
+
+Finished jobs older than JOB_ARCHIVE_AFTER_DAYS are stored as compressed
+per-user segments in ads_fetch_jobs_archive (full rows, logs included)
+and summarized per user per day in job_daily_summary, then deleted from
+ads_fetch_jobs. Listing endpoints read segments back only when a caller
+asks for history older than the live window.
+"""
+import base64
+import json
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+import os
+import sys
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.ad_fetch_service.job_format import parse_timestamp
+from AdSurveillance.service_metrics import metrics
+
+# zstandard is optional, segments fall back to zlib
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    zstandard = None
+    HAS_ZSTD = False
+
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 9
+
+# Columns added by the archiver itself, never part of an archived row
+INTERNAL_FIELDS = ('archive_batch',)
+
+# Batches tagged longer ago than this without being finished are resumed
+STALE_BATCH_SECONDS = 600
+
+
+def compress_rows(rows: List[Dict[str, Any]]) -> Tuple[str, str, int]:
+    """
+    Compress job rows for a segment
+
+    Returns:
+        Tuple of (codec, base64 payload, uncompressed size)
+    """
+    raw = json.dumps(rows, separators=(',', ':'), default=str).encode('utf-8')
+    if HAS_ZSTD:
+        codec, packed = 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    else:
+        codec, packed = 'zlib', zlib.compress(raw, ZLIB_LEVEL)
+    return codec, base64.b64encode(packed).decode('ascii'), len(raw)
+
+
+def decompress_rows(codec: str, payload: str) -> List[Dict[str, Any]]:
+    """Decode a segment payload back into job rows"""
+    packed = base64.b64decode(payload)
+    if codec == 'zstd':
+        if not HAS_ZSTD:
+            raise RuntimeError("Archive segment is zstd compressed but zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(packed)
+    elif codec == 'zlib':
+        raw = zlib.decompress(packed)
+    else:
+        raise ValueError(f"Unknown archive codec: {codec}")
+    return json.loads(raw)
+
+
+def summarize_jobs(user_id: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Per-day summary rows for one user's jobs"""
+    days: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        created = parse_timestamp(row.get('created_at'))
+        if not created:
+            continue
+        date = created.astimezone(timezone.utc).date().isoformat()
+        day = days.setdefault(date, {
+            'user_id': user_id, 'date': date, 'total_jobs': 0, 'completed': 0, 'failed': 0,
+            'ads_fetched': 0, 'total_duration_seconds': 0, 'jobs_with_duration': 0
+        })
+        day['total_jobs'] += 1
+        if row.get('status') in ('completed', 'failed'):
+            day[row['status']] += 1
+        day['ads_fetched'] += row.get('ads_fetched') or 0
+
+        start_dt, end_dt = parse_timestamp(row.get('start_time')), parse_timestamp(row.get('end_time'))
+        if start_dt and end_dt:
+            day['total_duration_seconds'] += (end_dt - start_dt).total_seconds()
+            day['jobs_with_duration'] += 1
+    return list(days.values())
+
+
+def archive_cutoff(archive_after_days: int = None) -> datetime:
+    """Start of the oldest day that stays live (whole days are archived together)"""
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=archive_after_days or Config.JOB_ARCHIVE_AFTER_DAYS)
+
+
+class JobArchiver:
+    """Archives finished jobs in tagged batches"""
+
+    def __init__(self, supabase, archive_after_days: int = None, batch_size: int = None):
+        """
+        Args:
+            supabase: Supabase client
+            archive_after_days: Finished jobs created before this many days ago are archived
+            batch_size: Jobs tagged and moved per round trip
+        """
+        self.supabase = supabase
+        self.archive_after_days = archive_after_days or Config.JOB_ARCHIVE_AFTER_DAYS
+        self.batch_size = batch_size or Config.JOB_ARCHIVE_BATCH_SIZE
+
+    def cutoff(self) -> datetime:
+        return archive_cutoff(self.archive_after_days)
+
+    def _store_batch(self, batch_id: str, rows: List[Dict[str, Any]]) -> int:
+        """Write one segment per user for a tagged batch, then drop the live rows"""
+        by_user: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            clean = {k: v for k, v in row.items() if k not in INTERNAL_FIELDS}
+            by_user.setdefault(str(row.get('user_id')), []).append(clean)
+
+        for user_id, user_rows in by_user.items():
+            user_rows.sort(key=lambda r: r.get('created_at') or '')
+            codec, payload, raw_bytes = compress_rows(user_rows)
+            segment = {
+                # Deterministic id: resuming a batch never stores a segment twice
+                'segment_id': f'{batch_id}:{user_id}',
+                'user_id': user_id,
+                'first_created_at': user_rows[0].get('created_at'),
+                'last_created_at': user_rows[-1].get('created_at'),
+                'job_count': len(user_rows),
+                'job_ids': [r['job_id'] for r in user_rows],
+                'codec': codec,
+                'payload': payload,
+                'raw_bytes': raw_bytes,
+                'compressed_bytes': len(payload)
+            }
+            self.supabase.rpc('store_job_archive_segment', {
+                'p_segment': segment,
+                'p_summaries': summarize_jobs(user_id, user_rows)
+            }).execute()
+
+            metrics.incr('job_archive.segments')
+            metrics.incr('job_archive.raw_bytes', raw_bytes)
+            metrics.incr('job_archive.compressed_bytes', len(payload))
+
+        self.supabase.table('ads_fetch_jobs')\
+            .delete()\
+            .eq('archive_batch', batch_id)\
+            .execute()
+
+        return len(rows)
+
+    def resume_stale_batches(self) -> int:
+        """Finish batches whose archiver died between tagging and deleting"""
+        response = self.supabase.table('ads_fetch_jobs')\
+            .select('archive_batch')\
+            .not_.is_('archive_batch', 'null')\
+            .limit(self.batch_size)\
+            .execute()
+
+        resumed = 0
+        for batch_id in {row['archive_batch'] for row in response.data or []}:
+            tagged_at = batch_id.split('-', 1)[0]
+            if tagged_at.isdigit() and time.time() - int(tagged_at) < STALE_BATCH_SECONDS:
+                continue
+
+            # A batch holds at most batch_size rows, all of them are rewritten together
+            rows = self.supabase.table('ads_fetch_jobs')\
+                .select('*')\
+                .eq('archive_batch', batch_id)\
+                .execute().data or []
+            if rows:
+                print(f"♻️  JobArchiver: Resuming batch {batch_id} ({len(rows)} jobs)")
+                resumed += self._store_batch(batch_id, rows)
+        return resumed
+
+    def archive_old_jobs(self) -> int:
+        """
+        Archive all finished jobs older than the live window
+
+        Returns:
+            Number of jobs archived
+        """
+        if not self.supabase:
+            return 0
+
+        archived = self.resume_stale_batches()
+        cutoff = self.cutoff().isoformat()
+
+        while True:
+            candidates = self.supabase.table('ads_fetch_jobs')\
+                .select('job_id')\
+                .in_('status', ['completed', 'failed'])\
+                .lt('created_at', cutoff)\
+                .is_('archive_batch', 'null')\
+                .order('created_at')\
+                .limit(self.batch_size)\
+                .execute()
+
+            job_ids = [job['job_id'] for job in candidates.data or []]
+            if not job_ids:
+                break
+
+            # Tag the batch; the update only returns rows no other archiver took
+            batch_id = f'{int(time.time())}-{uuid.uuid4().hex[:8]}'
+            claimed = self.supabase.table('ads_fetch_jobs')\
+                .update({'archive_batch': batch_id})\
+                .in_('job_id', job_ids)\
+                .is_('archive_batch', 'null')\
+                .execute()
+
+            if claimed.data:
+                archived += self._store_batch(batch_id, claimed.data)
+
+            if len(job_ids) < self.batch_size:
+                break
+
+        if archived:
+            metrics.incr('job_archive.jobs', archived)
+            print(f"🗄️  JobArchiver: Archived {archived} jobs created before {cutoff}")
+        return archived
+
+
+class JobArchiveReader:
+    """Reads archived jobs back, keeping recently decoded segments in memory"""
+
+    SEGMENT_COLUMNS = 'segment_id, first_created_at, last_created_at, job_count, codec, payload'
+
+    def __init__(self, supabase, max_segments: int = 64):
+        self.supabase = supabase
+        self.max_segments = max_segments
+        self._segments: 'OrderedDict[str, List[Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _rows(self, segment: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # Segments never change once written, so decoded rows can be reused freely
+        segment_id = segment['segment_id']
+        with self._lock:
+            rows = self._segments.get(segment_id)
+            if rows is not None:
+                self._segments.move_to_end(segment_id)
+                return rows
+
+        rows = decompress_rows(segment['codec'], segment['payload'])
+        with self._lock:
+            self._segments[segment_id] = rows
+            while len(self._segments) > self.max_segments:
+                self._segments.popitem(last=False)
+        return rows
+
+    def list_jobs(self,
+                  user_id: str,
+                  since: Optional[str] = None,
+                  limit: int = 20,
+                  status: Optional[str] = None,
+                  platform: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Archived jobs of a user, newest first
+
+        Segments are read newest first and only until limit jobs were found.
+
+        Args:
+            user_id: The user ID
+            since: Only jobs created at or after this ISO timestamp
+            limit: Maximum number of jobs
+            status: Optional status filter
+            platform: Optional platform filter ('all' means no filter)
+
+        Returns:
+            List of job rows without logs, marked archived=True
+        """
+        if not self.supabase or limit <= 0:
+            return []
+
+        jobs: List[Dict[str, Any]] = []
+        offset = 0
+        page_size = 10
+
+        while len(jobs) < limit:
+            query = self.supabase.table('ads_fetch_jobs_archive')\
+                .select(self.SEGMENT_COLUMNS)\
+                .eq('user_id', str(user_id))\
+                .order('last_created_at', desc=True)\
+                .range(offset, offset + page_size - 1)
+            if since:
+                query = query.gte('last_created_at', since)
+
+            segments = query.execute().data or []
+            for segment in segments:
+                for row in reversed(self._rows(segment)):
+                    if since and (row.get('created_at') or '') < since:
+                        continue
+                    if status and row.get('status') != status:
+                        continue
+                    if platform and platform != 'all' and row.get('platform') != platform:
+                        continue
+                    job = {k: v for k, v in row.items() if k != 'logs'}
+                    job['archived'] = True
+                    jobs.append(job)
+
+            if len(segments) < page_size:
+                break
+            offset += page_size
+
+        # Segments of different batches can overlap in time
+        jobs.sort(key=lambda job: job.get('created_at') or '', reverse=True)
+        return jobs[:limit]
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """An archived job with its logs, or None"""
+        if not self.supabase:
+            return None
+
+        response = self.supabase.table('ads_fetch_jobs_archive')\
+            .select(self.SEGMENT_COLUMNS)\
+            .contains('job_ids', [job_id])\
+            .limit(1)\
+            .execute()
+
+        for segment in response.data or []:
+            for row in self._rows(segment):
+                if row.get('job_id') == job_id:
+                    return dict(row, archived=True)
+        return None
+
+
+    def daily_summary(self, user_id: str, since_date: str, until_date: str) -> List[Dict[str, Any]]:
+        """Archived per-day summary rows for since_date <= date < until_date"""
+        if not self.supabase:
+            return []
+
+        response = self.supabase.table('job_daily_summary')\
+            .select('*')\
+            .eq('user_id', str(user_id))\
+            .gte('date', since_date)\
+            .lt('date', until_date)\
+            .order('date')\
+            .execute()
+        return response.data or []
+
+
+def merge_archived(live_jobs: List[Dict[str, Any]], archived_jobs: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """Combine live and archived jobs newest first, dropping duplicates"""
+    seen = {job.get('job_id') for job in live_jobs}
+    merged = live_jobs + [job for job in archived_jobs if job.get('job_id') not in seen]
+    merged.sort(key=lambda job: job.get('created_at') or '', reverse=True)
+    return merged[:limit]
+
+
+if __name__ == '__main__':
+    # Archive old jobs once
+    from supabase import create_client
+
+    print("🧪 Running Job Archiver once...")
+    print("=" * 60)
+    print(f"  codec: {'zstd' if HAS_ZSTD else 'zlib (install zstandard for zstd)'}")
+
+    client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+    count = JobArchiver(client).archive_old_jobs()
+    print(f"  archived: {count}")
+
+    print("=" * 60)
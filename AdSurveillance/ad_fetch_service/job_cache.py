@@ -0,0 +1,210 @@
+"""
+Job Cache - Bounded in-memory cache of ads fetch job records
+
+Entries are compact __slots__ records (no logs), evicted least recently
+used first once the entry or memory ceiling is reached, and expire after
+a TTL that depends on the job state: finished jobs practically never
+change and stay cached for long, while active jobs may be updated by
+another process and expire quickly.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.service_metrics import metrics
+from AdSurveillance.ad_fetch_service.job_events import TERMINAL_STATUSES
+
+# Columns of ads_fetch_jobs kept in the cache (logs are served by /job-logs)
+JOB_FIELDS = (
+    'id', 'job_id', 'user_id', 'status', 'platform', 'total_competitors', 'ads_fetched',
+    'error_message', 'start_time', 'end_time', 'created_at', 'updated_at', 'heartbeat_at',
+    'attempts', 'lease_owner', 'lease_expires_at', 'duration_seconds'
+)
+
+
+class JobRecord:
+    """Compact cached copy of one ads_fetch_jobs row"""
+
+    __slots__ = JOB_FIELDS + ('expires_at', 'size')
+
+    def __init__(self):
+        for field in JOB_FIELDS:
+            setattr(self, field, None)
+        self.expires_at = 0.0
+        self.size = 0
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'JobRecord':
+        record = cls()
+        record.update(row)
+        return record
+
+    def update(self, fields: Dict[str, Any]) -> None:
+        for field in JOB_FIELDS:
+            if field in fields:
+                setattr(self, field, fields[field])
+        self.size = sys.getsizeof(self) + sum(
+            sys.getsizeof(getattr(self, field)) for field in JOB_FIELDS
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in JOB_FIELDS}
+
+
+class JobCache:
+    """Thread-safe LRU cache of JobRecords with state-dependent TTLs"""
+
+    def __init__(self,
+                 max_entries: int = None,
+                 max_bytes: int = None,
+                 active_ttl: float = None,
+                 terminal_ttl: float = None):
+        """
+        Args:
+            max_entries: Maximum number of cached jobs
+            max_bytes: Approximate memory ceiling for all records
+            active_ttl: Seconds a pending/running job stays cached
+            terminal_ttl: Seconds a completed/failed job stays cached
+        """
+        self.max_entries = max_entries or Config.JOB_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or Config.JOB_CACHE_MAX_BYTES
+        self.active_ttl = active_ttl if active_ttl is not None else Config.JOB_CACHE_ACTIVE_TTL
+        self.terminal_ttl = terminal_ttl if terminal_ttl is not None else Config.JOB_CACHE_TERMINAL_TTL
+
+        self._records: 'OrderedDict[str, JobRecord]' = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def _ttl(self, record: JobRecord) -> float:
+        return self.terminal_ttl if record.status in TERMINAL_STATUSES else self.active_ttl
+
+    def _store(self, job_id: str, record: JobRecord) -> None:
+        """Insert or replace a record and enforce the ceilings (lock held)"""
+        old = self._records.pop(job_id, None)
+        if old is not None:
+            self._bytes -= old.size
+        record.expires_at = time.monotonic() + self._ttl(record)
+        self._records[job_id] = record
+        self._bytes += record.size
+
+        while self._records and (len(self._records) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._records.popitem(last=False)
+            self._bytes -= evicted.size
+            metrics.incr('job_cache.evictions')
+
+    def _lookup(self, job_id: str, now: float) -> Optional[JobRecord]:
+        """Fresh record for job_id or None, counting the hit or miss (lock held)"""
+        record = self._records.get(job_id)
+        if record is not None and record.expires_at <= now:
+            del self._records[job_id]
+            self._bytes -= record.size
+            metrics.incr('job_cache.expired')
+            record = None
+
+        if record is None:
+            self._misses += 1
+            return None
+
+        self._records.move_to_end(job_id)
+        self._hits += 1
+        return record
+
+    def _publish_gauges(self) -> None:
+        total = self._hits + self._misses
+        metrics.set_gauge('job_cache.size', len(self._records))
+        metrics.set_gauge('job_cache.bytes', self._bytes)
+        metrics.set_gauge('job_cache.hit_ratio', round(self._hits / total, 4) if total else 0)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cached job as a dict, or None on a miss or expired entry"""
+        with self._lock:
+            record = self._lookup(job_id, time.monotonic())
+            job = record.to_dict() if record is not None else None
+            self._publish_gauges()
+        return job
+
+    def get_many(self, job_ids: Iterable[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """
+        Look up several jobs at once
+
+        Returns:
+            Tuple of (cached jobs by job_id, job_ids that missed)
+        """
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for job_id in job_ids:
+                record = self._lookup(job_id, now)
+                if record is not None:
+                    found[job_id] = record.to_dict()
+                else:
+                    missing.append(job_id)
+            self._publish_gauges()
+        return found, missing
+
+    def put(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Cache a full job row and return the cached view of it"""
+        record = JobRecord.from_row(row)
+        with self._lock:
+            self._store(row['job_id'], record)
+            self._publish_gauges()
+            return record.to_dict()
+
+    def update(self, job_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Apply changed fields to a cached job
+
+        Returns:
+            The updated job, or None if the job is not cached
+        """
+        with self._lock:
+            record = self._records.pop(job_id, None)
+            if record is None:
+                return None
+            self._bytes -= record.size
+            record.update(fields)
+            # Re-store to refresh the TTL, the state may have changed
+            self._store(job_id, record)
+            return record.to_dict()
+
+    def refresh(self, row: Dict[str, Any]) -> None:
+        """Apply a row only if the job is already cached (used for changes seen from other processes)"""
+        self.update(row['job_id'], row)
+
+    def pop(self, job_id: str) -> None:
+        with self._lock:
+            record = self._records.pop(job_id, None)
+            if record is not None:
+                self._bytes -= record.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Current size, memory use and hit ratio"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'entries': len(self._records),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / total, 4) if total else 0
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._records)
@@ -0,0 +1,301 @@
+"""
+Job Events - In-process publish/subscribe bus for ads fetch job changes
+
+StatusManager and the fetch executor publish every job transition here.
+Streaming endpoints subscribe per job or per user, so a status change
+reaches connected clients without any database reads per client.
+
+Events from other processes (other gunicorn workers, standalone fetch
+workers) are picked up by JobChangeWatcher, which polls ads_fetch_jobs
+once per interval for everything watched in this process and republishes
+rows whose updated_at changed.
+"""
+import itertools
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, Optional, List, Iterable, Callable
+import os
+import sys
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+# Fields never sent over the bus (large, served by /job-logs)
+EXCLUDED_FIELDS = ('logs',)
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+
+class JobEvent:
+    """A single published job change"""
+
+    __slots__ = ('id', 'seq', 'event', 'job_id', 'user_id', 'data', 'timestamp')
+
+    def __init__(self, id: str, seq: int, event: str, job_id: str, user_id: Optional[str], data: Dict[str, Any]):
+        self.id = id
+        self.seq = seq
+        self.event = event
+        self.job_id = job_id
+        self.user_id = user_id
+        self.data = data
+        self.timestamp = time.time()
+
+
+class JobSubscription:
+    """Queue of events matching a job or user filter"""
+
+    def __init__(self, job_id: str = None, user_id: str = None, maxsize: int = 256):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.queue: 'queue.Queue[JobEvent]' = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def matches(self, event: JobEvent) -> bool:
+        if self.job_id and event.job_id != self.job_id:
+            return False
+        if self.user_id and event.user_id != self.user_id:
+            return False
+        return True
+
+    def get(self, timeout: float) -> Optional[JobEvent]:
+        """Wait up to timeout seconds for the next event"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class JobEventBus:
+    """Thread-safe fan-out of job events with a replay buffer for resume"""
+
+    def __init__(self, history_size: int = None):
+        # Event ids are '<boot>-<seq>'; a different boot means the ids came from another process
+        self.boot_id = uuid.uuid4().hex[:8]
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._history: deque = deque(maxlen=history_size or Config.JOB_EVENTS_HISTORY)
+        self._latest: Dict[str, JobEvent] = {}
+        self._user_versions: Dict[str, int] = {}
+        self._subscribers: List[JobSubscription] = []
+        self._lock = threading.Lock()
+
+    def publish(self, job_id: str, user_id: Optional[str], data: Dict[str, Any], event: str = 'status') -> JobEvent:
+        """
+        Publish a job change to all matching subscribers
+
+        Args:
+            job_id: The job ID
+            user_id: Owner of the job (used by per-user subscriptions)
+            data: Job fields to send
+            event: Event type ('status' or 'heartbeat')
+
+        Returns:
+            The published event
+        """
+        payload = {k: v for k, v in data.items() if k not in EXCLUDED_FIELDS}
+        payload.setdefault('job_id', job_id)
+
+        with self._lock:
+            seq = self._last_seq = next(self._seq)
+            job_event = JobEvent(f'{self.boot_id}-{seq}', seq, event, job_id, user_id, payload)
+            self._history.append(job_event)
+            if event == 'status':
+                # Re-insert so the oldest entry is the least recently changed job
+                self._latest.pop(job_id, None)
+                self._latest[job_id] = job_event
+                if len(self._latest) > self._history.maxlen:
+                    self._latest.pop(next(iter(self._latest)))
+                if user_id:
+                    self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+            subscribers = [s for s in self._subscribers if s.matches(job_event)]
+
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(job_event)
+            except queue.Full:
+                subscription.dropped += 1
+
+        return job_event
+
+    def subscribe(self, job_id: str = None, user_id: str = None) -> JobSubscription:
+        """Register a subscription for a job or for all jobs of a user"""
+        subscription = JobSubscription(job_id=job_id, user_id=user_id)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: JobSubscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def cursor(self) -> str:
+        """Id of the most recently published event (resume point for snapshots)"""
+        with self._lock:
+            return f'{self.boot_id}-{self._last_seq}'
+
+    def user_version(self, user_id: str) -> int:
+        """Number of status events seen in this process for a user's jobs"""
+        with self._lock:
+            return self._user_versions.get(user_id, 0)
+
+    def latest(self, job_id: str) -> Optional[JobEvent]:
+        """Most recent status event for a job, if this process has seen one"""
+        with self._lock:
+            return self._latest.get(job_id)
+
+    def events_since(self, last_event_id: str, job_id: str = None, user_id: str = None) -> Optional[List[JobEvent]]:
+        """
+        Events published after last_event_id that match the filter
+
+        Returns:
+            List of events, or None if the id is unknown to this process or
+            already fell out of the replay buffer (caller should resync)
+        """
+        try:
+            boot_id, seq = last_event_id.rsplit('-', 1)
+            seq = int(seq)
+        except (AttributeError, ValueError):
+            return None
+
+        if boot_id != self.boot_id:
+            return None
+
+        probe = JobSubscription(job_id=job_id, user_id=user_id)
+        with self._lock:
+            if self._history and self._history[0].seq > seq + 1:
+                return None
+            return [e for e in self._history if e.seq > seq and probe.matches(e)]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+
+class JobChangeWatcher:
+    """
+    Polls ads_fetch_jobs on behalf of every watcher in this process and
+    republishes rows changed elsewhere. One query per interval regardless
+    of how many clients are connected.
+    """
+
+    COLUMNS = ('job_id, user_id, status, platform, total_competitors, ads_fetched, error_message, '
+               'start_time, end_time, created_at, updated_at')
+
+    def __init__(self, bus: JobEventBus, supabase, interval: float = None,
+                 on_change: Callable[[Dict[str, Any]], None] = None):
+        """
+        Args:
+            bus: Bus the changed rows are published on
+            supabase: Supabase client
+            interval: Seconds between polls
+            on_change: Optional callback for every changed row (e.g. cache refresh)
+        """
+        self.bus = bus
+        self.supabase = supabase
+        self.interval = interval or Config.JOB_EVENTS_POLL_INTERVAL
+        self.on_change = on_change
+        self._jobs: Dict[str, int] = {}
+        self._users: Dict[str, int] = {}
+        self._watermark = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, job_id: str = None, user_id: str = None) -> None:
+        """Start watching a job or user (reference counted)"""
+        if not self.supabase:
+            return
+        with self._lock:
+            if job_id:
+                self._jobs[job_id] = self._jobs.get(job_id, 0) + 1
+            if user_id:
+                self._users[user_id] = self._users.get(user_id, 0) + 1
+            if self._thread is None or not self._thread.is_alive():
+                self._watermark = datetime.now(timezone.utc) - timedelta(seconds=5)
+                self._thread = threading.Thread(target=self._run, name='job-change-watcher', daemon=True)
+                self._thread.start()
+
+    def unwatch(self, job_id: str = None, user_id: str = None) -> None:
+        with self._lock:
+            for key, refs in ((job_id, self._jobs), (user_id, self._users)):
+                if key and key in refs:
+                    refs[key] -= 1
+                    if refs[key] <= 0:
+                        del refs[key]
+
+    def _fetch_changes(self, job_ids: Iterable[str], user_ids: Iterable[str], since: str) -> List[Dict[str, Any]]:
+        rows = []
+        if job_ids:
+            response = self.supabase.table('ads_fetch_jobs')\
+                .select(self.COLUMNS)\
+                .in_('job_id', list(job_ids))\
+                .gt('updated_at', since)\
+                .execute()
+            rows.extend(response.data or [])
+        if user_ids:
+            response = self.supabase.table('ads_fetch_jobs')\
+                .select(self.COLUMNS)\
+                .in_('user_id', list(user_ids))\
+                .gt('updated_at', since)\
+                .execute()
+            rows.extend(response.data or [])
+        return rows
+
+    def poll_once(self) -> int:
+        """
+        Republish rows changed since the last poll
+
+        Returns:
+            Number of events published
+        """
+        with self._lock:
+            job_ids = list(self._jobs)
+            user_ids = list(self._users)
+            since = self._watermark
+
+        if not job_ids and not user_ids:
+            return 0
+
+        # Overlap the window to tolerate clock skew between writers; duplicates are dropped below
+        polled_at = datetime.now(timezone.utc) - timedelta(seconds=5)
+        rows = self._fetch_changes(job_ids, user_ids, since.isoformat())
+
+        published = 0
+        seen = set()
+        for row in rows:
+            job_id = row['job_id']
+            if job_id in seen:
+                continue
+            seen.add(job_id)
+            latest = self.bus.latest(job_id)
+            if latest and latest.data.get('updated_at') == row.get('updated_at'):
+                continue
+            if self.on_change:
+                self.on_change(row)
+            self.bus.publish(job_id, row.get('user_id'), row)
+            published += 1
+
+        with self._lock:
+            self._watermark = polled_at
+        return published
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._jobs and not self._users:
+                    self._thread = None
+                    return
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"❌ JobChangeWatcher: Poll failed: {e}")
+            time.sleep(self.interval)
+
+
+# Global bus shared by StatusManager, the executor and the streaming endpoints
+job_event_bus = JobEventBus()
@@ -0,0 +1,189 @@
+"""
+Job Executor - Runs a single ads fetch job and records its outcome
+Shared by the API's background threads and the standalone fetch worker
+"""
+import os
+import socket
+import sys
+import traceback
+import uuid
+from datetime import datetime, timezone
+from typing import Tuple, Dict, Any
+
+from AdSurveillance.ad_fetch_service.status_manager import status_manager
+from AdSurveillance.analytics.anomalies import AnomalyDetector
+from AdSurveillance.analytics.keyword_index import keyword_index
+from AdSurveillance.analytics.response_cache import data_versions
+from AdSurveillance.analytics.rollups import RollupBuilder
+from AdSurveillance.analytics.trends import series_cache
+from AdSurveillance.service_metrics import metrics
+
+# ========== ADS FETCHER IMPORT ==========
+FETCHER_AVAILABLE = False
+ads_fetcher = None
+
+# Try to import AdsFetcher
+try:
+    service_path = os.path.dirname(os.path.abspath(__file__))
+    if service_path not in sys.path:
+        sys.path.insert(0, service_path)
+
+    try:
+        from ads_fetcher import AdsFetcher
+        ads_fetcher = AdsFetcher()
+        FETCHER_AVAILABLE = True
+        print("✅ AdsFetcher loaded successfully")
+    except ImportError as e:
+        print(f"❌ Could not import AdsFetcher: {e}")
+    except Exception as e:
+        print(f"❌ Error initializing AdsFetcher: {e}")
+except Exception as e:
+    print(f"❌ Unexpected error loading AdsFetcher: {e}")
+
+if not FETCHER_AVAILABLE:
+    print("🚫 AdsFetcher not available - ads fetching will fail")
+# ========== END ADS FETCHER IMPORT ==========
+
+# Maximum size of logs stored on the job row
+MAX_LOG_CHARS = 10000
+MAX_ERROR_CHARS = 500
+
+
+def run_fetch(user_id: str, platform: str) -> Tuple[bool, str, int]:
+    """
+    Run the ads fetcher for a user
+
+    Args:
+        user_id: The user ID to fetch ads for
+        platform: Platform to fetch from
+
+    Returns:
+        Tuple of (success, logs, ads_count)
+    """
+    if FETCHER_AVAILABLE and ads_fetcher:
+        return ads_fetcher.run_for_user(user_id, platform)
+
+    logs = "=== ADS FETCHING DISABLED ===\n"
+    logs += f"AdsFetcher not properly configured\n"
+    return False, logs, 0
+
+
+def build_result(success: bool, logs: str, ads_count: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Turn a fetch outcome into the final job status and fields
+
+    Args:
+        success: Whether the fetch succeeded
+        logs: Combined fetcher logs
+        ads_count: Number of ads fetched
+
+    Returns:
+        Tuple of (status, fields to store on the job)
+    """
+    fields = {
+        'ads_fetched': ads_count
+    }
+
+    # Add logs if available (truncate if too long)
+    if logs:
+        if len(logs) > MAX_LOG_CHARS:
+            logs = logs[:MAX_LOG_CHARS] + "\n...[truncated]"
+        fields['logs'] = logs
+
+    # Add error message if failed
+    if not success and logs:
+        fields['error_message'] = logs[:MAX_ERROR_CHARS]
+
+    return ('completed' if success else 'failed'), fields
+
+
+rollup_builder = RollupBuilder(status_manager.supabase)
+anomaly_detector = AnomalyDetector(status_manager.supabase)
+
+
+def run_post_ingest(user_id: str, started_at: datetime) -> None:
+    """
+    Refresh data derived from the metrics a fetch just wrote
+    Runs before the job is marked finished, so analytics are current once it is.
+    Spend anomalies are scored on the refreshed rollups and stored as alerts.
+    New creatives are added to the user's keyword index, if it is loaded.
+    Cached analytics responses are retired by bumping the user's data version,
+    also when the rollup refresh failed (the raw metrics changed regardless).
+    Never raises; a failed refresh is logged and counted.
+
+    Args:
+        user_id: User whose fetch ran
+        started_at: When the fetch started
+    """
+    try:
+        rollup_builder.refresh_since(user_id, started_at)
+        series_cache.invalidate(user_id)
+    except Exception as e:
+        metrics.incr('rollups.errors')
+        print(f"⚠️ Rollup refresh failed for user {user_id}: {e}")
+
+    try:
+        anomaly_detector.detect_user(user_id)
+    except Exception as e:
+        metrics.incr('anomalies.errors')
+        print(f"⚠️ Spend anomaly detection failed for user {user_id}: {e}")
+
+    version = data_versions.bump(user_id)
+
+    try:
+        keyword_index.update_since(user_id, started_at, version)
+    except Exception as e:
+        metrics.incr('keyword_index.errors')
+        print(f"⚠️ Keyword index update failed for user {user_id}: {e}")
+
+
+def execute_fetch_job(job_id: str, user_id: str, platform: str, attempts: int = 0) -> bool:
+    """
+    Run a job in the current thread, tracking it through StatusManager
+
+    Args:
+        job_id: The job ID
+        user_id: User who owns the job
+        platform: Platform to fetch from
+        attempts: Attempts already made; this run counts as the next one
+
+    Returns:
+        True if the fetch succeeded, False otherwise
+    """
+    try:
+        print(f"🚀 Starting background fetch for job {job_id}")
+
+        if not status_manager.supabase:
+            print("❌ Supabase not available for job update")
+            return False
+
+        # Update job status to running (this also writes the first heartbeat).
+        # Starting the thread is this mode's claim, so the attempt is counted here,
+        # and the run takes the lease so only it can store the result
+        run_id = f"{socket.gethostname()}:{os.getpid()}:thread-{uuid.uuid4().hex[:6]}"
+        if not status_manager.update_job_status(job_id, 'running', expected_status='pending',
+                                                attempts=attempts + 1, lease_owner=run_id):
+            print(f"⚠️  Job {job_id} is no longer pending, not starting it")
+            return False
+
+        # Keep the heartbeat fresh while the fetcher blocks
+        started_at = datetime.now(timezone.utc)
+        with status_manager.heartbeat_during(job_id):
+            success, logs, ads_count = run_fetch(user_id, platform)
+            run_post_ingest(user_id, started_at)
+
+        status, fields = build_result(success, logs, ads_count)
+        # The reaper, a user cancel or a restarted run may have taken the job meanwhile
+        if not status_manager.update_job_status(job_id, status, expected_status='running',
+                                                expected_owner=run_id, **fields):
+            metrics.incr('fetch_jobs.results_dropped')
+            print(f"⚠️  Result for job {job_id} dropped, the job was failed, cancelled or restarted")
+            return False
+
+        print(f"✅ Background fetch completed for job {job_id}: {'success' if success else 'failed'}")
+        return success
+
+    except Exception as e:
+        print(f"❌ Error in background fetch for job {job_id}: {e}")
+        traceback.print_exc()
+        return False
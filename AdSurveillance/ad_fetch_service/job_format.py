@@ -0,0 +1,259 @@
+"""
+Job Format - Display formatting for ads fetch jobs
+
+One formatter shared by every endpoint that returns jobs. Lists are
+formatted in a single pass with one clock read, and timestamp strings
+(which repeat across polls and within lists) are parsed and rendered
+through small LRU caches.
+"""
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Iterable
+
+STATUS_ICONS = {
+    'completed': '✅',
+    'running': '🔄',
+    'failed': '❌',
+    'pending': '⏳'
+}
+
+PLATFORM_ICONS = {
+    'meta': '📱',
+    'google': '🔍',
+    'linkedin': '💼',
+    'tiktok': '🎵',
+    'all': '🌐'
+}
+
+# Platforms covered by a job fetching from 'all'
+ALL_PLATFORMS_COUNT = 4
+
+# Rough estimate used for progress: seconds per platform per competitor, capped
+SECONDS_PER_PLATFORM_PER_COMPETITOR = 30
+MAX_ESTIMATED_SECONDS = 300
+
+TIMESTAMP_FIELDS = ('start_time', 'end_time', 'created_at', 'updated_at')
+
+DISPLAY_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+@lru_cache(maxsize=8192)
+def _parse_iso(value: str) -> Optional[datetime]:
+    try:
+        # Handle ISO format timestamps with or without timezone
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError as e:
+        print(f"Error parsing timestamp {value}: {e}")
+        return None
+
+    # If datetime is naive (no timezone), make it UTC
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _display_timestamp(value: str) -> Optional[str]:
+    # The display format is the wall-clock part of the ISO string itself, no tz conversion,
+    # so well-formed values are sliced instead of parsed and rendered with strftime
+    if len(value) >= 19 and value[10] in 'T ' and value[4] == '-' and value[13] == ':' and value[16] == ':':
+        return f"{value[:10]} {value[11:19]}"
+    dt = _parse_iso(value)
+    return dt.strftime(DISPLAY_FORMAT) if dt else None
+
+
+def parse_timestamp(timestamp):
+    """Parse timestamp string to datetime object with UTC timezone"""
+    if not timestamp:
+        return None
+
+    if isinstance(timestamp, str):
+        return _parse_iso(timestamp)
+    elif isinstance(timestamp, datetime):
+        # If it's already a datetime object, ensure it has timezone
+        if timestamp.tzinfo is None:
+            return timestamp.replace(tzinfo=timezone.utc)
+        return timestamp
+    return timestamp
+
+
+def format_duration(seconds):
+    """Format duration in seconds to human readable string"""
+    if not seconds:
+        return None
+
+    if seconds < 60:
+        return f"{seconds}s"
+    elif seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60}s"
+    else:
+        return f"{seconds // 3600}h {(seconds % 3600) // 60}m"
+
+
+def calculate_progress(job: Dict[str, Any], now: float = None) -> float:
+    """
+    Calculate progress percentage based on job status and data
+
+    Args:
+        job: The job dictionary
+        now: Current UNIX time (read once per list by format_jobs)
+    """
+    status = job.get('status') or 'pending'
+
+    if status == 'completed':
+        return 100
+    elif status == 'failed':
+        return 0
+    elif status == 'running':
+        # Estimate based on time elapsed vs estimated time
+        start_dt = parse_timestamp(job.get('start_time'))
+        if start_dt:
+            elapsed = (now if now is not None else time.time()) - start_dt.timestamp()
+
+            platforms_count = ALL_PLATFORMS_COUNT if (job.get('platform') or 'all') == 'all' else 1
+            estimated_total = min(
+                (job.get('total_competitors') or 1) * SECONDS_PER_PLATFORM_PER_COMPETITOR * platforms_count,
+                MAX_ESTIMATED_SECONDS
+            )
+
+            if estimated_total > 0:
+                return round(min(95, (elapsed / estimated_total) * 100), 1)
+
+    return 0 if status == 'pending' else 5
+
+
+def format_jobs(jobs: Iterable[Dict[str, Any]], now: float = None) -> List[Dict[str, Any]]:
+    """
+    Format a list of jobs for frontend display in one pass
+
+    Args:
+        jobs: Job dictionaries (not modified)
+        now: Current UNIX time, read once for the whole list by default
+
+    Returns:
+        List of formatted job dictionaries
+    """
+    now = time.time() if now is None else now
+    formatted_jobs = []
+    append = formatted_jobs.append
+
+    for job in jobs:
+        formatted = dict(job)
+        status = job.get('status') or 'unknown'
+
+        formatted['status_icon'] = STATUS_ICONS.get(status, '❓')
+        formatted['progress'] = calculate_progress(job, now)
+
+        # Duration of finished jobs
+        duration = job.get('duration_seconds')
+        if not duration:
+            start_time, end_time = job.get('start_time'), job.get('end_time')
+            if start_time and end_time:
+                start_dt, end_dt = parse_timestamp(start_time), parse_timestamp(end_time)
+                if start_dt and end_dt:
+                    duration = int((end_dt - start_dt).total_seconds())
+                    formatted['duration_seconds'] = duration
+        formatted['duration_formatted'] = format_duration(duration) or 'N/A'
+
+        # Timestamps for display
+        for field in TIMESTAMP_FIELDS:
+            value = job.get(field)
+            if value:
+                display = _display_timestamp(value) if isinstance(value, str) else None
+                if display:
+                    formatted[f'{field}_formatted'] = display
+
+        # Flags
+        formatted['completed'] = status == 'completed'
+        formatted['failed'] = status == 'failed'
+        formatted['running'] = status == 'running'
+        formatted['pending'] = status == 'pending'
+
+        formatted['platform_icon'] = PLATFORM_ICONS.get(job.get('platform') or 'all', '🌐')
+
+        append(formatted)
+
+    return formatted_jobs
+
+
+def format_job_for_display(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Format a single job for frontend display"""
+    return format_jobs((job,))[0]
+
+
+if __name__ == '__main__':
+    # Benchmark against the previous per-job formatter
+    import random
+    import uuid
+    from datetime import timedelta
+
+    print("🧪 Benchmarking job formatting on 10,000 jobs...")
+    print("=" * 60)
+
+    base = datetime.now(timezone.utc) - timedelta(days=30)
+    jobs = []
+    for i in range(10000):
+        created = base + timedelta(minutes=random.randint(0, 30 * 24 * 60))
+        status = random.choice(['completed', 'completed', 'failed', 'running', 'pending'])
+        job = {
+            'job_id': str(uuid.uuid4()),
+            'user_id': str(uuid.uuid4()),
+            'status': status,
+            'platform': random.choice(list(PLATFORM_ICONS)),
+            'total_competitors': random.randint(1, 10),
+            'ads_fetched': random.randint(0, 200),
+            'created_at': created.isoformat(),
+            'start_time': created.isoformat(),
+            'updated_at': (created + timedelta(seconds=5)).isoformat()
+        }
+        if status in ('completed', 'failed'):
+            job['end_time'] = (created + timedelta(seconds=random.randint(10, 600))).isoformat()
+        jobs.append(job)
+
+    def legacy_parse(timestamp):
+        if timestamp.endswith('Z'):
+            timestamp = timestamp[:-1] + '+00:00'
+        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+    def legacy_format(job):
+        # Same work as the per-job formatter this module replaces
+        formatted = job.copy()
+        status = job.get('status', 'unknown')
+        status_icons = {'completed': '✅', 'running': '🔄', 'failed': '❌', 'pending': '⏳'}
+        formatted['status_icon'] = status_icons.get(status, '❓')
+        progress = 0
+        if status == 'completed':
+            progress = 100
+        elif status == 'running':
+            elapsed = (datetime.now(timezone.utc) - legacy_parse(job['start_time'])).total_seconds()
+            total = min(job.get('total_competitors', 1) * 30 * (4 if job.get('platform') == 'all' else 1), 300)
+            progress = round(min(95, elapsed / total * 100), 1)
+        formatted['progress'] = progress
+        if job.get('end_time') and job.get('start_time'):
+            duration = int((legacy_parse(job['end_time']) - legacy_parse(job['start_time'])).total_seconds())
+            formatted['duration_seconds'] = duration
+            formatted['duration_formatted'] = format_duration(duration)
+        for field in TIMESTAMP_FIELDS:
+            if job.get(field):
+                formatted[f'{field}_formatted'] = legacy_parse(job[field]).strftime(DISPLAY_FORMAT)
+        for flag in ('completed', 'failed', 'running', 'pending'):
+            formatted[flag] = status == flag
+        platform_icons = {'meta': '📱', 'google': '🔍', 'linkedin': '💼', 'tiktok': '🎵', 'all': '🌐'}
+        formatted['platform_icon'] = platform_icons.get(job.get('platform', 'all'), '🌐')
+        return formatted
+
+    # 10k distinct jobs, then the polling pattern: the same 100-job page formatted 100 times
+    page = jobs[:100]
+    for label, run in (
+        ('legacy, 10k jobs', lambda: [legacy_format(job) for job in jobs]),
+        ('format_jobs, 10k jobs', lambda: (_parse_iso.cache_clear(), format_jobs(jobs))),
+        ('legacy, 100 x 100-job page', lambda: [[legacy_format(job) for job in page] for _ in range(100)]),
+        ('format_jobs, 100 x 100-job page', lambda: [format_jobs(page) for _ in range(100)]),
+    ):
+        started = time.perf_counter()
+        run()
+        print(f"  {label:<34} {(time.perf_counter() - started) * 1000:8.1f} ms")
+
+    print("\n" + "=" * 60)
+    print("✅ Job formatting benchmark complete")
@@ -0,0 +1,344 @@
+"""
+Job Queue - Lease-based claiming of pending ads fetch jobs
+
+Any number of fetch workers can drain the same queue. A worker claims a
+job by a conditional update that only succeeds while the row is still
+claimable, holds it with a lease (lease_owner + lease_expires_at) that it
+renews while running, and loses it if the lease expires. Expired leases
+are reclaimed by the next worker that polls.
+"""
+import threading
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, Optional, List
+import os
+import sys
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.ad_fetch_service.status_manager import StatusManager, status_manager
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class SupabaseJobQueue:
+    """Job queue backed by the ads_fetch_jobs table"""
+
+    def __init__(self, manager: StatusManager, claim_batch: int = 10, max_attempts: int = None):
+        """
+        Args:
+            manager: StatusManager used for the Supabase client and job updates
+            claim_batch: Number of candidate rows read per claim attempt
+            max_attempts: Jobs that already used this many attempts are failed instead of reclaimed
+        """
+        self.manager = manager
+        self.claim_batch = claim_batch
+        self.max_attempts = max_attempts or Config.JOB_MAX_ATTEMPTS
+
+    @property
+    def supabase(self):
+        return self.manager.supabase
+
+    def _try_claim(self, job: Dict[str, Any], owner: str, lease_seconds: int,
+                   expected: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Conditionally take a job; returns the claimed row or None if another worker won"""
+        now = _utcnow()
+        claim_data = {
+            'status': 'running',
+            'lease_owner': owner,
+            'lease_expires_at': (now + timedelta(seconds=lease_seconds)).isoformat(),
+            'heartbeat_at': now.isoformat(),
+            'attempts': (job.get('attempts') or 0) + 1,
+            'updated_at': now.isoformat()
+        }
+
+        query = self.supabase.table('ads_fetch_jobs')\
+            .update(claim_data)\
+            .eq('job_id', job['job_id'])
+        for column, value in expected.items():
+            query = query.eq(column, value)
+
+        response = query.execute()
+        if not response.data:
+            return None
+
+        claimed = response.data[0]
+        self.manager.publish(claimed['job_id'], self.manager.cache.put(claimed))
+        return claimed
+
+    def claim(self, owner: str, lease_seconds: int = None) -> Optional[Dict[str, Any]]:
+        """
+        Claim the oldest pending job, or a running job whose lease expired
+
+        Args:
+            owner: Unique worker identity
+            lease_seconds: Lease length
+
+        Returns:
+            The claimed job row, or None if nothing is claimable
+        """
+        if not self.supabase:
+            return None
+
+        lease_seconds = lease_seconds or Config.JOB_LEASE_SECONDS
+
+        try:
+            pending = self.supabase.table('ads_fetch_jobs')\
+                .select('job_id, user_id, platform, attempts')\
+                .eq('status', 'pending')\
+                .order('created_at')\
+                .limit(self.claim_batch)\
+                .execute()
+
+            for job in pending.data or []:
+                claimed = self._try_claim(job, owner, lease_seconds, {'status': 'pending'})
+                if claimed:
+                    return claimed
+
+            expired = self.supabase.table('ads_fetch_jobs')\
+                .select('job_id, user_id, platform, attempts, lease_expires_at')\
+                .eq('status', 'running')\
+                .lt('lease_expires_at', _utcnow().isoformat())\
+                .order('lease_expires_at')\
+                .limit(self.claim_batch)\
+                .execute()
+
+            for job in expired.data or []:
+                if (job.get('attempts') or 0) >= self.max_attempts:
+                    self.manager.update_job_status(
+                        job['job_id'],
+                        'failed',
+                        expected_status='running',
+                        error_message=f"Job lease expired after {job.get('attempts')} attempts"
+                    )
+                    continue
+
+                # Compare-and-swap on the observed lease so only one worker reclaims it
+                claimed = self._try_claim(job, owner, lease_seconds, {
+                    'status': 'running',
+                    'lease_expires_at': job['lease_expires_at']
+                })
+                if claimed:
+                    print(f"♻️  JobQueue: Reclaimed expired lease on job {job['job_id']}")
+                    return claimed
+
+            return None
+        except Exception as e:
+            print(f"❌ JobQueue: Error claiming job: {e}")
+            return None
+
+    def renew(self, job_id: str, owner: str, lease_seconds: int = None) -> bool:
+        """
+        Extend a held lease (also refreshes the job heartbeat)
+
+        Returns:
+            True if the lease is still held by owner, False if it was lost
+        """
+        if not self.supabase:
+            return False
+
+        lease_seconds = lease_seconds or Config.JOB_LEASE_SECONDS
+
+        try:
+            now = _utcnow()
+            response = self.supabase.table('ads_fetch_jobs')\
+                .update({
+                    'lease_expires_at': (now + timedelta(seconds=lease_seconds)).isoformat(),
+                    'heartbeat_at': now.isoformat()
+                })\
+                .eq('job_id', job_id)\
+                .eq('lease_owner', owner)\
+                .eq('status', 'running')\
+                .execute()
+            return bool(response.data)
+        except Exception as e:
+            print(f"❌ JobQueue: Error renewing lease on job {job_id}: {e}")
+            # Keep working on transient errors; the lease decides ownership
+            return True
+
+    def complete(self, job_id: str, owner: str, status: str, **fields) -> bool:
+        """
+        Record the final status of a job, only if owner still holds its lease
+
+        Returns:
+            True if the result was stored, False if the lease was lost
+        """
+        return self.manager.update_job_status(job_id, status, expected_status='running',
+                                              expected_owner=owner, **fields)
+
+
+class LocalJobQueue:
+    """
+    In-memory stand-in for SupabaseJobQueue with the same claim, renew,
+    reclaim and complete semantics. Used for local runs and testing.
+    """
+
+    def __init__(self, max_attempts: int = None):
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.max_attempts = max_attempts or Config.JOB_MAX_ATTEMPTS
+
+    def enqueue(self, user_id: str, platform: str = 'all', job_id: str = None) -> Dict[str, Any]:
+        """Add a pending job and return its row"""
+        now = _utcnow()
+        job = {
+            'job_id': job_id or str(uuid.uuid4()),
+            'user_id': user_id,
+            'platform': platform,
+            'status': 'pending',
+            'attempts': 0,
+            'ads_fetched': 0,
+            'lease_owner': None,
+            'lease_expires_at': None,
+            'heartbeat_at': None,
+            'created_at': now.isoformat(),
+            'updated_at': now.isoformat()
+        }
+        with self.lock:
+            self.jobs[job['job_id']] = job
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self, status: str = None) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [dict(j) for j in self.jobs.values() if status is None or j['status'] == status]
+
+    def _take(self, job: Dict[str, Any], owner: str, lease_seconds: int, now: datetime) -> Dict[str, Any]:
+        job.update({
+            'status': 'running',
+            'lease_owner': owner,
+            'lease_expires_at': now + timedelta(seconds=lease_seconds),
+            'heartbeat_at': now.isoformat(),
+            'attempts': job['attempts'] + 1,
+            'updated_at': now.isoformat()
+        })
+        return dict(job)
+
+    def claim(self, owner: str, lease_seconds: int = None) -> Optional[Dict[str, Any]]:
+        lease_seconds = lease_seconds or Config.JOB_LEASE_SECONDS
+        now = _utcnow()
+
+        with self.lock:
+            pending = sorted(
+                (j for j in self.jobs.values() if j['status'] == 'pending'),
+                key=lambda j: j['created_at']
+            )
+            if pending:
+                return self._take(pending[0], owner, lease_seconds, now)
+
+            expired = sorted(
+                (j for j in self.jobs.values()
+                 if j['status'] == 'running' and j['lease_expires_at'] and j['lease_expires_at'] < now),
+                key=lambda j: j['lease_expires_at']
+            )
+            for job in expired:
+                if job['attempts'] >= self.max_attempts:
+                    job.update({
+                        'status': 'failed',
+                        'error_message': f"Job lease expired after {job['attempts']} attempts",
+                        'updated_at': now.isoformat()
+                    })
+                    continue
+                return self._take(job, owner, lease_seconds, now)
+
+        return None
+
+    def renew(self, job_id: str, owner: str, lease_seconds: int = None) -> bool:
+        lease_seconds = lease_seconds or Config.JOB_LEASE_SECONDS
+        now = _utcnow()
+
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job['status'] != 'running' or job['lease_owner'] != owner:
+                return False
+            job['lease_expires_at'] = now + timedelta(seconds=lease_seconds)
+            job['heartbeat_at'] = now.isoformat()
+            return True
+
+    def complete(self, job_id: str, owner: str, status: str, **fields) -> bool:
+        now = _utcnow().isoformat()
+
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job['status'] != 'running' or job['lease_owner'] != owner:
+                return False
+            job.update(fields)
+            job.update({'status': status, 'end_time': now, 'updated_at': now})
+            return True
+
+
+def create_job_queue(backend: str = None):
+    """
+    Create the job queue for the configured backend
+
+    Args:
+        backend: 'supabase' or 'local' (defaults to Config.JOB_QUEUE_BACKEND)
+    """
+    backend = backend or Config.JOB_QUEUE_BACKEND
+    if backend == 'local':
+        return LocalJobQueue()
+    return SupabaseJobQueue(status_manager)
+
+
+if __name__ == '__main__':
+    # Lease semantics of the in-memory queue
+    print("🧪 Checking LocalJobQueue claim, renew, reclaim and complete...")
+    print("=" * 60)
+
+    def expire(queue, job_id):
+        with queue.lock:
+            queue.jobs[job_id]['lease_expires_at'] = _utcnow() - timedelta(seconds=1)
+
+    queue = LocalJobQueue(max_attempts=3)
+    first = queue.enqueue('user-1')['job_id']
+    second = queue.enqueue('user-2')['job_id']
+
+    # Claims go oldest first, one owner per job, until the queue is empty
+    claimed = queue.claim('worker-a', 60)
+    assert claimed['job_id'] == first and claimed['attempts'] == 1 and claimed['lease_owner'] == 'worker-a'
+    assert queue.claim('worker-b', 60)['job_id'] == second
+    assert queue.claim('worker-c', 60) is None
+    print("  claim: oldest pending job first, nothing left to claim afterwards")
+
+    # Only the lease holder renews
+    assert queue.renew(first, 'worker-a', 60)
+    assert not queue.renew(first, 'worker-b', 60)
+    print("  renew: lease holder only")
+
+    # An expired lease is reclaimed by the next poller, and the old owner is locked out
+    expire(queue, first)
+    reclaimed = queue.claim('worker-c', 60)
+    assert reclaimed['job_id'] == first and reclaimed['attempts'] == 2 and reclaimed['lease_owner'] == 'worker-c'
+    assert not queue.renew(first, 'worker-a', 60)
+    assert not queue.complete(first, 'worker-a', 'completed')
+    assert queue.complete(first, 'worker-c', 'completed', ads_fetched=5)
+    assert queue.get(first)['status'] == 'completed' and queue.get(first)['ads_fetched'] == 5
+    print("  reclaim: expired lease taken over, stale owner's renew and complete rejected")
+
+    # A job that is no longer running can't be completed, even by its lease holder
+    assert not queue.complete(first, 'worker-c', 'failed')
+    with queue.lock:
+        queue.jobs[second]['status'] = 'failed'
+    assert not queue.complete(second, 'worker-b', 'completed')
+    assert queue.get(second)['status'] == 'failed'
+    print("  complete: rejected once the job is finished or failed elsewhere")
+
+    # Expired jobs out of attempts are failed instead of reclaimed
+    queue = LocalJobQueue(max_attempts=1)
+    job_id = queue.enqueue('user-3')['job_id']
+    queue.claim('worker-a', 60)
+    expire(queue, job_id)
+    assert queue.claim('worker-b', 60) is None
+    assert queue.get(job_id)['status'] == 'failed'
+    print("  max attempts: expired job failed, not reclaimed")
+
+    print("\n" + "=" * 60)
+    print("✅ LocalJobQueue lease semantics hold")
@@ -0,0 +1,190 @@
+"""
+Job Reaper - Background thread that recovers dead jobs and purges old ones
+"""
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Any, Optional
+import os
+import sys
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.ad_fetch_service.status_manager import StatusManager, status_manager
+from AdSurveillance.ad_fetch_service.job_archive import JobArchiver
+from AdSurveillance.service_metrics import metrics
+
+
+class JobReaper:
+    """
+    Periodically fails or requeues running jobs whose heartbeat is stale
+    and archives (or, with archiving disabled, purges) old finished jobs.
+    """
+
+    def __init__(self,
+                 manager: StatusManager,
+                 interval: int = None,
+                 heartbeat_timeout: int = None,
+                 action: str = None,
+                 max_attempts: int = None,
+                 retention_days: int = None,
+                 purge_batch_size: int = None,
+                 archive_enabled: bool = None,
+                 requeue_handler: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Initialize the reaper
+
+        Args:
+            manager: StatusManager used for all job updates
+            interval: Seconds between reaper runs
+            heartbeat_timeout: Heartbeat age after which a running job is dead
+            action: 'fail' or 'requeue' for dead jobs
+            max_attempts: Requeued jobs are failed once they reach this many attempts
+            retention_days: Finished jobs older than this are purged
+            purge_batch_size: Jobs deleted per round trip
+            archive_enabled: Archive old finished jobs instead of purging them
+            requeue_handler: Called with the job row after it is requeued
+        """
+        self.manager = manager
+        self.interval = interval or Config.JOB_REAPER_INTERVAL
+        self.heartbeat_timeout = heartbeat_timeout or Config.JOB_HEARTBEAT_TIMEOUT
+        self.action = action or Config.JOB_REAPER_ACTION
+        self.max_attempts = max_attempts or Config.JOB_MAX_ATTEMPTS
+        self.retention_days = retention_days or Config.JOB_RETENTION_DAYS
+        self.purge_batch_size = purge_batch_size or Config.JOB_PURGE_BATCH_SIZE
+        self.requeue_handler = requeue_handler
+        self.archive_enabled = Config.JOB_ARCHIVE_ENABLED if archive_enabled is None else archive_enabled
+        self.archiver = JobArchiver(manager.supabase)
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reap_stale_jobs(self) -> Dict[str, int]:
+        """
+        Fail or requeue running jobs whose heartbeat is stale
+
+        Returns:
+            Dictionary with failed and requeued counts
+        """
+        counts = {'failed': 0, 'requeued': 0}
+
+        for job in self.manager.get_stale_jobs(self.heartbeat_timeout):
+            job_id = job['job_id']
+            attempts = job.get('attempts') or 0
+
+            if self.action == 'requeue' and attempts < self.max_attempts:
+                if self.manager.requeue_job(job_id, job.get('heartbeat_at')):
+                    counts['requeued'] += 1
+                    if self.requeue_handler:
+                        try:
+                            self.requeue_handler(job)
+                        except Exception as e:
+                            print(f"❌ JobReaper: Requeue handler failed for job {job_id}: {e}")
+                continue
+
+            failed = self.manager.update_job_status(
+                job_id,
+                'failed',
+                expected_status='running',
+                error_message=f'Job heartbeat stopped for more than {self.heartbeat_timeout}s'
+            )
+            if failed:
+                counts['failed'] += 1
+
+        return counts
+
+    def run_once(self) -> Dict[str, int]:
+        """
+        Run a single reaper pass
+
+        Returns:
+            Dictionary with failed, requeued, archived and purged counts
+        """
+        started = time.time()
+        counts = self.reap_stale_jobs()
+        counts['archived'] = 0
+        counts['purged'] = 0
+        
+        if self.archive_enabled:
+            try:
+                counts['archived'] = self.archiver.archive_old_jobs()
+            except Exception as e:
+                metrics.incr('job_archive.errors')
+                print(f"❌ JobReaper: Archiving failed: {e}")
+        else:
+            counts['purged'] = self.manager.cleanup_old_jobs(
+                days_old=self.retention_days,
+                batch_size=self.purge_batch_size
+            )
+
+        metrics.incr('job_reaper.runs')
+        metrics.incr('job_reaper.jobs_failed', counts['failed'])
+        metrics.incr('job_reaper.jobs_requeued', counts['requeued'])
+        metrics.incr('job_reaper.jobs_purged', counts['purged'])
+        metrics.set_gauge('job_reaper.last_run_at', datetime.now(timezone.utc).isoformat())
+        metrics.set_gauge('job_reaper.last_run_seconds', round(time.time() - started, 3))
+
+        if any(counts.values()):
+            print(f"🧹 JobReaper: failed={counts['failed']} requeued={counts['requeued']} "
+                  f"archived={counts['archived']} purged={counts['purged']}")
+
+        return counts
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                metrics.incr('job_reaper.errors')
+                print(f"❌ JobReaper: Run failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start the reaper thread (no-op if already running)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='job-reaper', daemon=True)
+        self._thread.start()
+        print(f"✅ JobReaper: Started (interval={self.interval}s, timeout={self.heartbeat_timeout}s, action={self.action})")
+
+    def stop(self):
+        """Stop the reaper thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+# Global instance, started by the application
+job_reaper = None
+
+
+def start_job_reaper(requeue_handler: Optional[Callable[[Dict[str, Any]], None]] = None) -> JobReaper:
+    """
+    Start the process-wide job reaper
+
+    Args:
+        requeue_handler: Called with the job row after it is requeued
+
+    Returns:
+        The running JobReaper
+    """
+    global job_reaper
+    if job_reaper is None:
+        job_reaper = JobReaper(status_manager, requeue_handler=requeue_handler)
+    job_reaper.start()
+    return job_reaper
+
+
+if __name__ == '__main__':
+    # Run a single reaper pass
+    print("🧪 Running Job Reaper once...")
+    print("=" * 60)
+
+    result = JobReaper(status_manager).run_once()
+    for key, value in result.items():
+        print(f"  {key}: {value}")
+
+    print("=" * 60)
@@ -0,0 +1,98 @@
+"""
+Job Stats - Reads the incrementally maintained job_stats counters
+
+The counters are kept exact by a trigger on ads_fetch_jobs (see
+migrations/003_job_stats.sql), so reading statistics is one primary-key
+lookup regardless of job history. Rows are mirrored in memory; the mirror
+for a user (and the global row) is dropped on every job transition seen
+in this process and otherwise trusted for JOB_STATS_CACHE_TTL seconds.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+import os
+import sys
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+GLOBAL_SCOPE = 'global'
+
+STATUS_FIELDS = ('pending', 'running', 'completed', 'failed')
+
+
+class JobStatsStore:
+    """In-memory mirror of job_stats rows"""
+
+    def __init__(self, supabase, ttl: float = None):
+        """
+        Args:
+            supabase: Supabase client
+            ttl: Seconds a mirrored row is trusted without a local transition
+        """
+        self.supabase = supabase
+        self.ttl = ttl if ttl is not None else Config.JOB_STATS_CACHE_TTL
+        self._rows: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, user_id: Optional[str]) -> None:
+        """Drop the mirrored rows a transition of this user's job changes"""
+        with self._lock:
+            self._rows.pop(GLOBAL_SCOPE, None)
+            if user_id:
+                self._rows.pop(str(user_id), None)
+
+    def get_row(self, user_id: str = None) -> Dict[str, Any]:
+        """
+        Current counters for a user, or the global counters
+
+        Returns:
+            The job_stats row (all zero if the scope has no jobs yet)
+        """
+        scope = str(user_id) if user_id else GLOBAL_SCOPE
+
+        with self._lock:
+            cached = self._rows.get(scope)
+            if cached and time.monotonic() - cached[1] < self.ttl:
+                return cached[0]
+
+        response = self.supabase.table('job_stats')\
+            .select('*')\
+            .eq('scope', scope)\
+            .limit(1)\
+            .execute()
+
+        row = response.data[0] if response.data else {'scope': scope}
+
+        with self._lock:
+            self._rows[scope] = (row, time.monotonic())
+        return row
+
+    def get_statistics(self, user_id: str = None) -> Dict[str, Any]:
+        """
+        Job statistics in the shape returned by StatusManager.get_job_statistics
+
+        Args:
+            user_id: Optional user ID, global statistics otherwise
+        """
+        row = self.get_row(user_id)
+
+        today = datetime.now(timezone.utc).date().isoformat()
+        jobs_with_duration = row.get('jobs_with_duration') or 0
+        total_duration = row.get('total_duration_seconds') or 0
+
+        stats = {
+            'total_jobs': row.get('total_jobs') or 0,
+            'total_ads_fetched': row.get('total_ads_fetched') or 0,
+            'completed_ads_fetched': row.get('completed_ads_fetched') or 0,
+            'total_duration_seconds': total_duration if jobs_with_duration else 0,
+            'avg_duration_seconds': total_duration / jobs_with_duration if jobs_with_duration else 0,
+            'today': (row.get('today_jobs') or 0) if row.get('today_date') == today else 0,
+            'platforms': row.get('platforms') or {}
+        }
+        for status in STATUS_FIELDS:
+            stats[status] = row.get(status) or 0
+
+        return stats
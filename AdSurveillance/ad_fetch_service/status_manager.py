@@ -1,9 +1,8 @@
 """
 Status Manager - Tracks and manages ads fetching job status
 """
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import threading
-import time
 from typing import Dict, Any, Optional, List
 from supabase import create_client, Client
 import os
@@ -13,6 +12,12 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import Config
 
+from AdSurveillance.ad_fetch_service.job_events import job_event_bus, JobChangeWatcher
+from AdSurveillance.ad_fetch_service.job_cache import JobCache
+from AdSurveillance.ad_fetch_service.job_stats import JobStatsStore
+from AdSurveillance.ad_fetch_service.job_format import parse_timestamp, format_job_for_display
+from AdSurveillance.ad_fetch_service.job_archive import JobArchiveReader
+
 class StatusManager:
     """Manages status of ads fetching jobs"""
     
@@ -24,16 +29,25 @@ class StatusManager:
             print(f"❌ StatusManager: Supabase connection failed: {e}")
             self.supabase = None
             
-        self.active_jobs: Dict[str, Dict] = {}
-        self.lock = threading.Lock()
+        # Bounded LRU/TTL cache of recent jobs, serves status reads
+        self.cache = JobCache()
+        
+        # Mirror of the job_stats counters
+        self.stats = JobStatsStore(self.supabase)
+        
+        # Old finished jobs live in compressed archive segments
+        self.archive = JobArchiveReader(self.supabase)
     
-    def update_job_status(self, job_id: str, status: str, **kwargs) -> bool:
+    def update_job_status(self, job_id: str, status: str, expected_status: str = None,
+                          expected_owner: str = None, **kwargs) -> bool:
         """
         Update job status in database
         
         Args:
             job_id: The job ID
             status: New status (pending, running, completed, failed)
+            expected_status: Only update if the job currently has this status
+            expected_owner: Only update if the job's lease is held by this worker
             **kwargs: Additional fields to update
         
         Returns:
@@ -58,20 +72,32 @@ class StatusManager:
             if status in ['completed', 'failed'] and 'end_time' not in update_data:
                 update_data['end_time'] = datetime.now(timezone.utc).isoformat()
             
-            response = self.supabase.table('ads_fetch_jobs')\
+            # A job entering 'running' starts its heartbeat immediately
+            if status == 'running' and 'heartbeat_at' not in update_data:
+                update_data['heartbeat_at'] = update_data['updated_at']
+            
+            query = self.supabase.table('ads_fetch_jobs')\
                 .update(update_data)\
-                .eq('job_id', job_id)\
-                .execute()
+                .eq('job_id', job_id)
+            
+            if expected_status:
+                query = query.eq('status', expected_status)
+            if expected_owner:
+                query = query.eq('lease_owner', expected_owner)
+            
+            response = query.execute()
+            
+            if (expected_status or expected_owner) and not response.data:
+                print(f"⚠️  StatusManager: Job {job_id} no longer matches expected state, skipped update to {status}")
+                return False
             
-            # Update in-memory cache
-            with self.lock:
-                if job_id in self.active_jobs:
-                    self.active_jobs[job_id].update(update_data)
-                else:
-                    # Get full job data if not in cache
-                    full_job = self.get_job_status(job_id)
-                    if full_job:
-                        self.active_jobs[job_id] = full_job
+            # Update in-memory cache; the update returns the full row, no need to read it back
+            if response.data:
+                job = self.cache.put(response.data[0])
+            else:
+                job = self.cache.update(job_id, update_data) or update_data
+            
+            self.publish(job_id, job)
             
             print(f"✅ StatusManager: Updated job {job_id} to status {status}")
             return True
@@ -79,6 +105,64 @@ class StatusManager:
             print(f"❌ StatusManager: Error updating job {job_id} status: {e}")
             return False
     
+    def heartbeat(self, job_id: str) -> bool:
+        """
+        Record that a running job is still alive
+        
+        Args:
+            job_id: The job ID
+        
+        Returns:
+            True if the heartbeat was written, False otherwise
+        """
+        if not self.supabase:
+            return False
+            
+        try:
+            now = datetime.now(timezone.utc).isoformat()
+            response = self.supabase.table('ads_fetch_jobs')\
+                .update({'heartbeat_at': now})\
+                .eq('job_id', job_id)\
+                .eq('status', 'running')\
+                .execute()
+            
+            if response.data:
+                job = self.cache.update(job_id, {'heartbeat_at': now}) or response.data[0]
+                job_event_bus.publish(job_id, job.get('user_id'), {'heartbeat_at': now}, event='heartbeat')
+            
+            return bool(response.data)
+        except Exception as e:
+            print(f"❌ StatusManager: Error writing heartbeat for job {job_id}: {e}")
+            return False
+    
+    def publish(self, job_id: str, job: Dict[str, Any]) -> None:
+        """
+        Publish a job's current state to streaming subscribers
+        
+        Args:
+            job_id: The job ID
+            job: Job fields (at least status and updated_at)
+        """
+        try:
+            # Every transition goes through here, so this is where the stats mirror goes stale
+            self.stats.invalidate(job.get('user_id'))
+            job_event_bus.publish(job_id, job.get('user_id'), job)
+        except Exception as e:
+            print(f"❌ StatusManager: Error publishing job {job_id}: {e}")
+    
+    def heartbeat_during(self, job_id: str, interval: int = None) -> 'JobHeartbeat':
+        """
+        Context manager that keeps a job's heartbeat fresh while work runs
+        
+        Args:
+            job_id: The job ID
+            interval: Seconds between heartbeats
+        
+        Returns:
+            JobHeartbeat context manager
+        """
+        return JobHeartbeat(self, job_id, interval or Config.JOB_HEARTBEAT_INTERVAL)
+    
     def get_job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
         """
         Get current status of a job
@@ -90,9 +174,9 @@ class StatusManager:
             Job status dictionary or None if not found
         """
         # Check in-memory cache first
-        with self.lock:
-            if job_id in self.active_jobs:
-                return self.active_jobs[job_id].copy()
+        job = self.cache.get(job_id)
+        if job:
+            return job
         
         # Fall back to database
         if not self.supabase:
@@ -106,53 +190,54 @@ class StatusManager:
                 .execute()
             
             if response.data:
-                job_data = response.data[0]
-                
-                # Calculate duration if not present
-                if job_data.get('end_time') and job_data.get('start_time'):
-                    start_dt = self.parse_timestamp(job_data['start_time'])
-                    end_dt = self.parse_timestamp(job_data['end_time'])
-                    
-                    if start_dt and end_dt:
-                        job_data['duration_seconds'] = int((end_dt - start_dt).total_seconds())
-                
                 # Update cache
-                with self.lock:
-                    self.active_jobs[job_id] = job_data
-                
-                return job_data
+                return self.cache.put(self.add_duration(response.data[0]))
             return None
         except Exception as e:
             print(f"❌ StatusManager: Error getting job {job_id} status: {e}")
             return None
     
-    def parse_timestamp(self, timestamp):
-        """Parse timestamp string to datetime object with UTC timezone"""
-        if not timestamp:
-            return None
+    def get_jobs(self, job_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Get several jobs, reading only cache misses from the database
+        
+        Args:
+            job_ids: The job IDs
         
-        if isinstance(timestamp, str):
+        Returns:
+            List of job dictionaries in the order of job_ids (unknown jobs are skipped)
+        """
+        found, missing = self.cache.get_many(job_ids)
+        
+        if missing and self.supabase:
             try:
-                # Handle ISO format timestamps with or without timezone
-                if timestamp.endswith('Z'):
-                    timestamp = timestamp[:-1] + '+00:00'
-                
-                dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                
-                # If datetime is naive (no timezone), make it UTC
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=timezone.utc)
+                response = self.supabase.table('ads_fetch_jobs')\
+                    .select('*')\
+                    .in_('job_id', missing)\
+                    .execute()
                 
-                return dt
+                for job_data in response.data or []:
+                    found[job_data['job_id']] = self.cache.put(self.add_duration(job_data))
             except Exception as e:
-                print(f"❌ Error parsing timestamp {timestamp}: {e}")
-                return None
-        elif isinstance(timestamp, datetime):
-            # If it's already a datetime object, ensure it has timezone
-            if timestamp.tzinfo is None:
-                return timestamp.replace(tzinfo=timezone.utc)
-            return timestamp
-        return timestamp
+                print(f"❌ StatusManager: Error getting jobs {missing}: {e}")
+                raise
+        
+        return [found[job_id] for job_id in job_ids if job_id in found]
+    
+    def add_duration(self, job_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Calculate duration_seconds of a finished job if not present"""
+        if job_data.get('end_time') and job_data.get('start_time'):
+            start_dt = self.parse_timestamp(job_data['start_time'])
+            end_dt = self.parse_timestamp(job_data['end_time'])
+            
+            if start_dt and end_dt:
+                job_data['duration_seconds'] = int((end_dt - start_dt).total_seconds())
+        
+        return job_data
+    
+    def parse_timestamp(self, timestamp):
+        """Parse timestamp string to datetime object with UTC timezone"""
+        return parse_timestamp(timestamp)
     
     def register_job(self, job_id: str, user_id: str, platform: str = "all") -> bool:
         """
@@ -197,8 +282,9 @@ class StatusManager:
                 .execute()
             
             # Add to cache
-            with self.lock:
-                self.active_jobs[job_id] = job_data
+            self.cache.put(job_data)
+            
+            self.publish(job_id, job_data)
             
             print(f"✅ StatusManager: Registered new job {job_id} for user {user_id}")
             return True
@@ -245,12 +331,43 @@ class StatusManager:
             print(f"❌ StatusManager: Error getting jobs for user {user_id}: {e}")
             return []
     
-    def cleanup_old_jobs(self, days_old: int = 7) -> int:
+    def get_archived_jobs(self, user_id: str, since: str = None, limit: int = 20,
+                          status: str = None, platform: str = None) -> List[Dict[str, Any]]:
+        """
+        Get archived jobs of a user, newest first (see JobArchiveReader.list_jobs)
+        
+        Returns:
+            List of archived job dictionaries (without logs)
+        """
+        try:
+            return self.archive.list_jobs(user_id, since=since, limit=limit, status=status, platform=platform)
+        except Exception as e:
+            print(f"❌ StatusManager: Error reading archived jobs for user {user_id}: {e}")
+            return []
+    
+    def get_archived_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get an archived job including its logs
+        
+        Returns:
+            Job dictionary or None if the job is not archived
+        """
+        try:
+            return self.archive.get_job(job_id)
+        except Exception as e:
+            print(f"❌ StatusManager: Error reading archived job {job_id}: {e}")
+            return None
+    
+    def cleanup_old_jobs(self, days_old: int = 7, batch_size: int = 500) -> int:
         """
-        Clean up jobs older than specified days
+        Clean up finished jobs older than specified days
+        
+        Jobs are deleted in batches so a large backlog never turns into
+        a single long-running delete.
         
         Args:
             days_old: Delete jobs older than this many days
+            batch_size: Maximum number of jobs deleted per round trip
         
         Returns:
             Number of jobs deleted
@@ -261,32 +378,35 @@ class StatusManager:
             
         try:
             # Calculate cutoff date
-            cutoff_date = (datetime.now(timezone.utc) - time.timedelta(days=days_old)).isoformat()
-            
-            # Delete old jobs
-            response = self.supabase.table('ads_fetch_jobs')\
-                .delete()\
-                .lt('created_at', cutoff_date)\
-                .execute()
-            
-            deleted_count = len(response.data) if response.data else 0
-            
-            # Clean up cache
-            with self.lock:
-                cutoff_timestamp = time.time() - (days_old * 24 * 3600)
-                jobs_to_remove = []
+            cutoff_date = (datetime.now(timezone.utc) - timedelta(days=days_old)).isoformat()
+            deleted_count = 0
+            
+            while True:
+                # Only finished jobs are purged, running ones belong to the reaper
+                response = self.supabase.table('ads_fetch_jobs')\
+                    .select('job_id')\
+                    .in_('status', ['completed', 'failed'])\
+                    .lt('created_at', cutoff_date)\
+                    .limit(batch_size)\
+                    .execute()
                 
-                for job_id, job_data in self.active_jobs.items():
-                    created_at = job_data.get('created_at')
-                    if isinstance(created_at, str):
-                        created_dt = self.parse_timestamp(created_at)
-                        if created_dt:
-                            created_ts = created_dt.timestamp()
-                            if created_ts < cutoff_timestamp:
-                                jobs_to_remove.append(job_id)
+                job_ids = [job['job_id'] for job in response.data] if response.data else []
+                if not job_ids:
+                    break
                 
-                for job_id in jobs_to_remove:
-                    del self.active_jobs[job_id]
+                self.supabase.table('ads_fetch_jobs')\
+                    .delete()\
+                    .in_('job_id', job_ids)\
+                    .execute()
+                
+                deleted_count += len(job_ids)
+                
+                # Clean up cache
+                for job_id in job_ids:
+                    self.cache.pop(job_id)
+                
+                if len(job_ids) < batch_size:
+                    break
             
             print(f"✅ StatusManager: Cleaned up {deleted_count} old jobs")
             return deleted_count
@@ -298,6 +418,9 @@ class StatusManager:
         """
         Get statistics about jobs
         
+        Reads the job_stats counters maintained on every job transition,
+        so the cost does not grow with job history.
+        
         Args:
             user_id: Optional user ID to filter by
         
@@ -309,45 +432,7 @@ class StatusManager:
             return {}
             
         try:
-            query = self.supabase.table('ads_fetch_jobs').select('*')
-            
-            if user_id:
-                query = query.eq('user_id', user_id)
-            
-            response = query.execute()
-            jobs = response.data if response.data else []
-            
-            stats = {
-                'total_jobs': len(jobs),
-                'completed': 0,
-                'failed': 0,
-                'running': 0,
-                'pending': 0,
-                'total_ads_fetched': 0,
-                'total_duration_seconds': 0,
-                'avg_duration_seconds': 0
-            }
-            
-            total_duration = 0
-            completed_with_duration = 0
-            
-            for job in jobs:
-                status = job.get('status', 'unknown')
-                if status in stats:
-                    stats[status] += 1
-                
-                ads_fetched = job.get('ads_fetched', 0)
-                stats['total_ads_fetched'] += ads_fetched
-                
-                if job.get('duration_seconds'):
-                    total_duration += job['duration_seconds']
-                    completed_with_duration += 1
-            
-            if completed_with_duration > 0:
-                stats['total_duration_seconds'] = total_duration
-                stats['avg_duration_seconds'] = total_duration / completed_with_duration
-            
-            return stats
+            return self.stats.get_statistics(user_id)
         except Exception as e:
             print(f"❌ StatusManager: Error getting job statistics: {e}")
             return {}
@@ -395,87 +480,7 @@ class StatusManager:
         Returns:
             Formatted job dictionary
         """
-        formatted = job.copy()
-        
-        # Add status icon
-        status = job.get('status', 'unknown')
-        status_icons = {
-            'completed': '✅',
-            'running': '🔄',
-            'failed': '❌',
-            'pending': '⏳'
-        }
-        formatted['status_icon'] = status_icons.get(status, '❓')
-        
-        # Format duration
-        duration = job.get('duration_seconds')
-        if not duration and job.get('end_time') and job.get('start_time'):
-            start_dt = self.parse_timestamp(job['start_time'])
-            end_dt = self.parse_timestamp(job['end_time'])
-            if start_dt and end_dt:
-                duration = int((end_dt - start_dt).total_seconds())
-                formatted['duration_seconds'] = duration
-        
-        if duration:
-            if duration < 60:
-                formatted['duration_formatted'] = f"{duration}s"
-            elif duration < 3600:
-                minutes = duration // 60
-                seconds = duration % 60
-                formatted['duration_formatted'] = f"{minutes}m {seconds}s"
-            else:
-                hours = duration // 3600
-                minutes = (duration % 3600) // 60
-                formatted['duration_formatted'] = f"{hours}h {minutes}m"
-        else:
-            formatted['duration_formatted'] = 'N/A'
-        
-        # Calculate progress percentage
-        if status == 'completed':
-            formatted['progress'] = 100
-        elif status == 'failed':
-            formatted['progress'] = 0
-        elif status == 'running':
-            # Estimate progress based on time elapsed
-            start_time = job.get('start_time')
-            if start_time:
-                start_dt = self.parse_timestamp(start_time)
-                if start_dt:
-                    now = datetime.now(timezone.utc)
-                    elapsed = (now - start_dt).total_seconds()
-                    
-                    # Estimate total time: 30 seconds per platform per competitor
-                    total_competitors = job.get('total_competitors', 1)
-                    platform = job.get('platform', 'all')
-                    
-                    if platform == 'all':
-                        platforms_count = 4
-                    else:
-                        platforms_count = 1
-                    
-                    estimated_total = total_competitors * 30 * platforms_count
-                    estimated_total = min(estimated_total, 300)  # Cap at 5 minutes
-                    
-                    if estimated_total > 0:
-                        progress = min(95, (elapsed / estimated_total) * 100)
-                        formatted['progress'] = round(progress, 1)
-                    else:
-                        formatted['progress'] = 50
-                else:
-                    formatted['progress'] = 0
-            else:
-                formatted['progress'] = 0
-        else:
-            formatted['progress'] = 0
-        
-        # Format timestamps
-        for time_field in ['start_time', 'end_time', 'created_at', 'updated_at']:
-            if job.get(time_field):
-                dt = self.parse_timestamp(job[time_field])
-                if dt:
-                    formatted[f'{time_field}_formatted'] = dt.strftime('%Y-%m-%d %H:%M:%S')
-        
-        return formatted
+        return format_job_for_display(job)
     
     def mark_job_as_stuck(self, job_id: str) -> bool:
         """
@@ -490,6 +495,7 @@ class StatusManager:
         return self.update_job_status(
             job_id,
             'failed',
+            expected_status='running',
             error_message='Job was stuck and automatically failed',
             end_time=datetime.now(timezone.utc).isoformat()
         )
@@ -509,7 +515,7 @@ class StatusManager:
             
         try:
             # Calculate cutoff time
-            cutoff_time = (datetime.now(timezone.utc) - time.timedelta(minutes=max_minutes)).isoformat()
+            cutoff_time = (datetime.now(timezone.utc) - timedelta(minutes=max_minutes)).isoformat()
             
             # Find stuck jobs
             response = self.supabase.table('ads_fetch_jobs')\
@@ -522,10 +528,134 @@ class StatusManager:
         except Exception as e:
             print(f"❌ StatusManager: Error getting stuck jobs: {e}")
             return []
+    
+    def get_stale_jobs(self, timeout_seconds: int = None) -> List[Dict[str, Any]]:
+        """
+        Get running jobs whose heartbeat has stopped
+        
+        Jobs without any heartbeat (started before heartbeats existed)
+        are judged by their last update instead.
+        
+        Args:
+            timeout_seconds: Heartbeat age after which a job is considered dead
+        
+        Returns:
+            List of stale job rows (job_id, user_id, platform, attempts)
+        """
+        if not self.supabase:
+            return []
+            
+        try:
+            timeout_seconds = timeout_seconds or Config.JOB_HEARTBEAT_TIMEOUT
+            cutoff_time = (datetime.now(timezone.utc) - timedelta(seconds=timeout_seconds)).isoformat()
+            columns = 'job_id, user_id, platform, attempts, heartbeat_at, updated_at'
+            
+            with_heartbeat = self.supabase.table('ads_fetch_jobs')\
+                .select(columns)\
+                .eq('status', 'running')\
+                .lt('heartbeat_at', cutoff_time)\
+                .execute()
+            
+            without_heartbeat = self.supabase.table('ads_fetch_jobs')\
+                .select(columns)\
+                .eq('status', 'running')\
+                .is_('heartbeat_at', 'null')\
+                .lt('updated_at', cutoff_time)\
+                .execute()
+            
+            return (with_heartbeat.data or []) + (without_heartbeat.data or [])
+        except Exception as e:
+            print(f"❌ StatusManager: Error getting stale jobs: {e}")
+            return []
+    
+    def requeue_job(self, job_id: str, heartbeat_at: str = None) -> bool:
+        """
+        Put a dead running job back into the pending state
+        
+        Attempts are counted when the job is claimed, not here. The update only
+        matches while the heartbeat is still the stale one that was read, so a
+        job another reaper already requeued and restarted is left alone.
+        
+        Args:
+            job_id: The job ID
+            heartbeat_at: heartbeat_at as returned by get_stale_jobs (None if unset)
+        
+        Returns:
+            True if the job was requeued, False otherwise
+        """
+        if not self.supabase:
+            return False
+            
+        try:
+            now = datetime.now(timezone.utc).isoformat()
+            update_data = {
+                'status': 'pending',
+                'heartbeat_at': None,
+                'lease_owner': None,
+                'lease_expires_at': None,
+                'error_message': 'Job heartbeat stopped, requeued',
+                'updated_at': now
+            }
+            
+            query = self.supabase.table('ads_fetch_jobs')\
+                .update(update_data)\
+                .eq('job_id', job_id)\
+                .eq('status', 'running')
+            
+            if heartbeat_at:
+                query = query.eq('heartbeat_at', heartbeat_at)
+            else:
+                query = query.is_('heartbeat_at', 'null')
+            
+            response = query.execute()
+            
+            if not response.data:
+                return False
+            
+            self.publish(job_id, self.cache.put(response.data[0]))
+            
+            print(f"🔁 StatusManager: Requeued job {job_id}")
+            return True
+        except Exception as e:
+            print(f"❌ StatusManager: Error requeuing job {job_id}: {e}")
+            return False
+
+
+class JobHeartbeat:
+    """Background thread that writes a job heartbeat at a fixed interval"""
+    
+    def __init__(self, manager: StatusManager, job_id: str, interval: int):
+        self.manager = manager
+        self.job_id = job_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.manager.heartbeat(self.job_id)
+    
+    def __enter__(self):
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f'heartbeat-{self.job_id[:8]}',
+            daemon=True
+        )
+        self._thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval)
+        return False
 
 # Create a global instance for easy access
 status_manager = StatusManager()
 
+# Republishes changes made by other processes to this process's event bus
+job_change_watcher = JobChangeWatcher(job_event_bus, status_manager.supabase, on_change=status_manager.cache.refresh)
+
 if __name__ == '__main__':
     # Test the status manager
     print("🧪 Testing Status Manager...")
@@ -0,0 +1,182 @@
+"""
+Binning - Histogram buckets over per-group values in one pass
+
+A bin spec is either fixed edges ("100,500,1000,5000"), N log-scale bins
+("log:6", evenly spaced in log between the smallest positive and the largest
+value) or N quantile bins ("quantile:4", equal-count over the values). Edges
+are interior cut points: bin 0 is everything below the first edge, the last
+bin everything at or above the last one.
+
+Every value is placed with one np.digitize and each summed column is one
+np.bincount, so the cost is the same for 10 or 100,000 groups.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BIN_MODES = ('edges', 'log', 'quantile')
+
+# Most bins a log or quantile spec can ask for
+MAX_BINS = 50
+
+
+class BinSpec:
+    """Parsed bin spec: fixed edges, or a count of log/quantile bins"""
+
+    __slots__ = ('mode', 'edges', 'bins')
+
+    def __init__(self, mode: str, edges: Sequence[float] = (), bins: int = 0):
+        self.mode = mode
+        self.edges = tuple(edges)
+        self.bins = bins
+
+    def resolve(self, values: np.ndarray) -> np.ndarray:
+        """
+        Interior edges for a set of values
+
+        Fixed edges are returned as they are; log and quantile edges are
+        derived from the finite values (duplicates dropped, so a narrow or
+        constant set of values yields fewer bins).
+        """
+        if self.mode == 'edges':
+            return np.asarray(self.edges, dtype=np.float64)
+
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if self.mode == 'log':
+            values = values[values > 0]
+        if len(values) < 2 or values.min() == values.max():
+            return np.zeros(0, dtype=np.float64)
+
+        if self.mode == 'log':
+            edges = np.geomspace(values.min(), values.max(), self.bins + 1)[1:-1]
+        else:
+            edges = np.quantile(values, np.linspace(0, 1, self.bins + 1)[1:-1])
+        return np.unique(edges)
+
+
+def parse_bins(spec: Optional[str], default: str = None) -> BinSpec:
+    """
+    A bin spec from a query parameter or config value
+
+    Args:
+        spec: "e1,e2,...", "log:N" or "quantile:N" (default used when empty)
+        default: Spec used when spec is empty
+
+    Raises:
+        ValueError: Malformed spec, unsorted edges or a bad bin count
+    """
+    spec = (spec or default or '').strip().lower()
+    if not spec:
+        raise ValueError('A bin spec is required')
+
+    mode, _, argument = spec.partition(':')
+    if argument:
+        if mode not in ('log', 'quantile'):
+            raise ValueError("Bins must be comma-separated edges, 'log:N' or 'quantile:N'")
+        try:
+            bins = int(argument)
+        except ValueError:
+            raise ValueError(f"'{spec}': the bin count must be an integer")
+        if not 1 <= bins <= MAX_BINS:
+            raise ValueError(f"'{spec}': the bin count must be between 1 and {MAX_BINS}")
+        return BinSpec(mode, bins=bins)
+
+    try:
+        edges = [float(edge) for edge in spec.split(',') if edge.strip()]
+    except ValueError:
+        raise ValueError(f"'{spec}': edges must be numbers")
+    if not edges or len(edges) >= MAX_BINS:
+        raise ValueError(f"'{spec}': between 1 and {MAX_BINS - 1} edges are required")
+    if any(not np.isfinite(edge) for edge in edges) or any(b <= a for a, b in zip(edges, edges[1:])):
+        raise ValueError(f"'{spec}': edges must be finite and strictly increasing")
+    return BinSpec('edges', edges=edges)
+
+
+def bin_totals(values: np.ndarray, edges: np.ndarray, columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Group count and column sums per bin
+
+    Args:
+        values: One value per group, the one binned on
+        edges: Interior edges (BinSpec.resolve)
+        columns: Arrays summed per bin, aligned with values
+
+    Returns:
+        Tuple of (groups per bin, sums per bin by column name), len(edges) + 1 bins
+    """
+    bins = np.digitize(values, edges)
+    size = len(edges) + 1
+    groups = np.bincount(bins, minlength=size)
+    return groups, {name: np.bincount(bins, weights=column, minlength=size) for name, column in columns.items()}
+
+
+def bin_bounds(edges: np.ndarray) -> List[Tuple[Optional[float], Optional[float]]]:
+    """(lower, upper) of every bin, None for the open ends"""
+    bounds = [None] + edges.tolist() + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _significant(value: float) -> str:
+    return f'{value:.3g}'
+
+
+def money_label(lower: Optional[float], upper: Optional[float]) -> str:
+    """'Under $100', '$100-$500', '$1K-$5K', 'Over $5K'"""
+    def money(value):
+        for threshold, suffix in ((1e9, 'B'), (1e6, 'M'), (1e3, 'K')):
+            if abs(value) >= threshold:
+                return f'${_significant(value / threshold)}{suffix}'
+        return f'${_significant(value)}'
+
+    if lower is None and upper is None:
+        return 'All'
+    if lower is None:
+        return f'Under {money(upper)}'
+    if upper is None:
+        return f'Over {money(lower)}'
+    return f'{money(lower)}-{money(upper)}'
+
+
+def percent_label(lower: Optional[float], upper: Optional[float]) -> str:
+    """'<1%', '1-3%', '>10%' for rates in [0, 1]"""
+    def percent(value):
+        return _significant(value * 100)
+
+    if lower is None and upper is None:
+        return 'All'
+    if lower is None:
+        return f'<{percent(upper)}%'
+    if upper is None:
+        return f'>{percent(lower)}%'
+    return f'{percent(lower)}-{percent(upper)}%'
+
+
+if __name__ == '__main__':
+    # One pass matches a per-group loop, for 100,000 groups
+    import random
+    import time
+
+    print("🧪 Binning 100,000 synthetic competitors by average spend...")
+    print("=" * 60)
+
+    random.seed(9)
+    spend = np.array([random.lognormvariate(6, 1.5) for _ in range(100_000)])
+    count = np.array([random.randint(1, 50) for _ in range(100_000)], dtype=np.float64)
+
+    for text in ('100,500,1000,5000', 'log:8', 'quantile:5'):
+        spec = parse_bins(text)
+        started = time.perf_counter()
+        edges = spec.resolve(spend)
+        groups, sums = bin_totals(spend, edges, {'count': count, 'spend': spend * count})
+        elapsed = (time.perf_counter() - started) * 1000
+
+        expected = np.zeros(len(edges) + 1)
+        for value, ads in zip(spend.tolist(), count.tolist()):
+            expected[sum(value >= edge for edge in edges.tolist())] += ads
+        assert np.array_equal(expected, sums['count'])
+        labels = [money_label(lower, upper) for lower, upper in bin_bounds(edges)]
+        print(f"  {text:<18} {len(edges) + 1} bins in {elapsed:.1f} ms: {', '.join(labels[:3])}, ...")
+
+    print("\n" + "=" * 60)
+    print("✅ Bin totals match a per-group loop")
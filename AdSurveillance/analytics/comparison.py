@@ -0,0 +1,197 @@
+"""
+Comparison - Period-over-period deltas from one scan
+
+The current window and its baseline (the period just before it, or the same
+dates a year earlier) are read in one query. Every row is tagged
+with its period through a per-date lookup, and one reduction over
+(group, period) codes yields both periods' totals side by side.
+"""
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from AdSurveillance.analytics.metrics_frame import MetricsFrame, safe_divide
+
+COMPARE_MODES = ('previous_period', 'previous_year')
+
+# Totals compared per group
+COMPARED_FIELDS = ('spend', 'impressions', 'clicks', 'count')
+
+CURRENT, BASELINE = 0, 1
+
+
+def baseline_window(mode: str, start: date, end: date) -> Tuple[date, date]:
+    """
+    The window a period is compared against
+
+    Args:
+        mode: 'previous_period' (same length, right before) or 'previous_year'
+        start: First day of the current window
+        end: Last day of the current window
+
+    Raises:
+        ValueError: Unknown mode
+    """
+    if mode == 'previous_period':
+        baseline_end = start - timedelta(days=1)
+        return baseline_end - (end - start), baseline_end
+    if mode == 'previous_year':
+        return _year_earlier(start), _year_earlier(end)
+    raise ValueError(f"compare must be one of: {', '.join(COMPARE_MODES)}")
+
+
+def combined_windows(mode: str, start: date, end: date) -> List[Tuple[str, str]]:
+    """
+    Date windows to read for a comparison: one when the periods touch,
+    otherwise the two periods (previous_year skips the months in between)
+    """
+    baseline = baseline_window(mode, start, end)
+    if baseline[1] >= start - timedelta(days=1):
+        return [(min(baseline[0], start).isoformat(), end.isoformat())]
+    return [(baseline[0].isoformat(), baseline[1].isoformat()), (start.isoformat(), end.isoformat())]
+
+
+def _year_earlier(day: date) -> date:
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        # 29 February
+        return day.replace(year=day.year - 1, day=28)
+
+
+def row_periods(frame: MetricsFrame, current: Tuple[date, date], baseline: Tuple[date, date]) -> np.ndarray:
+    """
+    Period of every row: CURRENT, BASELINE or -1 (in neither window)
+
+    Dates are classified once per distinct date and broadcast through the
+    date codes, so the cost per row is a single lookup.
+    """
+    if not len(frame) or None in frame.dates:
+        return np.full(len(frame), -1, dtype=np.int64)
+    days = np.array([str(day)[:10] for day in frame.dates], dtype='datetime64[D]')
+
+    def within(window):
+        return (days >= np.datetime64(window[0], 'D')) & (days <= np.datetime64(window[1], 'D'))
+
+    periods = np.full(len(days), -1, dtype=np.int64)
+    periods[within(baseline)] = BASELINE
+    periods[within(current)] = CURRENT
+    return periods[frame.date]
+
+
+def period_totals(frame: MetricsFrame, periods: np.ndarray, key: str) -> Tuple[list, Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """
+    Totals per group for both periods in one reduction
+
+    Args:
+        frame: Frame of the combined window
+        periods: row_periods of the frame
+        key: 'competitor' or 'platform'
+
+    Returns:
+        Tuple of (labels, current totals, baseline totals), totals as
+        returned by MetricsFrame.group_totals
+    """
+    keep = periods >= 0
+    subset = frame if keep.all() else frame.take(keep)
+    size = len(subset.labels(key))
+    codes = getattr(subset, key).astype(np.int64) * 2 + periods[keep]
+    totals = subset.reduce(codes, size * 2)
+    current = {name: values[CURRENT::2] for name, values in totals.items()}
+    baseline = {name: values[BASELINE::2] for name, values in totals.items()}
+    return subset.labels(key), current, baseline
+
+
+def _delta(current: float, baseline: float) -> Dict[str, Any]:
+    return {
+        'current': current,
+        'baseline': baseline,
+        'change': current - baseline,
+        # No percentage against an empty baseline
+        'change_pct': (current - baseline) / baseline * 100 if baseline else None
+    }
+
+
+def compare_groups(labels: list, current: Dict[str, np.ndarray], baseline: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """Per-group current/baseline values with absolute and % changes"""
+    fields = {name: (current[name].tolist(), baseline[name].tolist()) for name in COMPARED_FIELDS + ('ctr',)}
+    result = []
+    for code, label in enumerate(labels):
+        if not current['count'][code] and not baseline['count'][code]:
+            continue
+        entry = {'label': label}
+        for name, (now, before) in fields.items():
+            entry['ad_count' if name == 'count' else name] = _delta(now[code], before[code])
+        result.append(entry)
+    return result
+
+
+def build_comparison(frame: MetricsFrame, mode: str, start: date, end: date) -> Dict[str, Any]:
+    """
+    Comparison section of an analytics response
+
+    Args:
+        frame: Metrics of the combined window (baseline start to end)
+        mode: A COMPARE_MODES value
+        start: First day of the current window
+        end: Last day of the current window
+
+    Returns:
+        Dict with both windows, overall totals and per-competitor and
+        per-platform deltas (sorted by current spend)
+    """
+    baseline = baseline_window(mode, start, end)
+    periods = row_periods(frame, (start, end), baseline)
+
+    sections = {}
+    for key in ('competitor', 'platform'):
+        labels, now, before = period_totals(frame, periods, key)
+        groups = compare_groups(labels, now, before)
+        if key == 'competitor':
+            names = {comp_id: frame.competitor_name(code) for code, comp_id in enumerate(frame.competitor_ids)}
+            for group in groups:
+                group['competitor_id'] = group.pop('label')
+                group['competitor_name'] = names.get(group['competitor_id'], 'Unknown')
+        else:
+            for group in groups:
+                group['platform'] = group.pop('label')
+        sections[key] = sorted(groups, key=lambda x: x['spend']['current'], reverse=True)
+
+    overall = {}
+    for period in (CURRENT, BASELINE):
+        mask = periods == period
+        overall[period] = {
+            'spend': float(frame.spend[mask].sum()),
+            'impressions': int(frame.impressions[mask].sum()),
+            'clicks': int(frame.clicks[mask].sum()),
+            'count': int(frame.count[mask].sum())
+        }
+        overall[period]['ctr'] = float(safe_divide(overall[period]['clicks'], overall[period]['impressions']))
+
+    return {
+        'mode': mode,
+        'current_range': {'start': start.isoformat(), 'end': end.isoformat()},
+        'baseline_range': {'start': baseline[0].isoformat(), 'end': baseline[1].isoformat()},
+        'totals': {
+            'ad_count' if name == 'count' else name: _delta(overall[CURRENT][name], overall[BASELINE][name])
+            for name in COMPARED_FIELDS + ('ctr',)
+        },
+        'by_competitor': sections['competitor'],
+        'by_platform': sections['platform']
+    }
+
+
+def parse_compare(value: Optional[str]) -> Optional[str]:
+    """
+    The compare query parameter, or None when absent
+
+    Raises:
+        ValueError: Unknown mode
+    """
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value not in COMPARE_MODES:
+        raise ValueError(f"compare must be one of: {', '.join(COMPARE_MODES)}")
+    return value
@@ -0,0 +1,386 @@
+"""
+Keyword Index - Per-user inverted index over ad creative text
+
+Every distinct creative of a user (one per competitor, platform and text in
+daily_metrics) becomes a document. Its text is tokenised once, and the index
+keeps:
+
+    postings[term]       -> ids of the creatives containing the term
+    term_counts[c][term] -> occurrences of the term in competitor c's creatives
+    doc_counts[c][term]  -> competitor c's creatives containing the term
+
+Top keywords for any set of competitors are then one np.bincount over
+their counters and an np.argpartition, with no creative text read at
+request time.
+
+Indexes follow the user's analytics data version like the prefix sums: when
+it changes, only daily_metrics rows created since the last sync are read.
+Fetch jobs also add their new rows right after ingest. A creative seen again
+on later days is skipped, so re-reading rows never double counts.
+"""
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterable, List, Optional, Sequence
+import os
+import sys
+
+import numpy as np
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.analytics.response_cache import data_versions
+from AdSurveillance.analytics.rollups import fetch_keyset_pages
+from AdSurveillance.service_metrics import metrics
+
+INDEX_FIELDS = 'id, competitor_id, platform, creative'
+
+# Words too common in ad copy to say anything about targeting
+STOP_WORDS = frozenset([
+    'the', 'and', 'for', 'with', 'this', 'that', 'your', 'you', 'are', 'get', 'free', 'now', 'best', 'new'
+])
+
+# Shortest term indexed
+MIN_TERM_LENGTH = 4
+
+PUNCTUATION = '.,!?;:"\'()[]{}'
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lower-cased alphabetic words of a creative, stop words and short words dropped"""
+    if not text:
+        return []
+    terms = []
+    for word in text.lower().split():
+        word = word.strip(PUNCTUATION)
+        if len(word) >= MIN_TERM_LENGTH and word.isalpha() and word not in STOP_WORDS:
+            terms.append(word)
+    return terms
+
+
+class KeywordIndex:
+    """Inverted index over one user's distinct creatives"""
+
+    def __init__(self):
+        self.documents: Dict[tuple, int] = {}
+        self.document_competitors: List[Any] = []
+        self.vocabulary: Dict[str, int] = {}
+        self.terms: List[str] = []
+        self.postings: List[List[int]] = []
+        self.term_counts: Dict[Any, Counter] = {}
+        self.doc_counts: Dict[Any, Counter] = {}
+        self.platform_counts: Dict[Any, Counter] = {}
+        self._arrays: Dict[Any, tuple] = {}
+        self.version: Optional[int] = None
+        self.synced_at: Optional[datetime] = None
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.document_competitors)
+
+    def _term_id(self, term: str) -> int:
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            term_id = self.vocabulary[term] = len(self.terms)
+            self.terms.append(term)
+            self.postings.append([])
+        return term_id
+
+    def add(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Index daily_metrics rows (competitor_id, platform, creative)
+
+        Returns:
+            Number of new creatives (rows repeating a known creative are skipped)
+        """
+        added = 0
+        with self.lock:
+            for row in rows:
+                creative = row.get('creative')
+                competitor_id = row.get('competitor_id')
+                platform = row.get('platform') or 'unknown'
+                if not creative:
+                    continue
+                # A digest rather than hash(): distinct texts must never share a document
+                key = (competitor_id, platform, hashlib.sha1(creative.encode('utf-8')).digest())
+                if key in self.documents:
+                    continue
+
+                document = len(self.document_competitors)
+                self.documents[key] = document
+                self.document_competitors.append(competitor_id)
+                self.platform_counts.setdefault(competitor_id, Counter())[platform] += 1
+                added += 1
+
+                terms = Counter(self._term_id(term) for term in tokenize(creative))
+                if not terms:
+                    continue
+                self.term_counts.setdefault(competitor_id, Counter()).update(terms)
+                self.doc_counts.setdefault(competitor_id, Counter()).update(terms.keys())
+                self._arrays.pop(competitor_id, None)
+                for term_id in terms:
+                    self.postings[term_id].append(document)
+        return added
+
+    def _competitor_arrays(self, competitor_id) -> tuple:
+        """(term ids, occurrences, creatives) of a competitor, rebuilt after it gains creatives"""
+        arrays = self._arrays.get(competitor_id)
+        if arrays is None:
+            term_counts = self.term_counts.get(competitor_id, Counter())
+            doc_counts = self.doc_counts.get(competitor_id, Counter())
+            term_ids = np.fromiter(term_counts.keys(), dtype=np.int64, count=len(term_counts))
+            arrays = self._arrays[competitor_id] = (
+                term_ids,
+                np.fromiter(term_counts.values(), dtype=np.int64, count=len(term_counts)),
+                np.fromiter((doc_counts[term_id] for term_id in term_ids.tolist()), dtype=np.int64, count=len(term_ids))
+            )
+        return arrays
+
+    def top_keywords(self, k: int = 20, competitor_ids: Sequence = None) -> List[Dict[str, Any]]:
+        """
+        The k most frequent terms across the given competitors' creatives
+
+        Per-competitor counts are summed with one np.bincount and the top k
+        picked with np.argpartition.
+
+        Args:
+            k: Terms returned
+            competitor_ids: Only these competitors (all by default)
+
+        Returns:
+            [{keyword, frequency (occurrences), documents (creatives containing it)}],
+            most frequent first
+        """
+        with self.lock:
+            wanted = self.term_counts if competitor_ids is None else \
+                [competitor_id for competitor_id in dict.fromkeys(competitor_ids) if competitor_id in self.term_counts]
+            arrays = [self._competitor_arrays(competitor_id) for competitor_id in wanted]
+            size = len(self.terms)
+            terms = self.terms
+        if not arrays or k <= 0:
+            return []
+
+        term_ids = np.concatenate([ids for ids, _, _ in arrays])
+        frequency = np.bincount(term_ids, weights=np.concatenate([counts for _, counts, _ in arrays]), minlength=size)
+        documents = np.bincount(term_ids, weights=np.concatenate([docs for _, _, docs in arrays]), minlength=size)
+
+        k = min(k, int(np.count_nonzero(frequency)))
+        if not k:
+            return []
+        top = np.argpartition(-frequency, k - 1)[:k] if k < size else np.arange(size)
+        top = top[np.lexsort((top, -documents[top], -frequency[top]))][:k]
+        return [
+            {'keyword': terms[term_id], 'frequency': int(frequency[term_id]), 'documents': int(documents[term_id])}
+            for term_id in top.tolist()
+        ]
+
+    def platforms(self, competitor_ids: Sequence = None) -> Dict[str, int]:
+        """Creatives per platform across the given competitors"""
+        wanted = set(competitor_ids) if competitor_ids is not None else None
+        counts = Counter()
+        with self.lock:
+            for competitor_id, platform_counts in self.platform_counts.items():
+                if wanted is None or competitor_id in wanted:
+                    counts.update(platform_counts)
+        return dict(counts)
+
+    def creative_count(self, competitor_ids: Sequence = None) -> int:
+        """Creatives indexed for the given competitors"""
+        return sum(self.platforms(competitor_ids).values())
+
+    def matching(self, term: str, competitor_ids: Sequence = None) -> List[int]:
+        """Document ids of the creatives containing a term"""
+        with self.lock:
+            term_id = self.vocabulary.get(term.lower())
+            postings = list(self.postings[term_id]) if term_id is not None else []
+        if competitor_ids is None:
+            return postings
+        wanted = set(competitor_ids)
+        return [document for document in postings if self.document_competitors[document] in wanted]
+
+
+class KeywordIndexCache:
+    """KeywordIndex per user, kept in step with the user's data version"""
+
+    def __init__(self, supabase=None, max_users: int = None):
+        """
+        Args:
+            supabase: Supabase client (created on first use when omitted)
+            max_users: Users kept (least recently used go first, 0 disables)
+        """
+        self._supabase = supabase
+        self.max_users = max_users if max_users is not None else Config.KEYWORD_INDEX_MAX_USERS
+        self._entries: 'OrderedDict[str, KeywordIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+        # One build per user at a time; held only while a build is in flight
+        self._build_locks: Dict[str, threading.Lock] = {}
+
+    @property
+    def supabase(self):
+        if self._supabase is None:
+            from supabase import create_client
+            self._supabase = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+        return self._supabase
+
+    def _competitor_ids(self, user_id: str) -> List[str]:
+        """All competitors of a user, active or not"""
+        response = self.supabase.table('competitors')\
+            .select('id')\
+            .eq('user_id', user_id)\
+            .execute()
+        return [row['id'] for row in (response.data or [])]
+
+    def _read(self, index: KeywordIndex, user_id: str, created_after: datetime = None) -> int:
+        """Index the user's daily_metrics rows (created after a time, if given)"""
+        competitor_ids = self._competitor_ids(user_id)
+        if not competitor_ids:
+            return 0
+
+        def build_query():
+            query = self.supabase.table('daily_metrics')\
+                .select(INDEX_FIELDS)\
+                .in_('competitor_id', competitor_ids)
+            if created_after:
+                query = query.gte('created_at', created_after.isoformat())
+            return query
+
+        return sum(index.add(page) for page in fetch_keyset_pages(build_query))
+
+    def get(self, user_id: str) -> Optional[KeywordIndex]:
+        """
+        The user's index, synced to their current data version
+
+        Returns:
+            KeywordIndex, or None when it can't be trusted (disabled, data
+            version unavailable)
+        """
+        if self.max_users <= 0:
+            return None
+        version = data_versions.get(user_id)
+        if version is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry:
+                self._entries.move_to_end(user_id)
+
+        if entry is None:
+            entry = self._build(user_id, version)
+        elif entry.version != version:
+            self.update_since(user_id, entry.synced_at, version)
+        else:
+            metrics.incr('keyword_index.hits')
+        return entry
+
+    def _build(self, user_id: str, version: int) -> KeywordIndex:
+        """Build a user's index, or wait for the build another request started"""
+        with self._lock:
+            build_lock = self._build_locks.setdefault(user_id, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                entry = self._entries.get(user_id)
+            if entry is not None:
+                return entry
+
+            try:
+                entry = KeywordIndex()
+                synced_at = datetime.now(timezone.utc)
+                self._read(entry, user_id)
+                entry.version, entry.synced_at = version, synced_at
+                metrics.incr('keyword_index.builds')
+                with self._lock:
+                    self._entries[user_id] = entry
+                    while len(self._entries) > self.max_users:
+                        self._entries.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._build_locks.pop(user_id, None)
+
+        print(f"🔎 Keyword index for user {user_id}: {len(entry)} creative(s), {len(entry.terms)} term(s)")
+        return entry
+
+    def update_since(self, user_id: str, since: datetime, version: int = None) -> int:
+        """
+        Add rows a fetch wrote to the user's index, if it is held
+
+        Args:
+            user_id: The user
+            since: When the fetch started (or the index was last synced)
+            version: Data version the index is current for afterwards
+
+        Returns:
+            Number of new creatives indexed
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None:
+            return 0
+
+        synced_at = datetime.now(timezone.utc)
+        added = self._read(entry, user_id, since - timedelta(seconds=Config.ROLLUP_CLOCK_SKEW_SECONDS))
+        entry.synced_at = synced_at
+        if version is not None:
+            entry.version = version
+        metrics.incr('keyword_index.updates')
+        metrics.incr('keyword_index.creatives_added', added)
+        return added
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+# Global cache
+keyword_index = KeywordIndexCache()
+
+
+if __name__ == '__main__':
+    # Top keywords from the index match a full recount, in milliseconds
+    import random
+    import time
+
+    print("🧪 Indexing 100,000 synthetic creatives...")
+    print("=" * 60)
+
+    random.seed(4)
+    vocabulary = [''.join(random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(random.randint(4, 10)))
+                  for _ in range(20000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    rows = [{
+        'competitor_id': f'comp-{random.randrange(200)}',
+        'platform': random.choice(['Meta', 'Google', 'TikTok']),
+        'creative': ' '.join(random.choices(vocabulary, weights, k=random.randint(5, 25))) + '. Shop now!'
+    } for _ in range(100_000)]
+
+    index = KeywordIndex()
+    started = time.perf_counter()
+    index.add(rows)
+    index.add(rows[:10_000])
+    build = time.perf_counter() - started
+
+    wanted = [f'comp-{i}' for i in range(100)]
+    started = time.perf_counter()
+    index.top_keywords(20)
+    cold_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    everything = index.top_keywords(20)
+    half = index.top_keywords(20, wanted)
+    query_ms = (time.perf_counter() - started) * 1000
+
+    recount = Counter(term for row in rows for term in tokenize(row['creative']))
+    assert [item['frequency'] for item in everything] == [count for _, count in recount.most_common(20)]
+    subset = Counter(term for row in rows if row['competitor_id'] in wanted for term in tokenize(row['creative']))
+    assert [item['frequency'] for item in half] == [count for _, count in subset.most_common(20)]
+    assert len(index.matching(everything[0]['keyword'])) == everything[0]['documents']
+
+    print(f"  {len(index):,} creatives, {len(index.terms):,} terms indexed in {build:.2f} s")
+    print(f"  Top 20 keywords: {cold_ms:.1f} ms after indexing, then all + 100 competitors in {query_ms:.1f} ms")
+
+    print("\n" + "=" * 60)
+    print("✅ Indexed keyword counts match a full recount")
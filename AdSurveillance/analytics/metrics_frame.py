@@ -0,0 +1,420 @@
+"""
+Metrics Frame - Columnar in-memory view of daily_metrics rows
+
+Rows are converted once into NumPy columns (spend, impressions, clicks,
+CTR) plus integer codes for competitor, platform and date. Group-bys are
+then single np.bincount reductions instead of per-row dict updates.
+
+The same frame is built from daily_metric_rollups rows (ROLLUP_COLUMNS),
+where each row carries its ad count, so every consumer works unchanged on
+either source.
+
+Competitor and platform codes follow first appearance in the rows, so
+grouped output keeps the order the previous per-row loops produced. Date
+codes follow calendar order.
+"""
+from operator import itemgetter
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+GROUP_KEYS = ('competitor', 'platform', 'date')
+
+# Row spend bands (daily spend under $100, $100-$1K, $1K and over)
+SPEND_BAND_EDGES = (100, 1000)
+
+# Frame column -> source field, for raw daily_metrics rows and for rollup rows
+ROW_COLUMNS = {
+    'spend': 'daily_spend',
+    'impressions': 'daily_impressions',
+    'clicks': 'daily_clicks',
+    'ctr': 'daily_ctr'
+}
+ROLLUP_COLUMNS = {
+    'spend': 'total_spend',
+    'impressions': 'total_impressions',
+    'clicks': 'total_clicks',
+    'ctr': 'ctr_sum',
+    'count': 'ad_count',
+    'bands': ('low_spend_count', 'medium_spend_count', 'high_spend_count')
+}
+
+
+def _field(rows: Sequence[Dict[str, Any]], field: str) -> tuple:
+    """One field of every row, in a C-level pass when every row has it"""
+    try:
+        return tuple(map(itemgetter(field), rows))
+    except KeyError:
+        return tuple(row.get(field) for row in rows)
+
+
+def _factorize(values: Sequence) -> Tuple[np.ndarray, list]:
+    """Integer codes for values, numbered in order of first appearance"""
+    labels = list(dict.fromkeys(values))
+    index = {value: code for code, value in enumerate(labels)}
+    codes = np.fromiter(map(index.__getitem__, values), dtype=np.int32, count=len(values))
+    return codes, labels
+
+
+def _numeric(values: Sequence, dtype) -> np.ndarray:
+    """Numeric column; null and non-numeric values count as 0"""
+    try:
+        column = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        column = np.array([_to_float(value) for value in values], dtype=np.float64)
+    column = np.nan_to_num(column, nan=0.0, posinf=0.0, neginf=0.0)
+    return column if dtype is np.float64 else column.astype(dtype)
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def safe_divide(numerator: np.ndarray, denominator: np.ndarray, scale: float = 1.0) -> np.ndarray:
+    """Element-wise numerator / denominator * scale, 0 where the denominator is 0"""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    result = np.zeros(np.broadcast(numerator, denominator).shape, dtype=np.float64)
+    np.divide(numerator * scale, denominator, out=result, where=denominator != 0)
+    return result
+
+
+class MetricsFrame:
+    """Columnar daily_metrics for one user (raw rows or rollups)"""
+
+    __slots__ = (
+        'spend', 'impressions', 'clicks', 'ctr', 'count', 'bands',
+        'competitor', 'platform', 'date',
+        'competitor_ids', 'competitor_names', 'platforms', 'dates'
+    )
+
+    def __init__(self, spend: np.ndarray, impressions: np.ndarray, clicks: np.ndarray, ctr: np.ndarray,
+                 count: np.ndarray, bands: np.ndarray,
+                 competitor: np.ndarray, platform: np.ndarray, date: np.ndarray,
+                 competitor_ids: list, competitor_names: list, platforms: list, dates: list):
+        self.spend = spend
+        self.impressions = impressions
+        self.clicks = clicks
+        self.ctr = ctr
+        self.count = count
+        self.bands = bands
+        self.competitor = competitor
+        self.platform = platform
+        self.date = date
+        self.competitor_ids = competitor_ids
+        self.competitor_names = competitor_names
+        self.platforms = platforms
+        self.dates = dates
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Dict[str, Any]], columns: Dict[str, Any] = None) -> 'MetricsFrame':
+        """
+        Build a frame from daily_metrics rows (any subset of columns)
+
+        Args:
+            rows: daily_metrics dictionaries as returned by Supabase
+            columns: Source fields per frame column, ROW_COLUMNS by default
+                     (ROLLUP_COLUMNS for daily_metric_rollups rows)
+
+        Returns:
+            MetricsFrame; columns absent from the rows are all zero
+        """
+        rows = rows or []
+        columns = columns or ROW_COLUMNS
+        n = len(rows)
+        present = set(rows[0]) if rows else set()
+
+        def codes_for(field, default):
+            if field in present:
+                return _factorize(_field(rows, field))
+            return np.zeros(n, dtype=np.int32), [default] if n else []
+
+        def numeric(name, dtype):
+            field = columns.get(name)
+            return _numeric(_field(rows, field), dtype) if field in present else np.zeros(n, dtype=dtype)
+
+        competitor, competitor_ids = codes_for('competitor_id', None)
+        platform, platforms = codes_for('platform', 'Unknown')
+        date, dates = codes_for('date', None)
+
+        # Competitor names come from each competitor's first row
+        competitor_names = []
+        if competitor_ids and 'competitor_name' in present:
+            first_rows = np.unique(competitor, return_index=True)[1]
+            competitor_names = [rows[i].get('competitor_name') for i in first_rows.tolist()]
+
+        # Renumber dates in calendar order (ISO dates sort as strings)
+        if dates and None not in dates:
+            order = sorted(range(len(dates)), key=dates.__getitem__)
+            rank = np.empty(len(dates), dtype=np.int32)
+            rank[order] = np.arange(len(dates), dtype=np.int32)
+            date = rank[date]
+            dates = [dates[i] for i in order]
+
+        spend = numeric('spend', np.float64)
+        count = numeric('count', np.int64) if 'count' in columns else np.ones(n, dtype=np.int64)
+
+        # Spend band counts per row: stored on rollups, derived from raw rows
+        if 'bands' in columns:
+            bands = np.stack([
+                _numeric(_field(rows, field), np.int64) if field in present else np.zeros(n, dtype=np.int64)
+                for field in columns['bands']
+            ], axis=1) if n else np.zeros((0, 3), dtype=np.int64)
+        else:
+            bands = np.zeros((n, len(SPEND_BAND_EDGES) + 1), dtype=np.int64)
+            bands[np.arange(n), np.searchsorted(SPEND_BAND_EDGES, spend, side='right')] = 1
+
+        return cls(
+            spend=spend,
+            impressions=numeric('impressions', np.int64),
+            clicks=numeric('clicks', np.int64),
+            ctr=numeric('ctr', np.float64),
+            count=count,
+            bands=bands,
+            competitor=competitor,
+            platform=platform,
+            date=date,
+            competitor_ids=competitor_ids,
+            competitor_names=competitor_names,
+            platforms=platforms,
+            dates=dates
+        )
+
+    def __len__(self) -> int:
+        return len(self.spend)
+
+    def labels(self, key: str) -> list:
+        """Group labels for a key, indexed by code"""
+        if key == 'competitor':
+            return self.competitor_ids
+        if key == 'platform':
+            return self.platforms
+        if key == 'date':
+            return self.dates
+        raise ValueError(f"Unknown group key: {key}")
+
+    def group_totals(self, key: str) -> Dict[str, np.ndarray]:
+        """
+        Per-group sums in one bincount per column
+
+        Args:
+            key: 'competitor', 'platform' or 'date'
+
+        Returns:
+            Dict of arrays indexed by group code: count, spend, impressions,
+            clicks, ctr_sum, bands (rows per spend band), plus derived ctr
+            (clicks / impressions) and avg_ctr (mean of daily_ctr)
+        """
+        if key not in GROUP_KEYS:
+            raise ValueError(f"Unknown group key: {key}")
+        return self.reduce(getattr(self, key), len(self.labels(key)))
+
+    def group_by(self, *keys: str) -> Tuple[List[tuple], Dict[str, np.ndarray]]:
+        """
+        Per-group sums over a combination of keys (only groups that have rows)
+
+        Args:
+            keys: Any of 'competitor', 'platform', 'date'
+
+        Returns:
+            Tuple of (label tuples, totals as returned by group_totals)
+        """
+        labels, inverse = self.group_index(*keys)
+        return labels, self.reduce(inverse, len(labels))
+
+    def group_index(self, *keys: str) -> Tuple[List[tuple], np.ndarray]:
+        """
+        Groups over a combination of keys and the group of every row
+
+        Args:
+            keys: Any of 'competitor', 'platform', 'date'
+
+        Returns:
+            Tuple of (label tuples in group_by order, group number per row)
+        """
+        sizes = [len(self.labels(key)) for key in keys]
+        combined = np.zeros(len(self), dtype=np.int64)
+        for key, size in zip(keys, sizes):
+            combined = combined * size + getattr(self, key)
+
+        groups, inverse = np.unique(combined, return_inverse=True)
+
+        # Decode the combined codes back into one code per key
+        codes = []
+        remaining = groups
+        for size in reversed(sizes):
+            codes.append(remaining % size)
+            remaining = remaining // size
+        codes.reverse()
+
+        label_lists = [self.labels(key) for key in keys]
+        labels = [
+            tuple(label_list[code] for label_list, code in zip(label_lists, group_codes))
+            for group_codes in zip(*(key_codes.tolist() for key_codes in codes))
+        ]
+        return labels, inverse.reshape(-1)
+
+    def reduce(self, codes: np.ndarray, size: int) -> Dict[str, np.ndarray]:
+        """Sums of every column per code (0 <= code < size)"""
+        count = np.bincount(codes, weights=self.count, minlength=size).astype(np.int64)
+        impressions = np.bincount(codes, weights=self.impressions, minlength=size).astype(np.int64)
+        clicks = np.bincount(codes, weights=self.clicks, minlength=size).astype(np.int64)
+        ctr_sum = np.bincount(codes, weights=self.ctr, minlength=size)
+        bands = np.stack([
+            np.bincount(codes, weights=self.bands[:, band], minlength=size).astype(np.int64)
+            for band in range(self.bands.shape[1])
+        ], axis=1)
+
+        return {
+            'count': count,
+            'spend': np.bincount(codes, weights=self.spend, minlength=size),
+            'impressions': impressions,
+            'clicks': clicks,
+            'ctr_sum': ctr_sum,
+            'bands': bands,
+            'ctr': safe_divide(clicks, impressions),
+            'avg_ctr': safe_divide(ctr_sum, count)
+        }
+
+    def take(self, mask: np.ndarray) -> 'MetricsFrame':
+        """
+        A frame of the rows where mask is true, with only their groups
+
+        Args:
+            mask: Boolean array, one entry per row
+        """
+        def compact(codes, labels):
+            kept, remapped = np.unique(codes[mask], return_inverse=True)
+            return remapped.reshape(-1).astype(np.int32), [labels[code] for code in kept.tolist()], kept
+
+        competitor, competitor_ids, kept_competitors = compact(self.competitor, self.competitor_ids)
+        platform, platforms, _ = compact(self.platform, self.platforms)
+        date, dates, _ = compact(self.date, self.dates)
+        competitor_names = [self.competitor_names[code] for code in kept_competitors.tolist()] \
+            if self.competitor_names else []
+
+        return MetricsFrame(
+            spend=self.spend[mask],
+            impressions=self.impressions[mask],
+            clicks=self.clicks[mask],
+            ctr=self.ctr[mask],
+            count=self.count[mask],
+            bands=self.bands[mask],
+            competitor=competitor,
+            platform=platform,
+            date=date,
+            competitor_ids=competitor_ids,
+            competitor_names=competitor_names,
+            platforms=platforms,
+            dates=dates
+        )
+
+    def for_competitors(self, competitor_ids) -> 'MetricsFrame':
+        """A frame of only the given competitors' rows"""
+        wanted = set(competitor_ids)
+        keep = np.array([comp_id in wanted for comp_id in self.competitor_ids], dtype=bool)
+        if keep.all():
+            return self
+        return self.take(keep[self.competitor] if len(keep) else np.zeros(len(self), dtype=bool))
+
+    def competitor_name(self, code: int, default: Optional[str] = 'Unknown') -> Optional[str]:
+        """Name recorded on a competitor's first row"""
+        if code < len(self.competitor_names):
+            name = self.competitor_names[code]
+            if name is not None:
+                return name
+        return default
+
+
+def top_indices(values: np.ndarray, limit: int = None) -> List[int]:
+    """Indices of values in descending order (ties keep group order), optionally limited"""
+    order = np.argsort(-np.asarray(values), kind='stable')
+    if limit is not None:
+        order = order[:max(limit, 0)]
+    return order.tolist()
+
+
+if __name__ == '__main__':
+    # Benchmark against the per-row loops the analytics endpoints used before
+    import random
+    import time
+    import uuid
+    from datetime import date as date_cls, timedelta
+
+    ROWS = 1_000_000
+    print(f"🧪 Benchmarking analytics group-bys on {ROWS:,} synthetic daily_metrics rows...")
+    print("=" * 60)
+
+    random.seed(7)
+    competitors = [(str(uuid.uuid4()), f"Competitor {i}") for i in range(40)]
+    platform_names = ['Meta', 'Google', 'TikTok', 'LinkedIn']
+    start = date_cls.today() - timedelta(days=365)
+    day_labels = [(start + timedelta(days=i)).isoformat() for i in range(366)]
+
+    rows = []
+    for _ in range(ROWS):
+        comp_id, comp_name = random.choice(competitors)
+        impressions = random.randint(100, 50000)
+        clicks = random.randint(0, impressions // 20)
+        rows.append({
+            'competitor_id': comp_id,
+            'competitor_name': comp_name,
+            'platform': random.choice(platform_names),
+            'date': random.choice(day_labels),
+            'daily_spend': round(random.uniform(1, 2000), 2),
+            'daily_impressions': impressions,
+            'daily_clicks': clicks,
+            'daily_ctr': round(clicks / impressions, 4)
+        })
+
+    def legacy_group(rows, key):
+        groups = {}
+        for metric in rows:
+            group = metric[key]
+            if group not in groups:
+                groups[group] = {'total_spend': 0, 'total_impressions': 0, 'total_clicks': 0, 'count': 0, 'ctr_sum': 0}
+            groups[group]['total_spend'] += float(metric.get('daily_spend', 0))
+            groups[group]['total_impressions'] += int(metric.get('daily_impressions', 0))
+            groups[group]['total_clicks'] += int(metric.get('daily_clicks', 0))
+            groups[group]['ctr_sum'] += float(metric.get('daily_ctr', 0))
+            groups[group]['count'] += 1
+        return groups
+
+    def legacy_all(rows):
+        # One pass per endpoint, as calculate_user_analytics + the three endpoints did
+        return [legacy_group(rows, key) for key in ('competitor_id', 'platform', 'competitor_id', 'platform', 'date')]
+
+    def frame_all(rows):
+        frame = MetricsFrame.from_rows(rows)
+        return frame, [frame.group_totals(key) for key in ('competitor', 'platform', 'competitor', 'platform', 'date')]
+
+    timings = {}
+    for label, run in (('legacy loops', legacy_all), ('MetricsFrame', frame_all)):
+        started = time.perf_counter()
+        result = run(rows)
+        timings[label] = time.perf_counter() - started
+        print(f"  {label:<16} {timings[label] * 1000:9.1f} ms")
+
+    frame, (by_comp, by_platform, _, _, by_date) = result
+    build_started = time.perf_counter()
+    MetricsFrame.from_rows(rows)
+    build = time.perf_counter() - build_started
+    reduce_started = time.perf_counter()
+    for key in GROUP_KEYS:
+        frame.group_totals(key)
+    reduce = time.perf_counter() - reduce_started
+    print(f"    (frame build {build * 1000:.1f} ms, three group-bys {reduce * 1000:.1f} ms)")
+
+    # Same totals as the loops
+    legacy = legacy_group(rows, 'platform')
+    for code, platform in enumerate(frame.platforms):
+        assert legacy[platform]['count'] == by_platform['count'][code]
+        assert legacy[platform]['total_clicks'] == by_platform['clicks'][code]
+        assert abs(legacy[platform]['total_spend'] - by_platform['spend'][code]) < 1e-3
+    assert frame.dates == sorted(frame.dates) and int(by_date['count'].sum()) == ROWS
+
+    print("\n" + "=" * 60)
+    print(f"✅ Speedup: {timings['legacy loops'] / timings['MetricsFrame']:.1f}x")
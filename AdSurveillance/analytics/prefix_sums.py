@@ -0,0 +1,374 @@
+"""
+Prefix Sums - Per-user cumulative daily totals for O(1) window queries
+
+For every (competitor, platform) of a user, the daily rollup totals of the
+last PREFIX_SUM_DAYS days are kept in memory together with their running
+sums, one slot per calendar day:
+
+    cumulative[s, d] = sum of daily[s, 0:d]
+
+The total of any window [a, b] is then cumulative[:, b + 1] - cumulative[:, a],
+two lookups per series whatever the window length. Per-day series come from
+the all-series running sum in the same way.
+
+Entries follow the user's analytics data version. When it changes (a fetch
+job ingested metrics, a competitor changed), only the rollup rows updated
+since the entry was last synced are read back; they overwrite their days and
+the running sums are recomputed from the earliest day they touched.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Sequence
+import os
+import sys
+
+import numpy as np
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.analytics.metrics_frame import MetricsFrame, ROLLUP_COLUMNS
+from AdSurveillance.analytics.response_cache import data_versions
+from AdSurveillance.analytics.rollups import ROLLUP_FIELDS, ROLLUP_TABLE, fetch_all
+from AdSurveillance.analytics.trends import SERIES_FIELDS
+from AdSurveillance.service_metrics import metrics
+
+# Summed fields, in the last axis of the arrays (ctr holds CTR sums, as on rollups)
+PREFIX_FIELDS = ('spend', 'impressions', 'clicks', 'ctr', 'count', 'low', 'medium', 'high')
+FIELD_INDEX = {field: i for i, field in enumerate(PREFIX_FIELDS)}
+BAND_FIELDS = PREFIX_FIELDS[5:]
+
+
+class PrefixSums:
+    """Daily totals and their running sums per (competitor, platform) of one user"""
+
+    def __init__(self, start: date, length: int):
+        """
+        Args:
+            start: Day of slot 0
+            length: Number of days held
+        """
+        self.start = start
+        self.length = length
+        self.keys: List[tuple] = []
+        self.rows: Dict[tuple, int] = {}
+        self.competitor_names: Dict[Any, Any] = {}
+        self.daily = np.zeros((0, length, len(PREFIX_FIELDS)), dtype=np.float64)
+        self.cumulative = np.zeros((0, length + 1, len(PREFIX_FIELDS)), dtype=np.float64)
+        self.total = np.zeros((length + 1, len(PREFIX_FIELDS)), dtype=np.float64)
+        self.version: Optional[int] = None
+        self.synced_at: Optional[datetime] = None
+        self.lock = threading.Lock()
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=self.length - 1)
+
+    def _extend(self, end: date) -> None:
+        """Grow the span up to end; new days are empty"""
+        extra = (end - self.end).days
+        if extra <= 0:
+            return
+        self.daily = np.concatenate([self.daily, np.zeros((len(self.keys), extra, len(PREFIX_FIELDS)))], axis=1)
+        carried = np.repeat(self.cumulative[:, -1:], extra, axis=1)
+        self.cumulative = np.concatenate([self.cumulative, carried], axis=1)
+        self.total = np.concatenate([self.total, np.repeat(self.total[-1:], extra, axis=0)])
+        self.length += extra
+
+    def _add_series(self, keys: Sequence[tuple]) -> None:
+        new = [key for key in dict.fromkeys(keys) if key not in self.rows]
+        if not new:
+            return
+        for key in new:
+            self.rows[key] = len(self.keys)
+            self.keys.append(key)
+        self.daily = np.concatenate([self.daily, np.zeros((len(new), self.length, len(PREFIX_FIELDS)))])
+        self.cumulative = np.concatenate([self.cumulative, np.zeros((len(new), self.length + 1, len(PREFIX_FIELDS)))])
+
+    def apply(self, frame: MetricsFrame, end: date = None) -> int:
+        """
+        Write rollup rows (whole-day totals per series) into their days
+
+        Args:
+            frame: Frame of daily_metric_rollups rows
+            end: Extend the span at least up to this day
+
+        Returns:
+            Number of rows written (rows before the span are skipped)
+        """
+        with self.lock:
+            if end:
+                self._extend(end)
+            if not len(frame) or None in frame.dates:
+                return 0
+
+            days = np.array([str(day)[:10] for day in frame.dates], dtype='datetime64[D]')
+            last_day = days.max().astype(date)
+            self._extend(last_day)
+            offsets = (days - np.datetime64(self.start, 'D')).astype(np.int64)[frame.date]
+            keep = offsets >= 0
+            if not keep.any():
+                return 0
+
+            keys = [
+                (frame.competitor_ids[competitor], frame.platforms[platform])
+                for competitor, platform in zip(frame.competitor[keep].tolist(), frame.platform[keep].tolist())
+            ]
+            self._add_series(keys)
+            for code, competitor_id in enumerate(frame.competitor_ids):
+                name = frame.competitor_name(code, None)
+                if name is not None:
+                    self.competitor_names[competitor_id] = name
+
+            rows = np.fromiter((self.rows[key] for key in keys), dtype=np.int64, count=len(keys))
+            values = np.column_stack([
+                frame.spend[keep], frame.impressions[keep], frame.clicks[keep], frame.ctr[keep],
+                frame.count[keep], frame.bands[keep]
+            ])
+            self.daily[rows, offsets[keep]] = values
+
+            # Running sums only change from the earliest day written onwards
+            first = int(offsets[keep].min())
+            self.cumulative[:, first + 1:] = self.cumulative[:, first:first + 1] \
+                + np.cumsum(self.daily[:, first:], axis=1)
+            self.total[first + 1:] = self.cumulative[:, first + 1:].sum(axis=0)
+            return int(keep.sum())
+
+    def covers(self, start: date) -> bool:
+        """Whether windows starting on start can be answered"""
+        return start >= self.start
+
+    def _bounds(self, start: date, end: date):
+        first = (start - self.start).days
+        last = min((end - self.start).days, self.length - 1)
+        return first, last
+
+    def window_frame(self, start: date, end: date, competitor_ids: Sequence = None) -> MetricsFrame:
+        """
+        Per-(competitor, platform) totals of [start, end] in O(series)
+
+        Args:
+            start: First day (on or after self.start)
+            end: Last day (days past the span are empty)
+            competitor_ids: Only these competitors (all by default)
+
+        Returns:
+            Compact MetricsFrame without dates, one row per series with ads in
+            the window, like streaming.CompetitorPlatformTotals.frame()
+        """
+        with self.lock:
+            first, last = self._bounds(start, end)
+            totals = self.cumulative[:, last + 1] - self.cumulative[:, first] if last >= first \
+                else np.zeros((len(self.keys), len(PREFIX_FIELDS)))
+            keys = list(self.keys)
+
+        wanted = set(competitor_ids) if competitor_ids is not None else None
+        keep = (np.rint(totals[:, FIELD_INDEX['count']]) > 0) & np.array(
+            [wanted is None or key[0] in wanted for key in keys], dtype=bool
+        )
+        rows = np.flatnonzero(keep)
+
+        competitor_ids = list(dict.fromkeys(keys[row][0] for row in rows.tolist()))
+        platforms = list(dict.fromkeys(keys[row][1] for row in rows.tolist()))
+        competitor_codes = {competitor_id: code for code, competitor_id in enumerate(competitor_ids)}
+        platform_codes = {platform: code for code, platform in enumerate(platforms)}
+
+        def column(field, dtype):
+            values = totals[rows, FIELD_INDEX[field]]
+            return np.rint(values).astype(dtype) if dtype is np.int64 else values
+
+        return MetricsFrame(
+            spend=column('spend', np.float64),
+            impressions=column('impressions', np.int64),
+            clicks=column('clicks', np.int64),
+            ctr=column('ctr', np.float64),
+            count=column('count', np.int64),
+            bands=np.stack([column(field, np.int64) for field in BAND_FIELDS], axis=1),
+            competitor=np.array([competitor_codes[keys[row][0]] for row in rows.tolist()], dtype=np.int32),
+            platform=np.array([platform_codes[keys[row][1]] for row in rows.tolist()], dtype=np.int32),
+            date=np.zeros(len(rows), dtype=np.int32),
+            competitor_ids=competitor_ids,
+            competitor_names=[self.competitor_names.get(competitor_id) for competitor_id in competitor_ids],
+            platforms=platforms,
+            dates=[None]
+        )
+
+    def daily_series(self, start: date, end: date, competitor_ids: Sequence = None) -> Dict[str, np.ndarray]:
+        """
+        Dense per-day totals for [start, end], as trends.daily_series returns
+
+        Differences of the all-series running sum when every competitor is
+        wanted, otherwise of the wanted series' running sums.
+        """
+        length = max((end - start).days + 1, 0)
+        series = {field: np.zeros(length, dtype=np.float64 if field == 'spend' else np.int64) for field in SERIES_FIELDS}
+
+        with self.lock:
+            first, last = self._bounds(start, end)
+            if last < first:
+                return series
+            wanted = set(competitor_ids) if competitor_ids is not None else None
+            if wanted is None or all(key[0] in wanted for key in self.keys):
+                running = self.total[first:last + 2]
+            else:
+                rows = [row for row, key in enumerate(self.keys) if key[0] in wanted]
+                running = self.cumulative[rows, first:last + 2].sum(axis=0)
+
+        days = np.diff(running, axis=0)
+        for field in SERIES_FIELDS:
+            values = days[:, FIELD_INDEX[field]]
+            series[field][:len(values)] = values if field == 'spend' else np.rint(values)
+        return series
+
+
+class PrefixSumCache:
+    """PrefixSums per user, kept in step with the user's data version"""
+
+    def __init__(self, supabase=None, days: int = None, max_users: int = None):
+        """
+        Args:
+            supabase: Supabase client (created on first use when omitted)
+            days: Days of history held per user
+            max_users: Users kept (least recently used go first)
+        """
+        self._supabase = supabase
+        self.days = days if days is not None else Config.PREFIX_SUM_DAYS
+        self.max_users = max_users or Config.PREFIX_SUM_MAX_USERS
+        self._entries: 'OrderedDict[str, PrefixSums]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def supabase(self):
+        if self._supabase is None:
+            from supabase import create_client
+            self._supabase = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+        return self._supabase
+
+    def _read_rollups(self, user_id: str, start: date, updated_after: datetime = None) -> MetricsFrame:
+        def build_query():
+            query = self.supabase.table(ROLLUP_TABLE)\
+                .select(ROLLUP_FIELDS)\
+                .eq('user_id', user_id)\
+                .gte('date', start.isoformat())
+            if updated_after:
+                query = query.gte('updated_at', updated_after.isoformat())
+            return query.order('date').order('competitor_id').order('platform')
+        return MetricsFrame.from_rows(fetch_all(build_query), ROLLUP_COLUMNS)
+
+    def get(self, user_id: str) -> Optional[PrefixSums]:
+        """
+        The user's prefix sums, synced to their current data version
+
+        Returns:
+            PrefixSums, or None when they can't be trusted (rollups disabled,
+            cache disabled, data version unavailable)
+        """
+        if not Config.ANALYTICS_USE_ROLLUPS or self.days <= 0:
+            return None
+        version = data_versions.get(user_id)
+        if version is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry:
+                self._entries.move_to_end(user_id)
+
+        today = datetime.now(timezone.utc).date()
+        if entry is None:
+            synced_at = datetime.now(timezone.utc)
+            entry = PrefixSums(today - timedelta(days=self.days), self.days + 1)
+            written = entry.apply(self._read_rollups(user_id, entry.start), today)
+            entry.version, entry.synced_at = version, synced_at
+            metrics.incr('prefix_sums.builds')
+            with self._lock:
+                self._entries[user_id] = entry
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+            print(f"📈 Prefix sums for user {user_id}: {len(entry.keys)} series, {written} rollup row(s)")
+        elif entry.version != version or entry.end < today:
+            # Rollups rewritten since the last sync, with the rollup clock-skew margin
+            synced_at = datetime.now(timezone.utc)
+            updated_after = entry.synced_at - timedelta(seconds=Config.ROLLUP_CLOCK_SKEW_SECONDS)
+            entry.apply(self._read_rollups(user_id, entry.start, updated_after), today)
+            entry.version, entry.synced_at = version, synced_at
+            metrics.incr('prefix_sums.updates')
+        else:
+            metrics.incr('prefix_sums.hits')
+        return entry
+
+    def window_frame(self, user_id: str, competitor_ids: Sequence, start: date, end: date) -> Optional[MetricsFrame]:
+        """Window totals for a user, or None to fall back to a rollup scan"""
+        entry = self.get(user_id)
+        if entry is None or not entry.covers(start):
+            return None
+        return entry.window_frame(start, end, competitor_ids)
+
+    def daily_series(self, user_id: str, competitor_ids: Sequence, start: date, end: date) -> Optional[Dict[str, np.ndarray]]:
+        """Dense daily series for a user, or None to fall back to a rollup scan"""
+        entry = self.get(user_id)
+        if entry is None or not entry.covers(start):
+            return None
+        return entry.daily_series(start, end, competitor_ids)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+# Global cache
+prefix_sums = PrefixSumCache()
+
+
+if __name__ == '__main__':
+    # Window totals by prefix subtraction match direct sums, at any window length
+    import random
+    import time
+
+    print("🧪 Prefix sums over 400 days x 200 synthetic series...")
+    print("=" * 60)
+
+    random.seed(7)
+    today = date(2026, 10, 18)
+    start = today - timedelta(days=399)
+    rows = [{
+        'competitor_id': f'comp-{c}',
+        'competitor_name': f'Competitor {c}',
+        'platform': platform,
+        'date': (start + timedelta(days=d)).isoformat(),
+        'total_spend': random.uniform(0, 5000),
+        'total_impressions': random.randint(0, 100000),
+        'total_clicks': random.randint(0, 1000),
+        'ctr_sum': random.random(),
+        'ad_count': random.randint(1, 20)
+    } for c in range(50) for platform in ('Meta', 'Google', 'TikTok', 'LinkedIn') for d in range(400)
+        if random.random() < 0.8]
+
+    sums = PrefixSums(start, 400)
+    sums.apply(MetricsFrame.from_rows(rows, ROLLUP_COLUMNS))
+    full = MetricsFrame.from_rows(rows, ROLLUP_COLUMNS)
+
+    for days in (7, 30, 90, 365):
+        window_start = today - timedelta(days=days - 1)
+        started = time.perf_counter()
+        frame = sums.window_frame(window_start, today)
+        elapsed = (time.perf_counter() - started) * 1000
+
+        in_window = np.array([str(day) >= window_start.isoformat() for day in full.dates])[full.date]
+        expected = full.take(in_window).group_totals('platform')
+        actual = frame.group_totals('platform')
+        assert frame.platforms == full.take(in_window).platforms
+        assert np.allclose(expected['spend'], actual['spend'])
+        assert (expected['count'] == actual['count']).all()
+        print(f"  {days:>3}-day window: {elapsed:.2f} ms")
+
+    # An incremental write (a re-rolled-up day) only moves the sums after it
+    changed = dict(rows[-1], total_spend=rows[-1]['total_spend'] + 1000)
+    before = float(sums.window_frame(start, today).spend.sum())
+    sums.apply(MetricsFrame.from_rows([changed], ROLLUP_COLUMNS))
+    assert np.isclose(float(sums.window_frame(start, today).spend.sum()), before + 1000)
+
+    print("\n" + "=" * 60)
+    print("✅ Window totals match direct sums")
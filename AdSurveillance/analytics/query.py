@@ -0,0 +1,435 @@
+"""
+Query - Grouped measures over any mix of dimensions, from the cheapest source
+
+A query names dimensions (competitor, platform, industry and at most one date
+bucket: day, week or month), measures, filters on competitor, platform and
+industry, a date window, a sort and a limit. It is answered in three steps:
+
+1. Plan: pick the cheapest source that can answer it
+   - prefix_sums: window totals without a date dimension, or a date-only
+     series without a platform filter, straight from the in-memory running
+     sums (no database read)
+   - rollups: daily_metric_rollups for the window, streamed down to
+     (competitor, platform) totals when no date dimension is asked for
+   - raw: daily_metrics rows, when rollups are disabled
+2. Group: each dimension becomes an integer code per row, the codes are
+   combined and every group's sums are one np.bincount per column
+   (MetricsFrame.reduce)
+3. Sort and limit with one np.lexsort over the groups
+
+PRESETS hold the dimensions, measures, sort and limit of the fixed analytics
+endpoints, so the same figures are available as presets and can be re-cut.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+import os
+import sys
+
+import numpy as np
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.analytics.metrics_frame import MetricsFrame, safe_divide
+from AdSurveillance.analytics.prefix_sums import prefix_sums
+from AdSurveillance.analytics.rollups import load_metrics_frame, stream_metrics_frame
+from AdSurveillance.service_metrics import metrics
+
+DATE_DIMENSIONS = ('day', 'week', 'month')
+DIMENSIONS = ('competitor', 'platform', 'industry') + DATE_DIMENSIONS
+
+# Dimensions that can be filtered on (query param = dimension name)
+FILTERS = ('competitor', 'platform', 'industry')
+
+# Measure -> value per group, from MetricsFrame.reduce totals
+MEASURES = {
+    'spend': lambda totals: totals['spend'],
+    'impressions': lambda totals: totals['impressions'],
+    'clicks': lambda totals: totals['clicks'],
+    'ad_count': lambda totals: totals['count'],
+    'ctr': lambda totals: totals['ctr'],
+    'cpm': lambda totals: safe_divide(totals['spend'], totals['impressions'], 1000),
+    'cpc': lambda totals: safe_divide(totals['spend'], totals['clicks']),
+    'avg_spend': lambda totals: safe_divide(totals['spend'], totals['count'])
+}
+INTEGER_MEASURES = ('impressions', 'clicks', 'ad_count')
+DEFAULT_MEASURES = ('spend', 'impressions', 'clicks', 'ctr', 'cpm', 'ad_count')
+
+# Defaults of the fixed endpoints' figures; explicit params override them
+PRESETS = {
+    'competitor-spend': {
+        'dimensions': ['competitor'],
+        'measures': ['spend', 'ad_count', 'ctr'],
+        'sort': '-spend',
+        'limit': 10
+    },
+    'platform-performance': {
+        'dimensions': ['platform'],
+        'measures': ['spend', 'impressions', 'ctr', 'cpm', 'avg_spend', 'ad_count'],
+        'sort': '-spend'
+    },
+    'trends': {
+        'dimensions': ['day'],
+        'measures': ['spend', 'impressions', 'clicks', 'ad_count']
+    },
+    'industry-spend': {
+        'dimensions': ['industry'],
+        'measures': ['spend', 'ad_count', 'ctr', 'cpm'],
+        'sort': '-spend'
+    }
+}
+
+
+class QuerySpec:
+    """A parsed /analytics/query request"""
+
+    def __init__(self, dimensions: Sequence[str], measures: Sequence[str], filters: Dict[str, set],
+                 start: date, end: date, sort: Sequence[Tuple[str, bool]], limit: int, preset: str = None):
+        self.dimensions = list(dimensions)
+        self.measures = list(measures)
+        self.filters = filters
+        self.start = start
+        self.end = end
+        self.sort = list(sort)
+        self.limit = limit
+        self.preset = preset
+
+    @property
+    def date_dimension(self) -> Optional[str]:
+        return next((dimension for dimension in self.dimensions if dimension in DATE_DIMENSIONS), None)
+
+    def describe(self) -> Dict[str, Any]:
+        """The query as answered, defaults filled in"""
+        return {
+            'preset': self.preset,
+            'dimensions': self.dimensions,
+            'measures': self.measures,
+            'filters': {name: sorted(values) for name, values in self.filters.items()},
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'sort': [('-' if descending else '') + field for field, descending in self.sort],
+            'limit': self.limit
+        }
+
+
+def _names(value: Optional[str]) -> List[str]:
+    return [name.strip() for name in value.split(',') if name.strip()] if value else []
+
+
+def _parse_date(value: str, name: str) -> date:
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"'{name}' must be a YYYY-MM-DD date")
+
+
+def parse_query(args) -> QuerySpec:
+    """
+    A QuerySpec from request query params
+
+    Params:
+        preset: One of PRESETS, whose settings apply unless overridden
+        dimensions: Comma-separated DIMENSIONS (at most one date bucket)
+        measures: Comma-separated MEASURES (default DEFAULT_MEASURES)
+        competitor, platform, industry: Comma-separated values to keep
+        start, end: YYYY-MM-DD window, or days: window ending today (default 30)
+        sort: Comma-separated dimensions or measures, '-' for descending
+              (default: the date bucket ascending, else the first measure descending)
+        limit: Groups returned (default QUERY_DEFAULT_LIMIT, at most QUERY_MAX_LIMIT)
+
+    Raises:
+        ValueError: Unknown names or malformed values
+    """
+    preset = args.get('preset')
+    if preset and preset not in PRESETS:
+        raise ValueError(f"Unknown preset: {preset}. Valid presets: {', '.join(PRESETS)}")
+    defaults = PRESETS.get(preset, {})
+
+    dimensions = list(dict.fromkeys(_names(args.get('dimensions')) or defaults.get('dimensions', [])))
+    unknown = [name for name in dimensions if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimensions: {', '.join(unknown)}. Valid dimensions: {', '.join(DIMENSIONS)}")
+    if sum(name in DATE_DIMENSIONS for name in dimensions) > 1:
+        raise ValueError(f"At most one of {', '.join(DATE_DIMENSIONS)} can be a dimension")
+
+    measures = list(dict.fromkeys(_names(args.get('measures')) or defaults.get('measures', DEFAULT_MEASURES)))
+    unknown = [name for name in measures if name not in MEASURES]
+    if unknown:
+        raise ValueError(f"Unknown measures: {', '.join(unknown)}. Valid measures: {', '.join(MEASURES)}")
+
+    filters = {name: set(_names(args.get(name))) for name in FILTERS if _names(args.get(name))}
+
+    today = datetime.now().date()
+    if args.get('start') or args.get('end'):
+        end = _parse_date(args['end'], 'end') if args.get('end') else today
+        start = _parse_date(args['start'], 'start') if args.get('start') else end - timedelta(days=30)
+    else:
+        try:
+            days = int(args.get('days', 30))
+        except ValueError:
+            raise ValueError("'days' must be an integer")
+        if days < 0:
+            raise ValueError("'days' must not be negative")
+        end, start = today, today - timedelta(days=days)
+    if start > end:
+        raise ValueError("'start' must not be after 'end'")
+
+    sort = []
+    for name in _names(args.get('sort') or defaults.get('sort')):
+        field = name.lstrip('-')
+        if field not in dimensions and field not in measures:
+            raise ValueError(f"Can only sort by a requested dimension or measure, not '{field}'")
+        sort.append((field, name.startswith('-')))
+    if not sort:
+        date_dimension = next((name for name in dimensions if name in DATE_DIMENSIONS), None)
+        sort = [(date_dimension, False)] if date_dimension else [(measures[0], True)]
+
+    try:
+        limit = int(args.get('limit') or defaults.get('limit') or Config.QUERY_DEFAULT_LIMIT)
+    except ValueError:
+        raise ValueError("'limit' must be an integer")
+    if limit < 1:
+        raise ValueError("'limit' must be positive")
+
+    return QuerySpec(dimensions, measures, filters, start, end, sort,
+                     min(limit, Config.QUERY_MAX_LIMIT), preset)
+
+
+def series_frame(series: Dict[str, np.ndarray], start: date) -> MetricsFrame:
+    """One frame row per day with ads, from a dense daily series"""
+    days = np.flatnonzero(series['count'] > 0)
+    n = len(days)
+    return MetricsFrame(
+        spend=series['spend'][days],
+        impressions=series['impressions'][days],
+        clicks=series['clicks'][days],
+        ctr=np.zeros(n),
+        count=series['count'][days],
+        bands=np.zeros((n, 3), dtype=np.int64),
+        competitor=np.zeros(n, dtype=np.int32),
+        platform=np.zeros(n, dtype=np.int32),
+        date=np.arange(n, dtype=np.int32),
+        competitor_ids=[None] if n else [],
+        competitor_names=[],
+        platforms=['All'] if n else [],
+        dates=[(start + timedelta(days=int(day))).isoformat() for day in days.tolist()]
+    )
+
+
+def load_query_frame(supabase, user_id: str, competitor_ids: List[str], spec: QuerySpec) -> Tuple[MetricsFrame, str]:
+    """
+    The metrics a query groups, from the cheapest source that can answer it
+
+    Returns:
+        Tuple of (frame, source: 'prefix_sums', 'rollups' or 'raw')
+    """
+    date_dimension = spec.date_dimension
+    if Config.ANALYTICS_USE_ROLLUPS:
+        if date_dimension is None:
+            frame = prefix_sums.window_frame(user_id, competitor_ids, spec.start, spec.end)
+            if frame is not None:
+                return frame, 'prefix_sums'
+        elif spec.dimensions == [date_dimension] and 'platform' not in spec.filters:
+            series = prefix_sums.daily_series(user_id, competitor_ids, spec.start, spec.end)
+            if series is not None:
+                return series_frame(series, spec.start), 'prefix_sums'
+
+    source = 'rollups' if Config.ANALYTICS_USE_ROLLUPS else 'raw'
+    load = load_metrics_frame if date_dimension else stream_metrics_frame
+    frame = load(
+        supabase, user_id, competitor_ids,
+        start_date=spec.start.isoformat(), end_date=spec.end.isoformat()
+    )
+    return frame, source
+
+
+def dimension_codes(frame: MetricsFrame, dimension: str, industries: Dict[Any, str]) -> Tuple[np.ndarray, list]:
+    """
+    Code of every frame row for a dimension and the label of every code
+
+    Args:
+        industries: Industry per competitor id
+    """
+    if dimension == 'competitor':
+        return frame.competitor, frame.competitor_ids
+    if dimension == 'platform':
+        return frame.platform, frame.platforms
+    if dimension == 'industry':
+        labels, codes = np.unique(
+            np.array([industries.get(comp_id) or 'Unknown' for comp_id in frame.competitor_ids], dtype=object).astype(str),
+            return_inverse=True
+        )
+        return codes.reshape(-1)[frame.competitor] if len(frame) else np.zeros(0, dtype=np.int64), labels.tolist()
+
+    days = np.array([str(day)[:10] for day in frame.dates], dtype='datetime64[D]')
+    if dimension == 'week':
+        ordinals = days.astype(np.int64)
+        # 1970-01-01 was a Thursday; weeks start on Monday
+        days = (ordinals - (ordinals + 3) % 7).astype('datetime64[D]')
+    elif dimension == 'month':
+        days = days.astype('datetime64[M]').astype('datetime64[D]')
+    buckets, codes = np.unique(days, return_inverse=True)
+    return codes.reshape(-1)[frame.date], [str(bucket) for bucket in buckets]
+
+
+def aggregate(frame: MetricsFrame, spec: QuerySpec, competitors: Dict[Any, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Group a frame by the query's dimensions, then sort and limit the groups
+
+    Args:
+        frame: Metrics already restricted to the wanted competitors
+        spec: The query
+        competitors: Competitor rows (name, industry) by id
+
+    Returns:
+        Dict with rows (one dict per group), total_groups and truncated
+    """
+    if 'platform' in spec.filters and len(frame):
+        wanted = np.array([platform in spec.filters['platform'] for platform in frame.platforms], dtype=bool)
+        frame = frame.take(wanted[frame.platform])
+
+    industries = {comp_id: comp.get('industry') for comp_id, comp in competitors.items()}
+    dimension_labels = []
+    combined = np.zeros(len(frame), dtype=np.int64)
+    sizes = []
+    for dimension in spec.dimensions:
+        codes, labels = dimension_codes(frame, dimension, industries)
+        combined = combined * max(len(labels), 1) + codes
+        sizes.append(max(len(labels), 1))
+        dimension_labels.append(labels)
+
+    groups, inverse = np.unique(combined, return_inverse=True)
+    totals = frame.reduce(inverse.reshape(-1), len(groups))
+
+    # Decode the combined codes back into one code per dimension
+    group_codes = []
+    remaining = groups
+    for size in reversed(sizes):
+        group_codes.append(remaining % size)
+        remaining = remaining // size
+    group_codes.reverse()
+    columns = {dimension: codes for dimension, codes in zip(spec.dimensions, group_codes)}
+    values = {measure: MEASURES[measure](totals) for measure in spec.measures}
+
+    # np.lexsort sorts by its last key first
+    sort_keys = []
+    for field, descending in reversed(spec.sort):
+        if field in values:
+            key = np.asarray(values[field], dtype=np.float64)
+        else:
+            labels = np.array(dimension_labels[spec.dimensions.index(field)], dtype=object).astype(str)
+            key = np.unique(labels, return_inverse=True)[1].reshape(-1)[columns[field]].astype(np.float64) \
+                if len(labels) else np.zeros(len(groups))
+        sort_keys.append(-key if descending else key)
+    order = np.lexsort(sort_keys) if sort_keys else np.arange(len(groups))
+    order = order[:spec.limit]
+
+    rows = []
+    for group in order.tolist():
+        row = {}
+        for dimension, labels in zip(spec.dimensions, dimension_labels):
+            label = labels[int(columns[dimension][group])]
+            if dimension == 'competitor':
+                row['competitor_id'] = label
+                row['competitor_name'] = (competitors.get(label) or {}).get('name') \
+                    or frame.competitor_name(int(columns[dimension][group]))
+            else:
+                row[dimension] = label
+        for measure in spec.measures:
+            value = values[measure][group]
+            row[measure] = int(value) if measure in INTEGER_MEASURES else float(value)
+        rows.append(row)
+
+    return {
+        'rows': rows,
+        'total_groups': len(groups),
+        'truncated': len(groups) > len(rows)
+    }
+
+
+def run_query(supabase, user_id: str, competitors: Sequence[Dict[str, Any]], spec: QuerySpec) -> Dict[str, Any]:
+    """
+    Answer a query over a user's competitors
+
+    Args:
+        supabase: Supabase client
+        user_id: The user
+        competitors: The user's competitor rows (id, name, industry)
+        spec: The query
+
+    Returns:
+        Dict with data (rows), total_groups, truncated, query (as answered)
+        and plan (source, rows_scanned)
+    """
+    by_id = {comp['id']: comp for comp in competitors}
+    
+    # Competitor and industry filters narrow the competitors read
+    wanted = []
+    for comp_id, comp in by_id.items():
+        if 'competitor' in spec.filters and comp_id not in spec.filters['competitor']:
+            continue
+        if 'industry' in spec.filters and (comp.get('industry') or 'Unknown') not in spec.filters['industry']:
+            continue
+        wanted.append(comp_id)
+
+    if wanted:
+        frame, source = load_query_frame(supabase, user_id, wanted, spec)
+    else:
+        frame, source = MetricsFrame.from_rows([]), 'none'
+    result = aggregate(frame, spec, by_id)
+    metrics.incr(f'query.source.{source}')
+
+    return {
+        'data': result['rows'],
+        'total_groups': result['total_groups'],
+        'truncated': result['truncated'],
+        'query': spec.describe(),
+        'plan': {
+            'source': source,
+            'rows_scanned': len(frame)
+        }
+    }
+
+
+if __name__ == '__main__':
+    # Grouping 200,000 rows by competitor x platform x week matches a dict loop
+    import random
+    import time
+
+    print("🧪 Grouping 200,000 synthetic metric rows by competitor, platform and week...")
+    print("=" * 60)
+
+    random.seed(3)
+    platforms = ['Meta', 'Google', 'TikTok', 'LinkedIn']
+    first = date(2026, 1, 1)
+    rows = [{
+        'competitor_id': f'comp-{random.randrange(500)}',
+        'platform': random.choice(platforms),
+        'date': (first + timedelta(days=random.randrange(180))).isoformat(),
+        'daily_spend': random.uniform(10, 2000),
+        'daily_impressions': random.randint(100, 50000),
+        'daily_clicks': random.randint(0, 500)
+    } for _ in range(200_000)]
+    frame = MetricsFrame.from_rows(rows)
+    competitors = {f'comp-{i}': {'name': f'Competitor {i}', 'industry': ['Retail', 'Travel'][i % 2]} for i in range(500)}
+    spec = parse_query({'dimensions': 'competitor,platform,week', 'measures': 'spend,clicks,ctr'})
+    spec.limit = len(rows)
+
+    started = time.perf_counter()
+    result = aggregate(frame, spec, competitors)
+    elapsed = (time.perf_counter() - started) * 1000
+
+    expected = {}
+    for row in rows:
+        day = date.fromisoformat(row['date'])
+        key = (row['competitor_id'], row['platform'], (day - timedelta(days=day.weekday())).isoformat())
+        expected[key] = expected.get(key, 0) + row['daily_clicks']
+    found = {(row['competitor_id'], row['platform'], row['week']): row['clicks'] for row in result['rows']}
+    assert found == expected
+    assert [row['week'] for row in result['rows']] == sorted(row['week'] for row in result['rows'])
+
+    print(f"  {result['total_groups']:,} groups from {len(frame):,} rows in {elapsed:.1f} ms")
+
+    print("\n" + "=" * 60)
+    print("✅ Grouped totals match a per-row loop")
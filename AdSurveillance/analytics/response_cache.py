@@ -0,0 +1,245 @@
+"""
+Response cache - Serialised analytics responses keyed by data version
+
+Analytics only change when a fetch job ingests metrics or a competitor is
+added, edited or removed. Each of those bumps a per-user counter in
+analytics_data_versions (see migrations/006_analytics_data_versions.sql),
+and responses are cached under (user, endpoint, query params, day, version).
+A bumped version simply stops matching the old entries, which age out of the
+LRU, so nothing has to be invalidated across processes.
+
+Versions are mirrored in memory for ANALYTICS_VERSION_TTL seconds, so a
+repeat view within that time is answered without any database round trip;
+after it, a single primary-key lookup.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Dict, Optional, Tuple
+import os
+import sys
+
+from flask import request, make_response
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.middleware.conditional import make_etag, etag_matches, not_modified
+from AdSurveillance.service_metrics import metrics
+
+VERSIONS_TABLE = 'analytics_data_versions'
+
+
+class DataVersions:
+    """In-memory mirror of per-user analytics data versions"""
+
+    def __init__(self, supabase=None, ttl: float = None):
+        """
+        Args:
+            supabase: Supabase client (created from Config on first use if omitted)
+            ttl: Seconds a mirrored version is trusted without a local bump
+        """
+        self.supabase = supabase
+        self.ttl = ttl if ttl is not None else Config.ANALYTICS_VERSION_TTL
+        self._versions: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _client(self):
+        if self.supabase is None:
+            from supabase import create_client
+            self.supabase = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+        return self.supabase
+
+    def get(self, user_id: str) -> Optional[int]:
+        """
+        Current data version of a user
+
+        Returns:
+            The version (0 before the first bump), or None if it can't be read
+        """
+        user_id = str(user_id)
+        with self._lock:
+            cached = self._versions.get(user_id)
+            if cached and time.monotonic() - cached[1] < self.ttl:
+                return cached[0]
+
+        try:
+            response = self._client().table(VERSIONS_TABLE)\
+                .select('version')\
+                .eq('user_id', user_id)\
+                .limit(1)\
+                .execute()
+        except Exception as e:
+            metrics.incr('response_cache.version_errors')
+            print(f"⚠️ Could not read analytics data version for user {user_id}: {e}")
+            return None
+
+        version = int(response.data[0]['version']) if response.data else 0
+        with self._lock:
+            self._versions[user_id] = (version, time.monotonic())
+        return version
+
+    def bump(self, user_id: str) -> Optional[int]:
+        """
+        Mark a user's analytics data as changed
+
+        Returns:
+            The new version, or None if the bump failed
+        """
+        user_id = str(user_id)
+        self.invalidate(user_id)
+        try:
+            response = self._client().rpc('bump_analytics_version', {'p_user_id': user_id}).execute()
+        except Exception as e:
+            metrics.incr('response_cache.version_errors')
+            print(f"⚠️ Could not bump analytics data version for user {user_id}: {e}")
+            return None
+
+        version = response.data
+        if isinstance(version, list):
+            version = version[0] if version else None
+        if isinstance(version, dict):
+            version = version.get('bump_analytics_version')
+        if version is None:
+            return None
+
+        with self._lock:
+            self._versions[user_id] = (int(version), time.monotonic())
+        return int(version)
+
+    def invalidate(self, user_id: str) -> None:
+        """Forget the mirrored version, e.g. after a competitor change in this process"""
+        with self._lock:
+            self._versions.pop(str(user_id), None)
+
+
+class ResponseCache:
+    """LRU of serialised JSON bodies bounded by entry count and total bytes"""
+
+    def __init__(self, max_bytes: int = None, max_entries: int = None):
+        self.max_bytes = max_bytes if max_bytes is not None else Config.ANALYTICS_CACHE_MAX_BYTES
+        self.max_entries = max_entries if max_entries is not None else Config.ANALYTICS_CACHE_MAX_ENTRIES
+        self._entries: 'OrderedDict[tuple, bytes]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.max_entries > 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+        metrics.incr('response_cache.hits' if body is not None else 'response_cache.misses')
+        return body
+
+    def put(self, key: tuple, body: bytes) -> None:
+        # A single body larger than a quarter of the budget would evict most of the cache
+        if not self.enabled or len(body) > self.max_bytes // 4:
+            return
+        evicted = 0
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, dropped = self._entries.popitem(last=False)
+                self._bytes -= len(dropped)
+                evicted += 1
+            size, count = self._bytes, len(self._entries)
+
+        if evicted:
+            metrics.incr('response_cache.evictions', evicted)
+        metrics.set_gauge('response_cache.bytes', size)
+        metrics.set_gauge('response_cache.entries', count)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# Global instances
+data_versions = DataVersions()
+response_cache = ResponseCache()
+
+
+def normalise_params(args) -> tuple:
+    """
+    Query parameters in a canonical order
+
+    Keys starting with '_' (client cache busters) and empty values are ignored,
+    so '?days=30&limit=10' and '?limit=10&days=30&_=1712' share an entry.
+    """
+    return tuple(sorted(
+        (key, tuple(sorted(value.strip() for value in values if value.strip())))
+        for key, values in args.lists()
+        if not key.startswith('_') and any(value.strip() for value in values)
+    ))
+
+
+def _cacheable(response) -> bool:
+    """Only successful, complete JSON responses are cached (not fallback data)"""
+    if response.status_code != 200 or not response.is_json:
+        return False
+    payload = response.get_json(silent=True)
+    return isinstance(payload, dict) and payload.get('success') is True and 'error' not in payload
+
+
+def _serve(body: bytes, etag: str, state: str):
+    response = make_response(body, 200)
+    response.headers['Content-Type'] = 'application/json'
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['X-Cache'] = state
+    return response
+
+
+def cached_response(endpoint: str):
+    """
+    Serve a view from the response cache while the user's data version is unchanged
+
+    Apply below @token_required. The view runs normally when the cache is
+    disabled or the version can't be read.
+
+    Args:
+        endpoint: Stable name of the endpoint, part of the cache key
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = getattr(request, 'user_id', None)
+            if not user_id or not response_cache.enabled:
+                return view(*args, **kwargs)
+
+            version = data_versions.get(user_id)
+            if version is None:
+                return view(*args, **kwargs)
+
+            # Windows are relative to today, so entries also expire at midnight UTC
+            today = datetime.now(timezone.utc).date().isoformat()
+            key = (str(user_id), endpoint, normalise_params(request.args), today, version)
+            etag = make_etag(*key)
+            if etag_matches(etag):
+                return not_modified(etag)
+
+            body = response_cache.get(key)
+            if body is not None:
+                return _serve(body, etag, 'HIT')
+
+            response = make_response(view(*args, **kwargs))
+            if not _cacheable(response):
+                return response
+
+            body = response.get_data()
+            response_cache.put(key, body)
+            return _serve(body, etag, 'MISS')
+        return wrapper
+    return decorator
@@ -0,0 +1,480 @@
+"""
+Rollups - Daily (user, competitor, platform, date) aggregates of daily_metrics
+
+After every fetch job the dates it wrote are re-aggregated from the raw
+per-ad rows and upserted into daily_metric_rollups (see
+migrations/005_daily_metric_rollups.sql). A date is always rebuilt from all
+of its raw rows, so refreshing twice is harmless.
+
+Backfill existing history:
+    python -m AdSurveillance.analytics.rollups --all
+    python -m AdSurveillance.analytics.rollups --user <user_id> --days 90
+"""
+import argparse
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, Any, Iterator, List, Sequence, Tuple
+import os
+import sys
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.analytics.metrics_frame import MetricsFrame, ROW_COLUMNS, ROLLUP_COLUMNS
+from AdSurveillance.analytics.sketches import SKETCH_METRICS, TDigest, group_digests
+from AdSurveillance.analytics.streaming import accumulate_pages
+from AdSurveillance.service_metrics import metrics
+
+ROLLUP_TABLE = 'daily_metric_rollups'
+
+RAW_FIELDS = 'competitor_id, competitor_name, platform, date, daily_spend, daily_impressions, daily_clicks, daily_ctr'
+ROLLUP_FIELDS = (
+    'competitor_id, competitor_name, platform, date, total_spend, total_impressions, total_clicks, '
+    'ctr_sum, ad_count, low_spend_count, medium_spend_count, high_spend_count'
+)
+
+# Dates per IN (...) filter and rows per upsert request
+DATES_PER_QUERY = 31
+UPSERT_BATCH_SIZE = 500
+
+
+def fetch_pages(build_query: Callable, page_size: int = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Page through a query with .range() until a short page
+
+    Args:
+        build_query: Returns a fresh, ordered query builder for each page
+        page_size: Rows per request
+
+    Yields:
+        Lists of rows
+    """
+    page_size = page_size or Config.ANALYTICS_PAGE_SIZE
+    start = 0
+    while True:
+        rows = build_query().range(start, start + page_size - 1).execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+
+def fetch_keyset_pages(build_query: Callable, page_size: int = None, key: str = 'id') -> Iterator[List[Dict[str, Any]]]:
+    """
+    Page through a query in key order, each page continuing after the last key
+
+    Unlike .range() paging, deep pages cost the same as the first one and
+    rows inserted meanwhile can't shift rows between pages.
+
+    Args:
+        build_query: Returns a fresh, filtered (unordered) query builder for each page
+        page_size: Rows per request
+        key: Unique column to order and continue by (must be selected)
+
+    Yields:
+        Lists of rows
+    """
+    page_size = page_size or Config.ANALYTICS_PAGE_SIZE
+    last = None
+    while True:
+        query = build_query()
+        if last is not None:
+            query = query.gt(key, last)
+        rows = query.order(key).limit(page_size).execute().data or []
+        if rows:
+            yield rows
+            last = rows[-1][key]
+        if len(rows) < page_size:
+            return
+
+
+def fetch_all(build_query: Callable, page_size: int = None) -> List[Dict[str, Any]]:
+    """All rows of a paged query"""
+    rows = []
+    for page in fetch_pages(build_query, page_size):
+        rows.extend(page)
+    return rows
+
+
+def build_rollups(user_id: str, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Aggregate raw daily_metrics rows into rollup rows
+
+    Args:
+        user_id: Owner of the competitors
+        rows: Raw rows (RAW_FIELDS)
+
+    Returns:
+        One dict per (competitor, platform, date) present in the rows, with
+        a t-digest per metric in SKETCH_METRICS
+    """
+    frame = MetricsFrame.from_rows(rows)
+    if not len(frame):
+        return []
+
+    keys = ('competitor', 'platform', 'date')
+    labels, totals = frame.group_by(*keys)
+    digests = {metric: group_digests(frame, metric, keys) for metric in SKETCH_METRICS}
+    names = {comp_id: frame.competitor_name(code, None) for code, comp_id in enumerate(frame.competitor_ids)}
+    updated_at = datetime.now(timezone.utc).isoformat()
+
+    rollups = []
+    for group, ((comp_id, platform, day), spend, impressions, clicks, ctr_sum, count, bands) in enumerate(zip(
+        labels,
+        totals['spend'].tolist(),
+        totals['impressions'].tolist(),
+        totals['clicks'].tolist(),
+        totals['ctr_sum'].tolist(),
+        totals['count'].tolist(),
+        totals['bands'].tolist()
+    )):
+        if comp_id is None or day is None:
+            continue
+        rollup = {
+            'user_id': user_id,
+            'competitor_id': comp_id,
+            'platform': platform or 'Unknown',
+            'date': day,
+            'competitor_name': names.get(comp_id),
+            'total_spend': round(spend, 4),
+            'total_impressions': impressions,
+            'total_clicks': clicks,
+            'ctr_sum': ctr_sum,
+            'ad_count': count,
+            'low_spend_count': bands[0],
+            'medium_spend_count': bands[1],
+            'high_spend_count': bands[2],
+            'updated_at': updated_at
+        }
+        for metric, column in SKETCH_METRICS.items():
+            rollup[column] = digests[metric][group].to_json()
+        rollups.append(rollup)
+    return rollups
+
+
+class RollupBuilder:
+    """Maintains daily_metric_rollups for users"""
+
+    def __init__(self, supabase, page_size: int = None):
+        """
+        Args:
+            supabase: Supabase client
+            page_size: Rows per request when reading daily_metrics
+        """
+        self.supabase = supabase
+        self.page_size = page_size or Config.ANALYTICS_PAGE_SIZE
+
+    def competitor_ids(self, user_id: str) -> List[str]:
+        """All competitors of a user, active or not"""
+        response = self.supabase.table('competitors')\
+            .select('id')\
+            .eq('user_id', user_id)\
+            .execute()
+        return [row['id'] for row in (response.data or [])]
+
+    def refresh_dates(self, user_id: str, dates: Sequence[str], competitor_ids: List[str] = None) -> int:
+        """
+        Rebuild the rollups of a user for the given dates
+
+        Returns:
+            Number of rollup rows upserted
+        """
+        competitor_ids = competitor_ids if competitor_ids is not None else self.competitor_ids(user_id)
+        dates = sorted(set(dates))
+        if not competitor_ids or not dates:
+            return 0
+
+        upserted = 0
+        for i in range(0, len(dates), DATES_PER_QUERY):
+            chunk = dates[i:i + DATES_PER_QUERY]
+            rows = fetch_all(
+                lambda: self.supabase.table('daily_metrics')
+                    .select(RAW_FIELDS)
+                    .in_('competitor_id', competitor_ids)
+                    .in_('date', chunk)
+                    .order('id'),
+                self.page_size
+            )
+            upserted += self._upsert(build_rollups(user_id, rows))
+        return upserted
+
+    def refresh_range(self, user_id: str, start_date: date, end_date: date, competitor_ids: List[str] = None) -> int:
+        """
+        Rebuild the rollups of a user for every date in [start_date, end_date]
+
+        Returns:
+            Number of rollup rows upserted
+        """
+        competitor_ids = competitor_ids if competitor_ids is not None else self.competitor_ids(user_id)
+        if not competitor_ids:
+            return 0
+
+        rows = fetch_all(
+            lambda: self.supabase.table('daily_metrics')
+                .select(RAW_FIELDS)
+                .in_('competitor_id', competitor_ids)
+                .gte('date', start_date.isoformat())
+                .lte('date', end_date.isoformat())
+                .order('id'),
+            self.page_size
+        )
+        return self._upsert(build_rollups(user_id, rows))
+
+    def refresh_since(self, user_id: str, since: datetime) -> int:
+        """
+        Rebuild the rollups of every date a fetch wrote metrics for
+
+        Args:
+            user_id: The user whose fetch job completed
+            since: When the fetch started
+
+        Returns:
+            Number of rollup rows upserted
+        """
+        competitor_ids = self.competitor_ids(user_id)
+        if not competitor_ids:
+            return 0
+
+        written_after = since - timedelta(seconds=Config.ROLLUP_CLOCK_SKEW_SECONDS)
+        touched = fetch_all(
+            lambda: self.supabase.table('daily_metrics')
+                .select('date')
+                .in_('competitor_id', competitor_ids)
+                .gte('created_at', written_after.isoformat())
+                .order('id'),
+            self.page_size
+        )
+        dates = {row['date'] for row in touched if row.get('date')}
+        if not dates:
+            return 0
+
+        upserted = self.refresh_dates(user_id, dates, competitor_ids)
+        metrics.incr('rollups.refreshed_rows', upserted)
+        print(f"📊 RollupBuilder: {upserted} rollup row(s) for user {user_id} over {len(dates)} date(s)")
+        return upserted
+
+    def backfill_user(self, user_id: str, days: int = None) -> int:
+        """
+        Build the rollups of a user's whole history (or the last N days)
+
+        Returns:
+            Number of rollup rows upserted
+        """
+        competitor_ids = self.competitor_ids(user_id)
+        if not competitor_ids:
+            return 0
+
+        today = datetime.now(timezone.utc).date()
+        if days:
+            start = today - timedelta(days=days)
+        else:
+            oldest = self.supabase.table('daily_metrics')\
+                .select('date')\
+                .in_('competitor_id', competitor_ids)\
+                .order('date')\
+                .limit(1)\
+                .execute()
+            if not oldest.data:
+                return 0
+            start = date.fromisoformat(str(oldest.data[0]['date'])[:10])
+
+        # Walk the history in windows so memory stays bounded
+        upserted = 0
+        window = timedelta(days=max(1, Config.ROLLUP_BACKFILL_WINDOW_DAYS))
+        while start <= today:
+            end = min(start + window - timedelta(days=1), today)
+            upserted += self.refresh_range(user_id, start, end, competitor_ids)
+            start = end + timedelta(days=1)
+        return upserted
+
+    def backfill_all(self, days: int = None) -> Dict[str, int]:
+        """
+        Backfill every user that has competitors
+
+        Returns:
+            Rollup rows upserted per user
+        """
+        owners = fetch_all(
+            lambda: self.supabase.table('competitors').select('user_id').order('id'),
+            self.page_size
+        )
+        results = {}
+        for user_id in dict.fromkeys(row['user_id'] for row in owners if row.get('user_id')):
+            results[user_id] = self.backfill_user(user_id, days)
+            print(f"  {user_id}: {results[user_id]} rollup row(s)")
+        return results
+
+    def _upsert(self, rollups: List[Dict[str, Any]]) -> int:
+        for i in range(0, len(rollups), UPSERT_BATCH_SIZE):
+            self.supabase.table(ROLLUP_TABLE)\
+                .upsert(rollups[i:i + UPSERT_BATCH_SIZE], on_conflict='user_id,competitor_id,platform,date')\
+                .execute()
+        return len(rollups)
+
+
+def metrics_query(supabase, user_id: str, competitor_ids: List[str],
+                  start_date: str = None, end_date: str = None,
+                  windows: Sequence[Tuple[str, str]] = None) -> Tuple[Callable, Dict[str, Any]]:
+    """
+    Paged query over a user's metrics for a date window, from rollups when enabled
+
+    Args:
+        windows: Several inclusive ('YYYY-MM-DD', 'YYYY-MM-DD') windows read in
+                 one query, instead of start_date/end_date
+
+    Returns:
+        Tuple of (query builder for fetch_pages, frame columns of its rows)
+    """
+    use_rollups = Config.ANALYTICS_USE_ROLLUPS
+
+    def build_query():
+        if use_rollups:
+            query = supabase.table(ROLLUP_TABLE)\
+                .select(ROLLUP_FIELDS)\
+                .eq('user_id', user_id)\
+                .in_('competitor_id', competitor_ids)
+        else:
+            query = supabase.table('daily_metrics')\
+                .select(RAW_FIELDS)\
+                .in_('competitor_id', competitor_ids)
+        if start_date:
+            query = query.gte('date', start_date)
+        if end_date:
+            query = query.lte('date', end_date)
+        if windows:
+            query = query.or_(','.join(f'and(date.gte.{first},date.lte.{last})' for first, last in windows))
+        if use_rollups:
+            return query.order('date').order('competitor_id').order('platform')
+        return query.order('id')
+
+    return build_query, ROLLUP_COLUMNS if use_rollups else ROW_COLUMNS
+
+
+def load_metrics_frame(supabase, user_id: str, competitor_ids: List[str],
+                       start_date: str = None, end_date: str = None,
+                       windows: Sequence[Tuple[str, str]] = None) -> MetricsFrame:
+    """
+    A user's metrics for a date window as a frame, from rollups when enabled
+
+    Args:
+        supabase: Supabase client
+        user_id: The user
+        competitor_ids: Competitors to include
+        start_date: Inclusive 'YYYY-MM-DD' lower bound (optional)
+        end_date: Inclusive 'YYYY-MM-DD' upper bound (optional)
+        windows: Several inclusive date windows to read at once (optional)
+
+    Returns:
+        MetricsFrame (counts are per ad either way)
+    """
+    if not competitor_ids:
+        return MetricsFrame.from_rows([])
+
+    build_query, columns = metrics_query(supabase, user_id, competitor_ids, start_date, end_date, windows)
+    return MetricsFrame.from_rows(fetch_all(build_query), columns)
+
+
+def stream_metrics_frame(supabase, user_id: str, competitor_ids: List[str],
+                         start_date: str = None, end_date: str = None) -> MetricsFrame:
+    """
+    Per-(competitor, platform) totals of a date window, reduced page by page
+
+    Same arguments as load_metrics_frame. Only one page of rows is held at a
+    time, so any window fits in O(competitors x platforms) memory.
+
+    Returns:
+        Compact MetricsFrame without dates (see streaming.CompetitorPlatformTotals)
+    """
+    if not competitor_ids:
+        return MetricsFrame.from_rows([])
+
+    build_query, columns = metrics_query(supabase, user_id, competitor_ids, start_date, end_date)
+    return accumulate_pages(fetch_pages(build_query), columns)
+
+
+def load_metric_digests(supabase, user_id: str, competitor_ids: List[str], metric: str,
+                        start_date: str = None, end_date: str = None) -> List[Dict[str, Any]]:
+    """
+    Distribution of a per-ad metric per (competitor, platform) over a date window
+
+    With rollups enabled the daily digests stored on the rollup rows are
+    merged; otherwise digests are built from the raw rows.
+
+    Args:
+        supabase: Supabase client
+        user_id: The user
+        competitor_ids: Competitors to include
+        metric: A key of SKETCH_METRICS
+        start_date: Inclusive 'YYYY-MM-DD' lower bound (optional)
+        end_date: Inclusive 'YYYY-MM-DD' upper bound (optional)
+
+    Returns:
+        Dicts with competitor_id, competitor_name, platform and digest
+    """
+    if metric not in SKETCH_METRICS:
+        raise ValueError(f"metric must be one of: {', '.join(SKETCH_METRICS)}")
+    if not competitor_ids:
+        return []
+
+    if not Config.ANALYTICS_USE_ROLLUPS:
+        frame = load_metrics_frame(supabase, user_id, competitor_ids, start_date, end_date)
+        labels, _ = frame.group_index('competitor', 'platform')
+        names = {comp_id: frame.competitor_name(code, None) for code, comp_id in enumerate(frame.competitor_ids)}
+        return [
+            {'competitor_id': comp_id, 'competitor_name': names.get(comp_id), 'platform': platform or 'Unknown', 'digest': digest}
+            for (comp_id, platform), digest in zip(labels, group_digests(frame, metric, ('competitor', 'platform')))
+        ]
+
+    column = SKETCH_METRICS[metric]
+
+    def build_query():
+        query = supabase.table(ROLLUP_TABLE)\
+            .select(f'competitor_id, competitor_name, platform, {column}')\
+            .eq('user_id', user_id)\
+            .in_('competitor_id', competitor_ids)
+        if start_date:
+            query = query.gte('date', start_date)
+        if end_date:
+            query = query.lte('date', end_date)
+        return query.order('date').order('competitor_id').order('platform')
+
+    groups: Dict[tuple, List[TDigest]] = {}
+    names: Dict[str, str] = {}
+    for page in fetch_pages(build_query):
+        for row in page:
+            key = (row['competitor_id'], row.get('platform') or 'Unknown')
+            groups.setdefault(key, []).append(TDigest.from_json(row.get(column)))
+            names.setdefault(row['competitor_id'], row.get('competitor_name'))
+
+    return [
+        {'competitor_id': comp_id, 'competitor_name': names.get(comp_id), 'platform': platform, 'digest': TDigest.merge(digests)}
+        for (comp_id, platform), digests in groups.items()
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill daily_metric_rollups')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--user', help='Backfill one user')
+    target.add_argument('--all', action='store_true', help='Backfill every user with competitors')
+    parser.add_argument('--days', type=int, default=None, help='Only the last N days (default: full history)')
+    args = parser.parse_args()
+
+    from supabase import create_client
+
+    print("📊 Backfilling daily metric rollups...")
+    print("=" * 60)
+
+    builder = RollupBuilder(create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY))
+    if args.user:
+        total = builder.backfill_user(args.user, args.days)
+    else:
+        total = sum(builder.backfill_all(args.days).values())
+
+    print("=" * 60)
+    print(f"✅ Upserted {total} rollup row(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,472 @@
+"""
+Snapshots - Per-user Parquet copies of daily_metrics and ads_fetch_jobs
+
+Each user gets one Parquet file per calendar month of metrics under
+SNAPSHOT_DIR/<user_id>/daily_metrics/month=YYYY-MM/, with competitor and
+platform columns dictionary-encoded and zstd compression, and one file of
+their fetch jobs under SNAPSHOT_DIR/<user_id>/ads_fetch_jobs/. A
+_manifest.json in the user's directory records what each file holds and
+when the snapshot was last refreshed.
+
+A refresh only rewrites the months that received metrics since the previous
+one (found through created_at, as for the rollups); all other partitions
+are left as they are. The first refresh, or a --full one, writes every month.
+Jobs change status in place and are few per user (old ones are archived),
+so their file is rewritten on every refresh.
+
+Refresh snapshots:
+    python -m AdSurveillance.analytics.snapshots --all
+    python -m AdSurveillance.analytics.snapshots --user <user_id> --full
+"""
+import argparse
+import fcntl
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Any, Iterator, List, Optional, Set
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.ad_fetch_service.job_format import parse_timestamp
+from AdSurveillance.analytics.rollups import fetch_all, fetch_keyset_pages
+from AdSurveillance.service_metrics import metrics
+
+# pyarrow is optional; without it snapshots are unavailable
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    pa = None
+    pq = None
+    HAS_PYARROW = False
+
+SNAPSHOT_TABLE = 'daily_metrics'
+JOBS_TABLE = 'ads_fetch_jobs'
+# Leading '_' and '.' keep the manifest and partial files out of dataset scans
+MANIFEST_FILE = '_manifest.json'
+PARTITION_FILE = 'part-0.parquet'
+# flock()ed for the length of a refresh, by any process sharing SNAPSHOT_DIR
+LOCK_FILE = '.refresh.lock'
+
+# Columns stored, in file order, with their Arrow types
+SNAPSHOT_COLUMNS = (
+    ('id', 'string'),
+    ('date', 'date'),
+    ('competitor_id', 'dictionary'),
+    ('competitor_name', 'dictionary'),
+    ('platform', 'dictionary'),
+    ('ad_id', 'string'),
+    ('daily_spend', 'float'),
+    ('daily_impressions', 'int'),
+    ('daily_clicks', 'int'),
+    ('daily_ctr', 'float'),
+    ('spend_lower_bound', 'float'),
+    ('spend_upper_bound', 'float'),
+    ('impressions_lower_bound', 'int'),
+    ('impressions_upper_bound', 'int'),
+    ('creative', 'string'),
+    ('created_at', 'timestamp')
+)
+SNAPSHOT_FIELDS = ', '.join(name for name, _ in SNAPSHOT_COLUMNS)
+
+# Job columns stored (logs and lease bookkeeping are left out)
+JOB_SNAPSHOT_COLUMNS = (
+    ('job_id', 'string'),
+    ('status', 'dictionary'),
+    ('platform', 'dictionary'),
+    ('total_competitors', 'int'),
+    ('ads_fetched', 'int'),
+    ('attempts', 'int'),
+    ('error_message', 'string'),
+    ('start_time', 'timestamp'),
+    ('end_time', 'timestamp'),
+    ('created_at', 'timestamp'),
+    ('updated_at', 'timestamp')
+)
+JOB_SNAPSHOT_FIELDS = ', '.join(name for name, _ in JOB_SNAPSHOT_COLUMNS)
+
+MONTH_PATTERN = re.compile(r'^\d{4}-\d{2}$')
+
+
+def arrow_schema(columns=SNAPSHOT_COLUMNS):
+    """Arrow schema of a snapshot file"""
+    types = {
+        'string': pa.string(),
+        'date': pa.date32(),
+        'dictionary': pa.dictionary(pa.int32(), pa.string()),
+        'float': pa.float64(),
+        'int': pa.int64(),
+        'timestamp': pa.timestamp('us', tz='UTC')
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def rows_to_batch(rows: List[Dict[str, Any]], names: Dict[str, str] = None, columns=SNAPSHOT_COLUMNS):
+    """
+    One page of rows as an Arrow record batch
+
+    Args:
+        rows: daily_metrics rows (SNAPSHOT_FIELDS) or jobs (JOB_SNAPSHOT_FIELDS)
+        names: Current competitor names by id (the row's own name otherwise)
+        columns: SNAPSHOT_COLUMNS or JOB_SNAPSHOT_COLUMNS
+    """
+    schema = arrow_schema(columns)
+    names = names or {}
+    arrays = []
+    for (name, kind), field in zip(columns, schema):
+        if name == 'competitor_name':
+            values = [names.get(row.get('competitor_id')) or row.get('competitor_name') for row in rows]
+        elif kind in ('string', 'dictionary'):
+            values = [None if row.get(name) is None else str(row[name]) for row in rows]
+        elif kind == 'date':
+            values = [date.fromisoformat(str(row['date'])[:10]) if row.get('date') else None for row in rows]
+        elif kind == 'timestamp':
+            values = [parse_timestamp(row.get(name)) for row in rows]
+        elif kind == 'float':
+            values = [None if row.get(name) is None else float(row[name]) for row in rows]
+        elif kind == 'int':
+            values = [None if row.get(name) is None else int(float(row[name])) for row in rows]
+
+        if kind == 'dictionary':
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def month_bounds(month: str):
+    """First and last day of a 'YYYY-MM' month"""
+    first = date.fromisoformat(f'{month}-01')
+    following = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return first, following - timedelta(days=1)
+
+
+def months_between(first: date, last: date) -> List[str]:
+    """Every 'YYYY-MM' from first's month to last's month"""
+    months = []
+    current = first.replace(day=1)
+    while current <= last:
+        months.append(current.strftime('%Y-%m'))
+        current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return months
+
+
+class SnapshotStore:
+    """Reads and refreshes users' Parquet snapshots on local disk"""
+
+    def __init__(self, supabase=None, root: str = None, page_size: int = None):
+        """
+        Args:
+            supabase: Supabase client (only needed to refresh)
+            root: Directory holding the snapshots (SNAPSHOT_DIR by default)
+            page_size: Rows per keyset page when reading daily_metrics
+        """
+        self.supabase = supabase
+        self.root = root or Config.SNAPSHOT_DIR
+        self.page_size = page_size or Config.ANALYTICS_PAGE_SIZE
+
+    # ---------- Layout ----------
+
+    def user_root(self, user_id: str) -> str:
+        # User ids are UUIDs; anything else is reduced to a safe directory name
+        safe = re.sub(r'[^A-Za-z0-9_-]', '_', str(user_id))
+        return os.path.join(self.root, safe)
+
+    def user_dir(self, user_id: str, table: str = SNAPSHOT_TABLE) -> str:
+        return os.path.join(self.user_root(user_id), table)
+
+    def jobs_path(self, user_id: str) -> str:
+        return os.path.join(self.user_dir(user_id, JOBS_TABLE), PARTITION_FILE)
+
+    def partition_path(self, user_id: str, month: str) -> str:
+        return os.path.join(self.user_dir(user_id), f'month={month}', PARTITION_FILE)
+
+    def manifest(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """A user's manifest, or None before the first snapshot"""
+        path = os.path.join(self.user_root(user_id), MANIFEST_FILE)
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+    def _save_manifest(self, user_id: str, manifest: Dict[str, Any]) -> None:
+        path = os.path.join(self.user_root(user_id), MANIFEST_FILE)
+        fd, temp = tempfile.mkstemp(prefix=f'.{MANIFEST_FILE}.', suffix='.tmp', dir=self.user_root(user_id))
+        try:
+            with os.fdopen(fd, 'w') as handle:
+                json.dump(manifest, handle, indent=2, sort_keys=True)
+            os.replace(temp, path)
+        except BaseException:
+            os.remove(temp)
+            raise
+
+    def partition_files(self, user_id: str) -> List[str]:
+        """Paths of all partitions in a user's manifest, oldest month first"""
+        manifest = self.manifest(user_id) or {}
+        return [
+            self.partition_path(user_id, month)
+            for month in sorted(manifest.get('partitions', {}))
+        ]
+
+    def table_files(self, user_id: str) -> Dict[str, List[str]]:
+        """Snapshot files per table (an empty list for an empty table)"""
+        manifest = self.manifest(user_id) or {}
+        jobs = manifest.get('jobs') or {}
+        return {
+            SNAPSHOT_TABLE: self.partition_files(user_id),
+            JOBS_TABLE: [self.jobs_path(user_id)] if jobs.get('rows') else []
+        }
+
+    @contextmanager
+    def _lock(self, user_id: str):
+        """Hold the user's refresh lock, waiting for a refresh in any other process or thread"""
+        os.makedirs(self.user_root(user_id), exist_ok=True)
+        fd = os.open(os.path.join(self.user_root(user_id), LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Poll rather than block in flock(): a blocking call would stall every
+            # greenlet of a gevent worker, time.sleep yields to them
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    time.sleep(0.5)
+            yield
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
+    def is_refreshing(self, user_id: str) -> bool:
+        try:
+            fd = os.open(os.path.join(self.user_root(user_id), LOCK_FILE), os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            return False
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+
+    # ---------- Refresh ----------
+
+    def competitor_names(self, user_id: str) -> Dict[str, str]:
+        """All competitors of a user, active or not"""
+        rows = fetch_all(
+            lambda: self.supabase.table('competitors').select('id, name').eq('user_id', user_id).order('id'),
+            self.page_size
+        )
+        return {row['id']: row.get('name') for row in rows}
+
+    def _all_months(self, competitor_ids: List[str]) -> List[str]:
+        oldest = self.supabase.table(SNAPSHOT_TABLE)\
+            .select('date')\
+            .in_('competitor_id', competitor_ids)\
+            .order('date')\
+            .limit(1)\
+            .execute()
+        if not oldest.data:
+            return []
+        first = date.fromisoformat(str(oldest.data[0]['date'])[:10])
+        return months_between(first, datetime.now(timezone.utc).date())
+
+    def _touched_months(self, competitor_ids: List[str], since: datetime) -> Set[str]:
+        written_after = since - timedelta(seconds=Config.ROLLUP_CLOCK_SKEW_SECONDS)
+        months = set()
+        for page in fetch_keyset_pages(
+            lambda: self.supabase.table(SNAPSHOT_TABLE)
+                .select('id, date')
+                .in_('competitor_id', competitor_ids)
+                .gte('created_at', written_after.isoformat()),
+            self.page_size
+        ):
+            months.update(str(row['date'])[:7] for row in page if row.get('date'))
+        return months
+
+    def _month_pages(self, competitor_ids: List[str], month: str) -> Iterator[List[Dict[str, Any]]]:
+        first, last = month_bounds(month)
+        return fetch_keyset_pages(
+            lambda: self.supabase.table(SNAPSHOT_TABLE)
+                .select(SNAPSHOT_FIELDS)
+                .in_('competitor_id', competitor_ids)
+                .gte('date', first.isoformat())
+                .lte('date', last.isoformat()),
+            self.page_size
+        )
+
+    def _write_file(self, path: str, pages: Iterator[List[Dict[str, Any]]],
+                    columns=SNAPSHOT_COLUMNS, names: Dict[str, str] = None) -> Dict[str, Any]:
+        """
+        Replace one snapshot file with the given pages of rows
+
+        Pages are buffered up to SNAPSHOT_ROW_GROUP_SIZE rows per row group,
+        so memory is bounded by the row group, not the file.
+
+        Returns:
+            Manifest entry for the file (rows 0, and no file, when there were no rows)
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp = tempfile.mkstemp(prefix=f'.{PARTITION_FILE}.', suffix='.tmp', dir=os.path.dirname(path))
+        os.close(fd)
+
+        rows_written = 0
+        buffered: List[Any] = []
+        buffered_rows = 0
+        try:
+            writer = pq.ParquetWriter(
+                temp, arrow_schema(columns),
+                compression='zstd',
+                use_dictionary=[name for name, kind in columns if kind == 'dictionary'],
+            )
+            try:
+                for page in pages:
+                    buffered.append(rows_to_batch(page, names, columns))
+                    buffered_rows += len(page)
+                    if buffered_rows >= Config.SNAPSHOT_ROW_GROUP_SIZE:
+                        writer.write_table(pa.Table.from_batches(buffered))
+                        rows_written += buffered_rows
+                        buffered, buffered_rows = [], 0
+                if buffered:
+                    writer.write_table(pa.Table.from_batches(buffered))
+                    rows_written += buffered_rows
+            finally:
+                writer.close()
+        except BaseException:
+            os.remove(temp)
+            raise
+
+        if not rows_written:
+            os.remove(temp)
+            if os.path.exists(path):
+                os.remove(path)
+            return {'rows': 0}
+
+        os.replace(temp, path)
+        return {
+            'rows': rows_written,
+            'bytes': os.path.getsize(path),
+            'written_at': datetime.now(timezone.utc).isoformat()
+        }
+
+    def write_month(self, user_id: str, competitor_ids: List[str], names: Dict[str, str], month: str) -> Dict[str, Any]:
+        """Rewrite one month's partition from daily_metrics"""
+        return self._write_file(
+            self.partition_path(user_id, month),
+            self._month_pages(competitor_ids, month),
+            SNAPSHOT_COLUMNS,
+            names
+        )
+
+    def write_jobs(self, user_id: str) -> Dict[str, Any]:
+        """Rewrite the user's ads_fetch_jobs file"""
+        pages = fetch_keyset_pages(
+            lambda: self.supabase.table(JOBS_TABLE).select(JOB_SNAPSHOT_FIELDS).eq('user_id', user_id),
+            self.page_size,
+            key='job_id'
+        )
+        return self._write_file(self.jobs_path(user_id), pages, JOB_SNAPSHOT_COLUMNS)
+
+    def refresh_user(self, user_id: str, full: bool = False) -> Dict[str, Any]:
+        """
+        Bring a user's snapshot up to date
+
+        Args:
+            user_id: The user
+            full: Rewrite every month instead of only the changed ones
+
+        Returns:
+            The new manifest plus 'refreshed_months'
+        """
+        if not HAS_PYARROW:
+            raise RuntimeError("Parquet snapshots need pyarrow (pip install pyarrow)")
+
+        with self._lock(user_id):
+            started_at = datetime.now(timezone.utc)
+            os.makedirs(self.user_dir(user_id), exist_ok=True)
+            manifest = self.manifest(user_id) if not full else None
+            manifest = manifest or {'user_id': str(user_id), 'table': SNAPSHOT_TABLE, 'partitions': {}}
+
+            names = self.competitor_names(user_id)
+            competitor_ids = list(names)
+            if not competitor_ids:
+                months = []
+            elif manifest.get('refreshed_at'):
+                months = sorted(self._touched_months(competitor_ids, datetime.fromisoformat(manifest['refreshed_at'])))
+            else:
+                months = self._all_months(competitor_ids)
+
+            for month in months:
+                entry = self.write_month(user_id, competitor_ids, names, month)
+                if entry['rows']:
+                    manifest['partitions'][month] = entry
+                else:
+                    manifest['partitions'].pop(month, None)
+            manifest['jobs'] = self.write_jobs(user_id)
+
+            # The next refresh looks for rows created after this one started
+            manifest['refreshed_at'] = started_at.isoformat()
+            manifest['total_rows'] = sum(entry['rows'] for entry in manifest['partitions'].values())
+            self._save_manifest(user_id, manifest)
+
+        metrics.incr('snapshots.partitions_written', len(months))
+        print(f"📦 Snapshot for user {user_id}: {len(months)} month(s) rewritten, "
+              f"{len(manifest['partitions'])} partition(s), {manifest['total_rows']} row(s), "
+              f"{manifest['jobs']['rows']} job(s)")
+        return {**manifest, 'refreshed_months': months}
+
+    def refresh_all(self, full: bool = False) -> Dict[str, int]:
+        """
+        Refresh every user that has competitors
+
+        Returns:
+            Months rewritten per user
+        """
+        owners = fetch_all(
+            lambda: self.supabase.table('competitors').select('user_id').order('id'),
+            self.page_size
+        )
+        results = {}
+        for user_id in dict.fromkeys(row['user_id'] for row in owners if row.get('user_id')):
+            results[user_id] = len(self.refresh_user(user_id, full)['refreshed_months'])
+        return results
+
+
+# Global store (the API attaches its Supabase client before refreshing)
+snapshot_store = SnapshotStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh Parquet snapshots of daily_metrics')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--user', help='Refresh one user')
+    target.add_argument('--all', action='store_true', help='Refresh every user with competitors')
+    parser.add_argument('--full', action='store_true', help='Rewrite every month, not only changed ones')
+    args = parser.parse_args()
+
+    from supabase import create_client
+
+    print(f"📦 Refreshing metric snapshots in {Config.SNAPSHOT_DIR}...")
+    print("=" * 60)
+
+    store = SnapshotStore(create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY))
+    if args.user:
+        months = len(store.refresh_user(args.user, args.full)['refreshed_months'])
+    else:
+        months = sum(store.refresh_all(args.full).values())
+
+    print("=" * 60)
+    print(f"✅ Rewrote {months} partition(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+SQL Engine - Read-only, parameterised SQL over a user's Parquet snapshots
+
+Each user's snapshot (see snapshots.py) is loaded into a private in-memory
+DuckDB database with two tables, daily_metrics and ads_fetch_jobs. Once
+loaded, file access and configuration changes are switched off, so a query
+can only read those two tables: nothing else on disk, and no other user's
+data. Databases are cached per user and reloaded when their snapshot is
+refreshed.
+
+A query is a single SELECT (WITH ... SELECT included) with $name
+parameters. It is interrupted after SQL_TIMEOUT_SECONDS and returns at most
+SQL_MAX_ROWS rows.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Any, List, Optional
+import os
+import sys
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+from AdSurveillance.analytics.snapshots import (
+    JOB_SNAPSHOT_COLUMNS, JOBS_TABLE, SNAPSHOT_COLUMNS, SNAPSHOT_TABLE, HAS_PYARROW, snapshot_store
+)
+from AdSurveillance.service_metrics import metrics
+
+# duckdb is optional; without it the SQL API is unavailable
+try:
+    import duckdb
+    HAS_DUCKDB = True
+except ImportError:
+    duckdb = None
+    HAS_DUCKDB = False
+
+# Tables a query can read, with the columns of their snapshot files
+SQL_TABLES = {
+    SNAPSHOT_TABLE: SNAPSHOT_COLUMNS,
+    JOBS_TABLE: JOB_SNAPSHOT_COLUMNS
+}
+
+# SQL types of snapshot column kinds (dictionary columns read back as text,
+# timestamps are kept in UTC without a zone)
+DUCKDB_TYPES = {
+    'string': 'VARCHAR',
+    'dictionary': 'VARCHAR',
+    'date': 'DATE',
+    'float': 'DOUBLE',
+    'int': 'BIGINT',
+    'timestamp': 'TIMESTAMP'
+}
+
+# Parameter values accepted for $name placeholders
+PARAM_TYPES = (str, int, float, bool, type(None))
+
+MAX_SQL_LENGTH = 10000
+
+
+class QueryError(ValueError):
+    """The query was rejected or failed; the message is safe to return"""
+
+
+class QueryTimeout(QueryError):
+    """The query ran longer than its time limit"""
+
+
+class SnapshotMissing(QueryError):
+    """The user has no snapshot to query yet"""
+
+
+class UserDatabase:
+    """One user's loaded snapshot"""
+
+    def __init__(self, connection, refreshed_at: Optional[str]):
+        self.connection = connection
+        self.refreshed_at = refreshed_at
+        self.lock = threading.Lock()
+
+
+def validate_sql(sql: str) -> str:
+    """
+    The query text if it is a single SELECT
+
+    Raises:
+        QueryError: Empty, too long, several statements or not a SELECT
+    """
+    sql = (sql or '').strip()
+    if not sql:
+        raise QueryError("'sql' is required")
+    if len(sql) > MAX_SQL_LENGTH:
+        raise QueryError(f"'sql' must be at most {MAX_SQL_LENGTH} characters")
+    try:
+        statements = duckdb.extract_statements(sql)
+    except duckdb.Error as e:
+        raise QueryError(str(e))
+    if len(statements) != 1:
+        raise QueryError('Exactly one statement is allowed')
+    if statements[0].type != duckdb.StatementType.SELECT:
+        raise QueryError('Only SELECT queries are allowed')
+    return sql.rstrip(';')
+
+
+def validate_params(params: Any) -> Dict[str, Any]:
+    """
+    Values for the query's $name placeholders
+
+    Raises:
+        QueryError: Not an object of scalars (or lists of scalars)
+    """
+    if params is None:
+        return {}
+    if not isinstance(params, dict):
+        raise QueryError("'params' must be an object")
+    for name, value in params.items():
+        if not name.isidentifier():
+            raise QueryError(f"Invalid parameter name: {name}")
+        values = value if isinstance(value, list) else [value]
+        if not all(isinstance(item, PARAM_TYPES) for item in values):
+            raise QueryError(f"Parameter '{name}' must be a string, number, boolean, null or a list of those")
+    return params
+
+
+def json_value(value: Any) -> Any:
+    """A DuckDB result value in a JSON-serialisable form"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, list):
+        return [json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: json_value(item) for key, item in value.items()}
+    return value
+
+
+class SQLEngine:
+    """Runs restricted SQL against per-user in-memory snapshot databases"""
+
+    def __init__(self, store=None, max_databases: int = None):
+        """
+        Args:
+            store: SnapshotStore the databases are loaded from
+            max_databases: Users whose databases are kept loaded (least recently used go first)
+        """
+        self.store = store or snapshot_store
+        self.max_databases = max_databases or Config.SQL_MAX_DATABASES
+        self._databases: 'OrderedDict[str, UserDatabase]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return HAS_DUCKDB and HAS_PYARROW
+
+    def _load(self, user_id: str, refreshed_at: Optional[str]) -> UserDatabase:
+        """A fresh in-memory database holding the user's snapshot tables"""
+        connection = duckdb.connect(':memory:', config={
+            'threads': Config.SQL_THREADS,
+            'memory_limit': Config.SQL_MEMORY_LIMIT
+        })
+        connection.execute("SET TimeZone = 'UTC'")
+        for table, files in self.store.table_files(user_id).items():
+            timestamps = [name for name, kind in SQL_TABLES[table] if kind == 'timestamp']
+            if files:
+                replace = ', '.join(f'{name}::TIMESTAMP AS {name}' for name in timestamps)
+                connection.execute(
+                    f'CREATE TABLE {table} AS SELECT * REPLACE ({replace}) '
+                    f'FROM read_parquet($files, hive_partitioning = false)',
+                    {'files': files}
+                )
+            else:
+                columns = ', '.join(
+                    f'{name} {DUCKDB_TYPES[kind]}' for name, kind in SQL_TABLES[table]
+                )
+                connection.execute(f'CREATE TABLE {table} ({columns})')
+
+        # From here on queries only see the tables above
+        connection.execute("SET enable_external_access = false")
+        connection.execute("SET lock_configuration = true")
+        metrics.incr('sql.databases_loaded')
+        return UserDatabase(connection, refreshed_at)
+
+    def database(self, user_id: str) -> UserDatabase:
+        """
+        The user's loaded database, reloading it after a snapshot refresh
+
+        Raises:
+            SnapshotMissing: The user has no snapshot yet
+        """
+        manifest = self.store.manifest(user_id)
+        if not manifest:
+            raise SnapshotMissing('No snapshot yet; refresh one with POST /metrics/snapshots/refresh')
+        refreshed_at = manifest.get('refreshed_at')
+
+        with self._lock:
+            database = self._databases.get(user_id)
+            if database and database.refreshed_at == refreshed_at:
+                self._databases.move_to_end(user_id)
+                return database
+
+        # Loading reads the Parquet files; done outside the engine lock
+        loaded = self._load(user_id, refreshed_at)
+        with self._lock:
+            self._databases[user_id] = loaded
+            self._databases.move_to_end(user_id)
+            while len(self._databases) > self.max_databases:
+                self._databases.popitem(last=False)
+        return loaded
+
+    def execute(self, user_id: str, sql: str, params: Dict[str, Any] = None,
+                max_rows: int = None, timeout: float = None) -> Dict[str, Any]:
+        """
+        Run one query against the user's snapshot
+
+        Args:
+            user_id: The user
+            sql: A single SELECT
+            params: Values for $name placeholders
+            max_rows: Row limit, capped at SQL_MAX_ROWS
+            timeout: Seconds before the query is interrupted, capped at SQL_TIMEOUT_SECONDS
+
+        Returns:
+            Dict with columns ([{name, type}]), rows (lists), row_count,
+            truncated, elapsed_ms and the snapshot's refreshed_at
+
+        Raises:
+            QueryError: Rejected or failed query
+            QueryTimeout: The query hit its time limit
+            SnapshotMissing: The user has no snapshot yet
+        """
+        sql = validate_sql(sql)
+        params = validate_params(params)
+        max_rows = min(max_rows or Config.SQL_DEFAULT_ROWS, Config.SQL_MAX_ROWS)
+        timeout = min(timeout or Config.SQL_TIMEOUT_SECONDS, Config.SQL_TIMEOUT_SECONDS)
+
+        database = self.database(user_id)
+        with database.lock:
+            connection = database.connection
+            timer = threading.Timer(timeout, connection.interrupt)
+            started = time.perf_counter()
+            timer.start()
+            try:
+                result = connection.execute(sql, params or None)
+                rows = result.fetchmany(max_rows + 1)
+                description = result.description
+            except duckdb.InterruptException:
+                metrics.incr('sql.timeouts')
+                raise QueryTimeout(f'Query exceeded the {timeout:g}s time limit')
+            except duckdb.Error as e:
+                metrics.incr('sql.errors')
+                raise QueryError(str(e))
+            finally:
+                timer.cancel()
+            elapsed = time.perf_counter() - started
+
+        metrics.incr('sql.queries')
+        truncated = len(rows) > max_rows
+        rows = rows[:max_rows]
+        return {
+            'columns': [{'name': column[0], 'type': str(column[1])} for column in description],
+            'rows': [[json_value(value) for value in row] for row in rows],
+            'row_count': len(rows),
+            'truncated': truncated,
+            'elapsed_ms': round(elapsed * 1000, 2),
+            'snapshot_at': database.refreshed_at
+        }
+
+    def schema(self) -> Dict[str, List[Dict[str, str]]]:
+        """Columns and SQL types of the queryable tables"""
+        return {
+            table: [{'name': name, 'type': DUCKDB_TYPES[kind]} for name, kind in columns]
+            for table, columns in SQL_TABLES.items()
+        }
+
+
+# Global engine
+sql_engine = SQLEngine()
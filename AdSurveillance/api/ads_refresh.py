@@ -11,7 +11,6 @@ import sys
 import threading
 from datetime import datetime, timezone
 from supabase import create_client, Client
-import traceback
 
 # Create Flask Blueprint
 ads_refresh_bp = Blueprint('ads_refresh', __name__)
@@ -19,6 +18,13 @@ ads_refresh_bp = Blueprint('ads_refresh', __name__)
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import Config
+from AdSurveillance.ad_fetch_service.status_manager import status_manager
+from AdSurveillance.ad_fetch_service.job_events import job_event_bus
+from AdSurveillance.ad_fetch_service.job_format import format_jobs
+from AdSurveillance.ad_fetch_service.job_archive import merge_archived
+from AdSurveillance.middleware.conditional import (
+    make_etag, job_fingerprint, etag_matches, not_modified, json_with_etag, ETagMemo
+)
 
 # Initialize Supabase
 try:
@@ -28,38 +34,13 @@ except Exception as e:
     supabase = None
 
 # ========== ADS FETCHER IMPORT ==========
-FETCHER_AVAILABLE = False
-ads_fetcher = None
-
-# Try to import AdsFetcher
-try:
-    # Try to find ad_fetch_service directory
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    service_path = os.path.join(project_root, 'ad_fetch_service')
-    
-    if os.path.exists(service_path):
-        if service_path not in sys.path:
-            sys.path.insert(0, service_path)
-        
-        try:
-            from ads_fetcher import AdsFetcher
-            ads_fetcher = AdsFetcher()
-            FETCHER_AVAILABLE = True
-            print("✅ AdsFetcher loaded successfully")
-        except ImportError as e:
-            print(f"❌ Could not import AdsFetcher: {e}")
-        except Exception as e:
-            print(f"❌ Error initializing AdsFetcher: {e}")
-    else:
-        print(f"❌ ad_fetch_service directory not found: {service_path}")
-except Exception as e:
-    print(f"❌ Unexpected error loading AdsFetcher: {e}")
-
-if not FETCHER_AVAILABLE:
-    print("🚫 AdsFetcher not available - ads fetching will fail")
+# The fetcher is loaded by the job executor, shared with the fetch worker
+from AdSurveillance.ad_fetch_service.job_executor import FETCHER_AVAILABLE, ads_fetcher, execute_fetch_job
 # ========== END ADS FETCHER IMPORT ==========
 
+# Last ETag served per user for /user-jobs
+user_jobs_etags = ETagMemo(max_age=Config.JOB_CACHE_ACTIVE_TTL)
+
 def verify_token(token):
     """Verify JWT token and return user_id"""
     try:
@@ -121,6 +102,7 @@ def create_job_record(user_id, job_id, platform="all"):
         response = supabase.table('ads_fetch_jobs').insert(job_data).execute()
         
         if response.data:
+            status_manager.publish(job_id, response.data[0])
             print(f"✅ Job record created: {job_id} for user {user_id}")
             return True
         else:
@@ -131,67 +113,18 @@ def create_job_record(user_id, job_id, platform="all"):
         print(f"Error creating job record: {e}")
         return False
 
-def run_background_fetch(job_id, user_id, platform):
+def run_background_fetch(job_id, user_id, platform, attempts=0):
     """Run ads fetching in background thread"""
-    try:
-        print(f"🚀 Starting background fetch for job {job_id}")
-        
-        if not supabase:
-            print("❌ Supabase not available for job update")
-            return
-            
-        # Update job status to running
-        supabase.table('ads_fetch_jobs')\
-            .update({
-                'status': 'running',
-                'updated_at': datetime.now(timezone.utc).isoformat()
-            })\
-            .eq('job_id', job_id)\
-            .execute()
-        
-        # Run the ads fetcher if available
-        success = False
-        logs = ""
-        ads_count = 0
-        
-        if FETCHER_AVAILABLE and ads_fetcher:
-            success, logs, ads_count = ads_fetcher.run_for_user(user_id, platform)
-        else:
-            logs = "=== ADS FETCHING DISABLED ===\n"
-            logs += f"AdsFetcher not properly configured\n"
-            ads_count = 0
-        
-        # Update job with results
-        end_time = datetime.now(timezone.utc).isoformat()
-        update_data = {
-            'status': 'completed' if success else 'failed',
-            'ads_fetched': ads_count,
-            'end_time': end_time,
-            'updated_at': end_time
-        }
-        
-        # Add logs if available (truncate if too long)
-        if logs:
-            if len(logs) > 10000:  # Limit to 10KB
-                logs = logs[:10000] + "\n...[truncated]"
-            update_data['logs'] = logs
-        
-        # Add error message if failed
-        if not success and logs:
-            error_msg = logs[:500] if len(logs) > 500 else logs
-            update_data['error_message'] = error_msg
-        
-        # Update database
-        supabase.table('ads_fetch_jobs')\
-            .update(update_data)\
-            .eq('job_id', job_id)\
-            .execute()
-        
-        print(f"✅ Background fetch completed for job {job_id}: {'success' if success else 'failed'}")
-        
-    except Exception as e:
-        print(f"❌ Error in background fetch for job {job_id}: {e}")
-        traceback.print_exc()
+    execute_fetch_job(job_id, user_id, platform, attempts)
+
+def requeue_fetch_job(job):
+    """Restart a job the reaper put back into the pending state"""
+    thread = threading.Thread(
+        target=run_background_fetch,
+        args=(job['job_id'], job['user_id'], job.get('platform') or 'all', job.get('attempts') or 0),
+        daemon=True
+    )
+    thread.start()
 
 @ads_refresh_bp.route('/health', methods=['GET'])
 def health_check():
@@ -220,8 +153,9 @@ def refresh_ads():
     if not user_id:
         return jsonify({'error': 'Invalid or expired token'}), 401
     
-    # Check if fetcher is available
-    if not FETCHER_AVAILABLE:
+    # Check if fetcher is available (in queue mode the fetch workers run it)
+    queue_mode = Config.FETCH_DISPATCH_MODE == 'queue'
+    if not FETCHER_AVAILABLE and not queue_mode:
         return jsonify({
             'error': 'Ads fetching is currently disabled',
             'code': 'FETCHER_NOT_AVAILABLE',
@@ -242,12 +176,13 @@ def refresh_ads():
     platform = data.get('platform', 'all')
     force = data.get('force', False)
     
-    # Check if user already has a running job
+    # Check if user already has a running job (or a queued one in queue mode)
     if not force:
+        active_statuses = ['pending', 'running'] if queue_mode else ['running']
         running_jobs = supabase.table('ads_fetch_jobs')\
             .select('id')\
             .eq('user_id', user_id)\
-            .eq('status', 'running')\
+            .in_('status', active_statuses)\
             .execute()
         
         if running_jobs.data and len(running_jobs.data) > 0:
@@ -273,18 +208,20 @@ def refresh_ads():
         estimated_time *= 4
     estimated_time = min(estimated_time, 300)
     
-    # Start ads fetching in background thread
-    thread = threading.Thread(
-        target=run_background_fetch,
-        args=(job_id, user_id, platform),
-        daemon=True
-    )
-    thread.start()
+    # Start ads fetching in background thread, or leave the pending job for a fetch worker
+    if not queue_mode:
+        thread = threading.Thread(
+            target=run_background_fetch,
+            args=(job_id, user_id, platform),
+            daemon=True
+        )
+        thread.start()
     
     # Return immediate response
     response_data = {
         'status': 'started',
         'job_id': job_id,
+        'dispatch': Config.FETCH_DISPATCH_MODE,
         'message': f'Started fetching ads from {platform} for {competitors_count} competitors',
         'estimated_time': estimated_time,
         'competitors_count': competitors_count,
@@ -312,6 +249,15 @@ def get_user_jobs():
         return jsonify({'error': 'Database not configured'}), 500
     
     try:
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
+        
+        # Answer revalidations from memory while none of the user's jobs changed
+        memo_key = (user_id, 'ads_refresh.user_jobs', include_archived)
+        version = job_event_bus.user_version(user_id)
+        etag = user_jobs_etags.lookup(memo_key, version)
+        if etag and etag_matches(etag):
+            return not_modified(etag)
+        
         # Get last 20 jobs for the user
         response = supabase.table('ads_fetch_jobs')\
             .select('*')\
@@ -319,41 +265,26 @@ def get_user_jobs():
             .order('created_at', desc=True)\
             .limit(20)\
             .execute()
+        rows = response.data or []
+        
+        # Older jobs only live in the archive; read it only when asked to
+        if include_archived and len(rows) < 20:
+            rows = merge_archived(rows, status_manager.get_archived_jobs(user_id, limit=20), 20)
+        
+        etag = make_etag(FETCHER_AVAILABLE, *(part for job in rows for part in job_fingerprint(job)))
+        user_jobs_etags.remember(memo_key, version, etag)
+        if etag_matches(etag):
+            return not_modified(etag)
         
         # Format jobs for display
-        jobs = []
-        for job in (response.data if response.data else []):
-            formatted_job = job.copy()
-            
-            # Add status icon
-            status = job.get('status', 'unknown')
-            icons = {'completed': '✅', 'running': '🔄', 'failed': '❌', 'pending': '⏳'}
-            formatted_job['status_icon'] = icons.get(status, '❓')
-            
-            # Format duration
-            duration = job.get('duration_seconds')
-            if duration:
-                if duration < 60:
-                    formatted_job['duration_formatted'] = f"{duration}s"
-                elif duration < 3600:
-                    minutes = duration // 60
-                    seconds = duration % 60
-                    formatted_job['duration_formatted'] = f"{minutes}m {seconds}s"
-                else:
-                    hours = duration // 3600
-                    minutes = (duration % 3600) // 60
-                    formatted_job['duration_formatted'] = f"{hours}h {minutes}m"
-            else:
-                formatted_job['duration_formatted'] = 'N/A'
-            
-            jobs.append(formatted_job)
+        jobs = format_jobs(rows)
         
-        return jsonify({
+        return json_with_etag({
             'jobs': jobs,
             'count': len(jobs),
             'has_active_jobs': any(j.get('status') == 'running' for j in jobs),
             'fetcher_available': FETCHER_AVAILABLE
-        }), 200
+        }, etag)
     except Exception as e:
         print(f"Error getting user jobs: {e}")
         return jsonify({'error': str(e)}), 500
@@ -433,15 +364,7 @@ def cancel_job(job_id):
             return jsonify({'error': f'Job cannot be cancelled (current status: {job["status"]})'}), 400
         
         # Update job status
-        update_response = supabase.table('ads_fetch_jobs')\
-            .update({
-                'status': 'failed',
-                'error_message': 'Cancelled by user',
-                'end_time': datetime.now(timezone.utc).isoformat(),
-                'updated_at': datetime.now(timezone.utc).isoformat()
-            })\
-            .eq('job_id', job_id)\
-            .execute()
+        status_manager.update_job_status(job_id, 'failed', error_message='Cancelled by user')
         
         return jsonify({
             'success': True,
@@ -485,30 +408,19 @@ def get_stats():
         return jsonify({'error': 'Database not configured'}), 500
     
     try:
-        # Total jobs
-        total_jobs = supabase.table('ads_fetch_jobs')\
-            .select('id', count='exact')\
-            .execute()
-        
-        # Completed jobs
-        completed_jobs = supabase.table('ads_fetch_jobs')\
-            .select('id', count='exact')\
-            .eq('status', 'completed')\
-            .execute()
-        
-        # Total ads fetched
-        ads_response = supabase.table('ads_fetch_jobs')\
-            .select('ads_fetched')\
-            .eq('status', 'completed')\
-            .execute()
+        # Global counters, maintained on every job transition
+        stats = status_manager.get_job_statistics()
+        if not stats:
+            return jsonify({'error': 'Job statistics not available'}), 500
         
-        total_ads = sum([job['ads_fetched'] for job in ads_response.data]) if ads_response.data else 0
+        total_jobs = stats['total_jobs']
+        completed_jobs = stats['completed']
         
         return jsonify({
-            'total_jobs': total_jobs.count if total_jobs.count else 0,
-            'completed_jobs': completed_jobs.count if completed_jobs.count else 0,
-            'success_rate': (completed_jobs.count / total_jobs.count * 100) if total_jobs.count and total_jobs.count > 0 else 0,
-            'total_ads_fetched': total_ads,
+            'total_jobs': total_jobs,
+            'completed_jobs': completed_jobs,
+            'success_rate': (completed_jobs / total_jobs * 100) if total_jobs > 0 else 0,
+            'total_ads_fetched': stats['completed_ads_fetched'],
             'fetcher_available': FETCHER_AVAILABLE
         }), 200
     except Exception as e:
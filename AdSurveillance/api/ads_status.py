@@ -2,8 +2,11 @@
 Ads Status API - Checks status of ads fetching jobs
 Flask Blueprint Version for Unified Deployment
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 import jwt
+import json
+import threading
+import time
 from datetime import datetime, timedelta, timezone
 from supabase import create_client, Client
 import os
@@ -15,6 +18,16 @@ ads_status_bp = Blueprint('ads_status', __name__)
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import Config
+from AdSurveillance.ad_fetch_service.status_manager import status_manager, job_change_watcher
+from AdSurveillance.ad_fetch_service.job_events import job_event_bus, JobEvent, TERMINAL_STATUSES
+from AdSurveillance.service_metrics import metrics
+from AdSurveillance.ad_fetch_service.job_archive import archive_cutoff, merge_archived, summarize_jobs
+from AdSurveillance.ad_fetch_service.job_format import (
+    parse_timestamp, calculate_progress, format_job_for_display, format_jobs, STATUS_ICONS
+)
+from AdSurveillance.middleware.conditional import (
+    make_etag, job_fingerprint, etag_matches, not_modified, json_with_etag, ETagMemo
+)
 
 # Initialize Supabase
 try:
@@ -23,6 +36,19 @@ except Exception as e:
     print(f"❌ Supabase initialization error: {e}")
     supabase = None
 
+# Held long-poll requests are greenlets under the gevent worker, so hundreds can wait;
+# the cap keeps them within --worker-connections, requests over it are answered
+# immediately like a plain poll
+long_poll_slots = threading.BoundedSemaphore(Config.LONG_POLL_MAX_WAITERS)
+
+# Open SSE streams are cheap greenlets under the gevent worker, but each holds a connection
+# and a subscription for up to SSE_MAX_STREAM_SECONDS; past the cap streams get a 503 and
+# the client falls back to polling
+stream_slots = threading.BoundedSemaphore(Config.SSE_MAX_STREAMS)
+
+# Last ETag served per user-jobs query; trusted as long as the job cache trusts active jobs
+user_jobs_etags = ETagMemo(max_age=Config.JOB_CACHE_ACTIVE_TTL)
+
 def verify_token(token):
     """Verify JWT token and return user_id"""
     try:
@@ -44,146 +70,92 @@ def verify_token(token):
         print(f"Token verification error: {e}")
         return None
 
-def parse_timestamp(timestamp):
-    """Parse timestamp string to datetime object with UTC timezone"""
-    if not timestamp:
-        return None
+def format_sse(event):
+    """Serialize a job event as a Server-Sent Events message"""
+    if event.event == 'status':
+        body = format_job_for_display(event.data)
+    else:
+        body = event.data
+    return f"id: {event.id}\nevent: {event.event}\ndata: {json.dumps(body, default=str)}\n\n"
+
+def streams_busy():
+    """Response for a stream request over the SSE_MAX_STREAMS cap"""
+    metrics.incr('sse.rejected')
+    response = jsonify({'error': 'Too many open status streams, poll /status instead'})
+    response.headers['Retry-After'] = str(Config.SSE_RETRY_AFTER)
+    return response, 503
+
+def stream_events(subscription, initial_events, watch, close_on_terminal=False):
+    """
+    Build an SSE response that replays initial_events, then forwards bus events
     
-    if isinstance(timestamp, str):
+    Sends a keep-alive comment when idle and ends after SSE_MAX_STREAM_SECONDS;
+    EventSource reconnects with Last-Event-ID and resumes from the replay buffer.
+    The caller's stream slot is released when the server closes the response.
+    """
+    def generate():
         try:
-            # Handle ISO format timestamps with or without timezone
-            if timestamp.endswith('Z'):
-                timestamp = timestamp[:-1] + '+00:00'
-            
-            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            yield "retry: 3000\n\n"
             
-            # If datetime is naive (no timezone), make it UTC
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
+            for event in initial_events:
+                yield format_sse(event)
+                if close_on_terminal and event.data.get('status') in TERMINAL_STATUSES:
+                    return
             
-            return dt
-        except Exception as e:
-            print(f"Error parsing timestamp {timestamp}: {e}")
-            return None
-    elif isinstance(timestamp, datetime):
-        # If it's already a datetime object, ensure it has timezone
-        if timestamp.tzinfo is None:
-            return timestamp.replace(tzinfo=timezone.utc)
-        return timestamp
-    return timestamp
-
-def calculate_progress(job):
-    """Calculate progress percentage based on job status and data"""
-    status = job.get('status', 'pending')
-    
-    if status == 'completed':
-        return 100
-    elif status == 'failed':
-        return 0
-    elif status == 'running':
-        # Estimate based on time elapsed vs estimated time
-        start_time = job.get('start_time')
-        if start_time:
-            start_dt = parse_timestamp(start_time)
-            if start_dt:
-                # Get current time with timezone (UTC)
-                now = datetime.now(timezone.utc)
-                
-                # Ensure start_dt has timezone
-                if start_dt.tzinfo is None:
-                    start_dt = start_dt.replace(tzinfo=timezone.utc)
-                
-                # Calculate elapsed seconds
-                elapsed = (now - start_dt).total_seconds()
-                
-                # Rough estimation: assume 30 seconds per platform per competitor
-                total_competitors = job.get('total_competitors', 1)
-                platform = job.get('platform', 'all')
-                
-                if platform == 'all':
-                    platforms_count = 4
-                else:
-                    platforms_count = 1
+            deadline = time.time() + Config.SSE_MAX_STREAM_SECONDS
+            while time.time() < deadline:
+                event = subscription.get(timeout=Config.SSE_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
                 
-                estimated_total = total_competitors * 30 * platforms_count
-                estimated_total = min(estimated_total, 300)  # Cap at 5 minutes
+                yield format_sse(event)
                 
-                if estimated_total > 0:
-                    progress = min(95, (elapsed / estimated_total) * 100)
-                    return round(progress, 1)
-    
-    return 0 if status == 'pending' else 5
+                if close_on_terminal and event.event == 'status' and event.data.get('status') in TERMINAL_STATUSES:
+                    return
+        finally:
+            job_event_bus.unsubscribe(subscription)
+            job_change_watcher.unwatch(**watch)
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    # Runs even if the client leaves before the generator starts
+    response.call_on_close(stream_slots.release)
+    return response
 
-def format_duration(seconds):
-    """Format duration in seconds to human readable string"""
-    if not seconds:
-        return None
+def wait_for_job_change(subscription, job, since, timeout):
+    """
+    Block until a status event moves the job past since, or timeout
     
-    if seconds < 60:
-        return f"{seconds}s"
-    elif seconds < 3600:
-        minutes = seconds // 60
-        seconds = seconds % 60
-        return f"{minutes}m {seconds}s"
-    else:
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        return f"{hours}h {minutes}m"
+    Returns:
+        The changed job, or the unchanged job if the wait expired
+    """
+    metrics.incr('long_poll.waits')
+    deadline = time.monotonic() + timeout
+    
+    while True:
+        remaining = deadline - time.monotonic()
+        event = subscription.get(timeout=remaining) if remaining > 0 else None
+        if event is None:
+            metrics.incr('long_poll.timeouts')
+            return job
+        
+        if event.event == 'status' and event.data.get('updated_at') != since:
+            metrics.incr('long_poll.changes')
+            return {**job, **event.data}
 
-def format_job_for_display(job):
-    """Format job data for frontend display"""
-    formatted = job.copy()
-    
-    # Add status icon
-    status = job.get('status', 'unknown')
-    status_icons = {
-        'completed': '✅',
-        'running': '🔄',
-        'failed': '❌',
-        'pending': '⏳'
-    }
-    formatted['status_icon'] = status_icons.get(status, '❓')
-    
-    # Calculate progress
-    formatted['progress'] = calculate_progress(job)
-    
-    # Format duration
-    duration = job.get('duration_seconds')
-    if not duration and job.get('end_time') and job.get('start_time'):
-        start_dt = parse_timestamp(job['start_time'])
-        end_dt = parse_timestamp(job['end_time'])
-        if start_dt and end_dt:
-            duration = int((end_dt - start_dt).total_seconds())
-            formatted['duration_seconds'] = duration
-    
-    if duration:
-        formatted['duration_formatted'] = format_duration(duration)
-    
-    # Format timestamps for display
-    for time_field in ['start_time', 'end_time', 'created_at', 'updated_at']:
-        if job.get(time_field):
-            dt = parse_timestamp(job[time_field])
-            if dt:
-                formatted[f'{time_field}_formatted'] = dt.strftime('%Y-%m-%d %H:%M:%S')
-    
-    # Add flags
-    formatted['completed'] = status == 'completed'
-    formatted['failed'] = status == 'failed'
-    formatted['running'] = status == 'running'
-    formatted['pending'] = status == 'pending'
-    
-    # Add platform icons
-    platform = job.get('platform', 'all')
-    platform_icons = {
-        'meta': '📱',
-        'google': '🔍',
-        'linkedin': '💼',
-        'tiktok': '🎵',
-        'all': '🌐'
-    }
-    formatted['platform_icon'] = platform_icons.get(platform, '🌐')
-    
-    return formatted
+def get_stream_token():
+    """EventSource cannot set headers, so streams also accept ?token="""
+    return request.headers.get('Authorization') or request.args.get('token')
+
+def get_last_event_id():
+    return request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
 
 @ads_status_bp.route('/health', methods=['GET'])
 def health_check():
@@ -200,6 +172,10 @@ def get_ads_status(job_id):
     """
     Get status of a specific ads fetching job
     Used for polling from frontend
+    
+    Long-poll: with ?wait=<seconds>&since=<updated_at> the request is held
+    until the job changes or the wait expires, instead of the client
+    polling every few seconds.
     """
     # Optional authentication
     auth_header = request.headers.get('Authorization')
@@ -211,30 +187,39 @@ def get_ads_status(job_id):
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
+    wait = min(request.args.get('wait', default=0, type=int), Config.LONG_POLL_MAX_WAIT)
+    # A literal '+' in an unencoded query string arrives as a space
+    since = (request.args.get('since') or '').replace(' ', '+')
+    
+    # Subscribe before reading the job so a change in between is not missed
+    subscription = None
+    if wait > 0 and since:
+        if long_poll_slots.acquire(blocking=False):
+            subscription = job_event_bus.subscribe(job_id=job_id)
+            job_change_watcher.watch(job_id=job_id)
+        else:
+            metrics.incr('long_poll.rejected')
+    
     try:
-        # Get job from database
-        response = supabase.table('ads_fetch_jobs')\
-            .select('*')\
-            .eq('job_id', job_id)\
-            .execute()
+        # Get job from the job cache, falling back to the database
+        job = status_manager.get_job_status(job_id)
         
-        if not response.data:
+        if not job:
             return jsonify({
                 'error': 'Job not found',
                 'job_id': job_id,
                 'exists': False
             }), 404
         
-        job = response.data[0]
-        
         # Check if user is authorized to view this job
         if user_id and job.get('user_id') != user_id:
             return jsonify({'error': 'Unauthorized to view this job'}), 403
         
-        # Format job for display
-        formatted_job = format_job_for_display(job)
+        if subscription and job.get('updated_at') == since and job.get('status') not in TERMINAL_STATUSES:
+            job = wait_for_job_change(subscription, job, since, wait)
         
         # Add real-time data for running jobs
+        stuck = None
         if job.get('status') == 'running':
             # Check if job is stuck (running for more than 10 minutes)
             start_time = parse_timestamp(job.get('start_time'))
@@ -245,13 +230,22 @@ def get_ads_status(job_id):
                     start_time = start_time.replace(tzinfo=timezone.utc)
                 
                 running_for = (now - start_time).total_seconds()
-                if running_for > 600:  # 10 minutes
-                    formatted_job['stuck'] = True
-                    formatted_job['warning'] = 'Job has been running for over 10 minutes'
-                else:
-                    formatted_job['stuck'] = False
+                stuck = running_for > 600  # 10 minutes
+        
+        # Revalidation before any formatting or serialisation
+        etag = make_etag(*job_fingerprint(job, calculate_progress(job)), stuck)
+        if etag_matches(etag):
+            return not_modified(etag)
+        
+        # Format job for display
+        formatted_job = format_job_for_display(job)
+        
+        if stuck is not None:
+            formatted_job['stuck'] = stuck
+            if stuck:
+                formatted_job['warning'] = 'Job has been running for over 10 minutes'
         
-        return jsonify(formatted_job), 200
+        return json_with_etag(formatted_job, etag)
         
     except Exception as e:
         print(f"Error getting ads status for job {job_id}: {e}")
@@ -260,6 +254,106 @@ def get_ads_status(job_id):
             'job_id': job_id,
             'status': 'error'
         }), 500
+    finally:
+        if subscription:
+            job_event_bus.unsubscribe(subscription)
+            job_change_watcher.unwatch(job_id=job_id)
+            long_poll_slots.release()
+
+@ads_status_bp.route('/stream/<job_id>', methods=['GET'])
+def stream_job_status(job_id):
+    """
+    Stream status changes of a job as Server-Sent Events
+    Replaces polling /status/<job_id>; the stream ends when the job finishes
+    """
+    token = get_stream_token()
+    user_id = verify_token(token) if token else None
+    
+    if not stream_slots.acquire(blocking=False):
+        return streams_busy()
+    
+    # Subscribe before taking the snapshot so no change falls in between
+    subscription = job_event_bus.subscribe(job_id=job_id)
+    watch = {'job_id': job_id}
+    job_change_watcher.watch(**watch)
+    
+    try:
+        initial_events = None
+        last_event_id = get_last_event_id()
+        if last_event_id:
+            initial_events = job_event_bus.events_since(last_event_id, job_id=job_id)
+        
+        latest = job_event_bus.latest(job_id)
+        if latest:
+            owner_id = latest.user_id or latest.data.get('user_id')
+            if initial_events is None:
+                initial_events = [latest]
+        else:
+            # Only read the job once per connection when this process has never seen it
+            job = status_manager.get_job_status(job_id)
+            if not job:
+                job_event_bus.unsubscribe(subscription)
+                job_change_watcher.unwatch(**watch)
+                stream_slots.release()
+                return jsonify({'error': 'Job not found', 'job_id': job_id, 'exists': False}), 404
+            owner_id = job.get('user_id')
+            if initial_events is None:
+                initial_events = [JobEvent(job_event_bus.cursor(), 0, 'status', job_id, owner_id, job)]
+        
+        if user_id and owner_id and owner_id != user_id:
+            job_event_bus.unsubscribe(subscription)
+            job_change_watcher.unwatch(**watch)
+            stream_slots.release()
+            return jsonify({'error': 'Unauthorized to view this job'}), 403
+    except Exception as e:
+        job_event_bus.unsubscribe(subscription)
+        job_change_watcher.unwatch(**watch)
+        stream_slots.release()
+        print(f"Error opening status stream for job {job_id}: {e}")
+        return jsonify({'error': str(e), 'job_id': job_id}), 500
+    
+    return stream_events(subscription, initial_events, watch, close_on_terminal=True)
+
+@ads_status_bp.route('/stream', methods=['GET'])
+def stream_user_jobs():
+    """Stream status changes of all jobs of the authenticated user as Server-Sent Events"""
+    token = get_stream_token()
+    if not token:
+        return jsonify({'error': 'Missing authorization header'}), 401
+    
+    user_id = verify_token(token)
+    
+    if not user_id:
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    if not stream_slots.acquire(blocking=False):
+        return streams_busy()
+    
+    subscription = job_event_bus.subscribe(user_id=user_id)
+    watch = {'user_id': user_id}
+    job_change_watcher.watch(**watch)
+    
+    try:
+        initial_events = None
+        last_event_id = get_last_event_id()
+        if last_event_id:
+            initial_events = job_event_bus.events_since(last_event_id, user_id=user_id)
+        
+        if initial_events is None:
+            # Fresh connection (or resume gap): send the user's recent jobs once
+            cursor = job_event_bus.cursor()
+            initial_events = [
+                JobEvent(cursor, 0, 'status', job['job_id'], user_id, job)
+                for job in reversed(status_manager.get_user_jobs(user_id, limit=10))
+            ]
+    except Exception as e:
+        job_event_bus.unsubscribe(subscription)
+        job_change_watcher.unwatch(**watch)
+        stream_slots.release()
+        print(f"Error opening status stream for user {user_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    return stream_events(subscription, initial_events, watch)
 
 @ads_status_bp.route('/batch-status', methods=['POST'])
 def get_batch_status():
@@ -280,20 +374,19 @@ def get_batch_status():
         if not job_ids:
             return jsonify({'jobs': [], 'count': 0}), 200
         
-        # Get all jobs in one query
-        response = supabase.table('ads_fetch_jobs')\
-            .select('*')\
-            .in_('job_id', job_ids)\
-            .execute()
-        
-        jobs = response.data if response.data else []
+        # Cached jobs are served from memory, the rest in one query
+        jobs = status_manager.get_jobs(job_ids)
         
         # Filter by user if authenticated
         if user_id:
             jobs = [job for job in jobs if job.get('user_id') == user_id]
         
+        etag = make_etag(*(part for job in jobs for part in job_fingerprint(job, calculate_progress(job))))
+        if etag_matches(etag):
+            return not_modified(etag)
+        
         # Format all jobs
-        formatted_jobs = [format_job_for_display(job) for job in jobs]
+        formatted_jobs = format_jobs(jobs)
         
         # Calculate summary
         summary = {
@@ -304,11 +397,11 @@ def get_batch_status():
             'pending': sum(1 for j in formatted_jobs if j.get('status') == 'pending')
         }
         
-        return jsonify({
+        return json_with_etag({
             'jobs': formatted_jobs,
             'summary': summary,
             'count': len(formatted_jobs)
-        }), 200
+        }, etag)
         
     except Exception as e:
         print(f"Error in batch status: {e}")
@@ -335,6 +428,14 @@ def get_user_jobs():
         status = request.args.get('status', default=None)
         platform = request.args.get('platform', default=None)
         days = request.args.get('days', default=30, type=int)
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
+        
+        # Answer revalidations from memory while none of the user's jobs changed
+        memo_key = (user_id, 'ads_status.user_jobs', limit, status, platform, days, include_archived)
+        version = job_event_bus.user_version(user_id)
+        etag = user_jobs_etags.lookup(memo_key, version)
+        if etag and etag_matches(etag):
+            return not_modified(etag)
         
         # Calculate date cutoff with timezone
         cutoff_date = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
@@ -356,8 +457,20 @@ def get_user_jobs():
         response = query.execute()
         jobs = response.data if response.data else []
         
+        # Page into the archive only when the caller asks for history beyond the live window
+        if len(jobs) < limit and (include_archived or days > Config.JOB_ARCHIVE_AFTER_DAYS):
+            archived = status_manager.get_archived_jobs(
+                user_id, since=cutoff_date, limit=limit, status=status, platform=platform
+            )
+            jobs = merge_archived(jobs, archived, limit)
+        
+        etag = make_etag(*memo_key, *(part for job in jobs for part in job_fingerprint(job, calculate_progress(job))))
+        user_jobs_etags.remember(memo_key, version, etag)
+        if etag_matches(etag):
+            return not_modified(etag)
+        
         # Format jobs
-        formatted_jobs = [format_job_for_display(job) for job in jobs]
+        formatted_jobs = format_jobs(jobs)
         
         # Calculate statistics
         stats = {
@@ -369,7 +482,7 @@ def get_user_jobs():
             'total_ads_fetched': sum(j.get('ads_fetched', 0) for j in formatted_jobs)
         }
         
-        return jsonify({
+        return json_with_etag({
             'jobs': formatted_jobs,
             'stats': stats,
             'count': len(formatted_jobs),
@@ -377,9 +490,10 @@ def get_user_jobs():
                 'status': status,
                 'platform': platform,
                 'days': days,
-                'limit': limit
+                'limit': limit,
+                'include_archived': include_archived
             }
-        }), 200
+        }, etag)
         
     except Exception as e:
         print(f"Error getting user jobs: {e}")
@@ -517,10 +631,10 @@ def get_job_logs(job_id):
             .eq('job_id', job_id)\
             .execute()
         
-        if not response.data:
-            return jsonify({'error': 'Job not found'}), 404
+        job = response.data[0] if response.data else status_manager.get_archived_job(job_id)
         
-        job = response.data[0]
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
         
         # Verify ownership
         if job.get('user_id') != user_id:
@@ -559,13 +673,71 @@ def get_job_logs(job_id):
             'log_line_count': len(parsed_logs),
             'status': job.get('status'),
             'platform': job.get('platform'),
-            'created_at': job.get('created_at')
+            'created_at': job.get('created_at'),
+            'archived': bool(job.get('archived'))
         }), 200
         
     except Exception as e:
         print(f"Error getting job logs for {job_id}: {e}")
         return jsonify({'error': str(e)}), 500
 
+@ads_status_bp.route('/job-history', methods=['GET'])
+def get_job_history():
+    """
+    Get per-day job counts for the authenticated user (for charts)
+    Archived days come from job_daily_summary, recent days from live jobs
+    """
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        return jsonify({'error': 'Missing authorization header'}), 401
+    
+    user_id = verify_token(auth_header)
+    
+    if not user_id:
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    if not supabase:
+        return jsonify({'error': 'Database not configured'}), 500
+    
+    try:
+        days = request.args.get('days', default=90, type=int)
+        
+        now = datetime.now(timezone.utc)
+        since = (now - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        live_since = max(since, archive_cutoff())
+        
+        history = []
+        if since < live_since:
+            try:
+                history = status_manager.archive.daily_summary(
+                    user_id, since.date().isoformat(), live_since.date().isoformat()
+                )
+            except Exception as e:
+                print(f"Error reading archived job summaries: {e}")
+        
+        response = supabase.table('ads_fetch_jobs')\
+            .select('created_at, status, ads_fetched, start_time, end_time')\
+            .eq('user_id', user_id)\
+            .gte('created_at', live_since.isoformat())\
+            .execute()
+        
+        history.extend(sorted(summarize_jobs(user_id, response.data or []), key=lambda day: day['date']))
+        
+        for day in history:
+            jobs_with_duration = day.get('jobs_with_duration') or 0
+            day['avg_duration_seconds'] = (day.get('total_duration_seconds') or 0) / jobs_with_duration if jobs_with_duration else 0
+        
+        return jsonify({
+            'days': history,
+            'count': len(history),
+            'since': since.date().isoformat(),
+            'archived_until': live_since.date().isoformat()
+        }), 200
+        
+    except Exception as e:
+        print(f"Error getting job history: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @ads_status_bp.route('/dashboard-stats', methods=['GET'])
 def get_dashboard_stats():
     """Get dashboard statistics for the authenticated user"""
@@ -588,29 +760,13 @@ def get_dashboard_stats():
         week_start = (now - timedelta(days=7)).isoformat()
         month_start = (now - timedelta(days=30)).isoformat()
         
-        # Get job statistics
-        total_jobs = supabase.table('ads_fetch_jobs')\
-            .select('id', count='exact')\
-            .eq('user_id', user_id)\
-            .execute()
-        
-        today_jobs = supabase.table('ads_fetch_jobs')\
-            .select('id', count='exact')\
-            .eq('user_id', user_id)\
-            .gte('created_at', today_start)\
-            .execute()
-        
-        completed_jobs = supabase.table('ads_fetch_jobs')\
-            .select('id, ads_fetched', count='exact')\
-            .eq('user_id', user_id)\
-            .eq('status', 'completed')\
-            .execute()
+        # Job counters, maintained on every job transition
+        job_stats = status_manager.get_job_statistics(user_id)
+        if not job_stats:
+            return jsonify({'error': 'Job statistics not available'}), 500
         
-        running_jobs = supabase.table('ads_fetch_jobs')\
-            .select('id', count='exact')\
-            .eq('user_id', user_id)\
-            .eq('status', 'running')\
-            .execute()
+        total_jobs = job_stats['total_jobs']
+        completed_jobs = job_stats['completed']
         
         # Get ads statistics from daily_metrics table
         competitors_response = supabase.table('competitors')\
@@ -637,22 +793,8 @@ def get_dashboard_stats():
                 total_spend = sum(float(ad.get('daily_spend', 0) or 0) for ad in ads_response.data)
                 total_impressions = sum(int(ad.get('daily_impressions', 0) or 0) for ad in ads_response.data)
         
-        # Calculate total ads fetched from jobs
-        total_ads_fetched = 0
-        if completed_jobs.data:
-            total_ads_fetched = sum(job.get('ads_fetched', 0) for job in completed_jobs.data)
-        
-        # Get platform distribution from jobs
-        platform_response = supabase.table('ads_fetch_jobs')\
-            .select('platform')\
-            .eq('user_id', user_id)\
-            .execute()
-        
-        platform_stats = {}
-        if platform_response.data:
-            for job in platform_response.data:
-                platform = job.get('platform', 'unknown')
-                platform_stats[platform] = platform_stats.get(platform, 0) + 1
+        total_ads_fetched = job_stats['completed_ads_fetched']
+        platform_stats = job_stats['platforms']
         
         # Get recent activity
         recent_activity = supabase.table('ads_fetch_jobs')\
@@ -671,24 +813,24 @@ def get_dashboard_stats():
                 'platform': job.get('platform'),
                 'ads_fetched': job.get('ads_fetched', 0),
                 'created_at': job.get('created_at'),
-                'status_icon': '✅' if job.get('status') == 'completed' else '🔄' if job.get('status') == 'running' else '❌' if job.get('status') == 'failed' else '⏳'
+                'status_icon': STATUS_ICONS.get(job.get('status'), '⏳')
             }
             formatted_activity.append(formatted_job)
         
         stats = {
             'jobs': {
-                'total': total_jobs.count if total_jobs.count else 0,
-                'today': today_jobs.count if today_jobs.count else 0,
-                'completed': completed_jobs.count if completed_jobs.count else 0,
-                'running': running_jobs.count if running_jobs.count else 0,
-                'success_rate': (completed_jobs.count / total_jobs.count * 100) if total_jobs.count and total_jobs.count > 0 else 0
+                'total': total_jobs,
+                'today': job_stats['today'],
+                'completed': completed_jobs,
+                'running': job_stats['running'],
+                'success_rate': (completed_jobs / total_jobs * 100) if total_jobs > 0 else 0
             },
             'ads': {
                 'total_in_database': total_ads,
                 'total_spend': total_spend,
                 'total_impressions': total_impressions,
                 'total_fetched': total_ads_fetched,
-                'average_per_job': total_ads_fetched / completed_jobs.count if completed_jobs.count and completed_jobs.count > 0 else 0,
+                'average_per_job': total_ads_fetched / completed_jobs if completed_jobs > 0 else 0,
                 'data_source': 'daily_metrics table'
             },
             'competitors': {
@@ -756,6 +898,9 @@ def cleanup_stuck_jobs():
         
         cleaned_count = len(update_response.data) if update_response.data else 0
         
+        for job in update_response.data or []:
+            status_manager.publish(job['job_id'], job)
+        
         return jsonify({
             'message': f'Cleaned up {cleaned_count} stuck jobs',
             'cleaned': cleaned_count,
@@ -26,6 +26,9 @@ supabase: Client = create_client(url, key)
 
 # Add parent directory to path to import middleware
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Competitor writes bump the analytics data version (database trigger);
+# forgetting the mirrored version lets this process see the bump at once
+from AdSurveillance.analytics.response_cache import data_versions
 
 try:
     from middleware.auth import token_required
@@ -173,6 +176,7 @@ def add_competitor():
         
         if response.data and len(response.data) > 0:
             print(f"✅ Competitor added: {response.data[0]['id']}")
+            data_versions.invalidate(user_id)
             return jsonify({
                 'success': True,
                 'message': 'Competitor added successfully',
@@ -230,6 +234,7 @@ def delete_competitor(competitor_id):
         
         if response.data:
             print(f"✅ Competitor '{competitor_name}' deleted")
+            data_versions.invalidate(user_id)
             return jsonify({
                 'success': True,
                 'message': f'Competitor "{competitor_name}" deleted successfully'
@@ -298,6 +303,7 @@ def update_competitor(competitor_id):
             .execute()
         
         if response.data:
+            data_versions.invalidate(user_id)
             return jsonify({
                 'success': True,
                 'message': 'Competitor updated successfully',
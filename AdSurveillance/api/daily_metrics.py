@@ -15,6 +15,9 @@ competitors_bp = Blueprint('competitors', __name__)
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import Config
+# Competitor writes bump the analytics data version (database trigger);
+# forgetting the mirrored version lets this process see the bump at once
+from AdSurveillance.analytics.response_cache import data_versions
 
 # Initialize Supabase
 try:
@@ -164,6 +167,7 @@ def add_competitor():
         
         if response.data and len(response.data) > 0:
             print(f"✅ Competitor added: {response.data[0]['id']}")
+            data_versions.invalidate(user_id)
             return jsonify({
                 'success': True,
                 'message': 'Competitor added successfully',
@@ -223,6 +227,7 @@ def delete_competitor(competitor_id):
         
         if response.data:
             print(f"✅ Competitor '{competitor_name}' deleted")
+            data_versions.invalidate(user_id)
             return jsonify({
                 'success': True,
                 'message': f'Competitor "{competitor_name}" deleted successfully'
@@ -293,6 +298,7 @@ def update_competitor(competitor_id):
             .execute()
         
         if response.data:
+            data_versions.invalidate(user_id)
             return jsonify({
                 'success': True,
                 'message': 'Competitor updated successfully',
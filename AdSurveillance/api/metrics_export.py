@@ -0,0 +1,343 @@
+"""
+Metrics export endpoint for AdSurveillance
+Flask Blueprint Version for Unified Deployment
+Streams a user's daily_metrics as CSV or NDJSON and serves Parquet snapshots
+"""
+import os
+import sys
+import csv
+import io
+import json
+import zlib
+import threading
+from flask import Blueprint, request, jsonify, Response, stream_with_context, send_file
+from datetime import datetime, date
+from supabase import create_client, Client
+import traceback
+
+# Create Flask Blueprint
+metrics_export_bp = Blueprint('metrics_export', __name__)
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+from AdSurveillance.analytics.rollups import fetch_keyset_pages
+from AdSurveillance.analytics.snapshots import snapshot_store, HAS_PYARROW, MONTH_PATTERN
+from AdSurveillance.service_metrics import metrics
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+# Columns read from daily_metrics, in export order (competitor_name comes from competitors)
+EXPORT_FIELDS = (
+    'id', 'date', 'competitor_id', 'platform', 'ad_id',
+    'daily_spend', 'daily_impressions', 'daily_clicks', 'daily_ctr',
+    'spend_lower_bound', 'spend_upper_bound', 'impressions_lower_bound', 'impressions_upper_bound',
+    'creative', 'created_at'
+)
+EXPORT_COLUMNS = EXPORT_FIELDS[:3] + ('competitor_name',) + EXPORT_FIELDS[3:]
+
+# Initialize Supabase
+try:
+    supabase: Client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+except Exception as e:
+    print(f"❌ Supabase initialization error: {e}")
+    supabase = None
+
+snapshot_store.supabase = supabase
+
+# Import auth middleware
+try:
+    from AdSurveillance.middleware.auth import token_required
+    print("✅ Middleware auth imported successfully")
+except ImportError as e:
+    print(f"❌ Could not import middleware.auth: {e}")
+
+    # Fallback to basic auth decorator
+    import jwt
+    from functools import wraps
+
+    SECRET_KEY = os.environ.get("SECRET_KEY", "fallback-secret-key")
+
+    def token_required(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            token = None
+            auth_header = request.headers.get('Authorization')
+            if auth_header and auth_header.startswith('Bearer '):
+                token = auth_header.split(' ')[1]
+
+            if not token:
+                return jsonify({'error': 'Token missing'}), 401
+
+            try:
+                payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+                request.user_id = payload.get('user_id')
+            except:
+                return jsonify({'error': 'Invalid token'}), 401
+
+            return f(*args, **kwargs)
+        return decorated
+
+def iter_metric_pages(competitor_ids, start_date=None, end_date=None, page_size=None):
+    """
+    Pages of daily_metrics in id order, by keyset pagination
+
+    Yields:
+        Lists of rows (EXPORT_FIELDS)
+    """
+    def build_query():
+        query = supabase.table("daily_metrics")\
+            .select(', '.join(EXPORT_FIELDS))\
+            .in_("competitor_id", competitor_ids)
+        if start_date:
+            query = query.gte("date", start_date)
+        if end_date:
+            query = query.lte("date", end_date)
+        return query
+
+    return fetch_keyset_pages(build_query, page_size or Config.EXPORT_PAGE_SIZE)
+
+def format_csv(rows, names, header=False):
+    """Rows as CSV text, with competitor names filled in"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow([
+            names.get(row.get('competitor_id'), '') if column == 'competitor_name' else row.get(column)
+            for column in EXPORT_COLUMNS
+        ])
+    return buffer.getvalue()
+
+def format_ndjson(rows, names):
+    """Rows as newline-delimited JSON, with competitor names filled in"""
+    lines = []
+    for row in rows:
+        record = {column: row.get(column) for column in EXPORT_FIELDS}
+        record['competitor_name'] = names.get(row.get('competitor_id'))
+        lines.append(json.dumps(record, default=str, separators=(',', ':')))
+    return '\n'.join(lines) + '\n' if lines else ''
+
+def parse_export_date(value, name):
+    """
+    Optional YYYY-MM-DD query value
+
+    Raises:
+        ValueError: Not a date
+    """
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"'{name}' must be a date (YYYY-MM-DD)")
+
+@metrics_export_bp.route('/export', methods=['GET'])
+@token_required
+def export_metrics():
+    """
+    Stream the user's daily metrics
+
+    Query params:
+        format: csv or ndjson (default csv)
+        from: First date, YYYY-MM-DD (optional)
+        to: Last date, YYYY-MM-DD (optional)
+
+    The body is gzip-compressed when the client accepts it; every page is
+    flushed as it is written, so memory stays at one page and the first
+    bytes are sent before the first query finishes.
+    """
+    if not supabase:
+        return jsonify({'error': 'Database not configured'}), 500
+
+    user_id = request.user_id
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}"
+        }), 400
+
+    try:
+        start_date = parse_export_date(request.args.get('from'), 'from')
+        end_date = parse_export_date(request.args.get('to'), 'to')
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    # Every competitor the user has had, so history of removed ones is exported too
+    try:
+        competitors_response = supabase.table("competitors")\
+            .select("id, name")\
+            .eq("user_id", user_id)\
+            .execute()
+    except Exception as e:
+        print(f"❌ Error starting metrics export: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+    names = {comp['id']: comp.get('name') for comp in (competitors_response.data or [])}
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+    def generate():
+        # gzip container (wbits 31); a sync flush after every page lets the
+        # client decompress what has arrived so far
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+        def emit(text):
+            data = text.encode('utf-8')
+            if compressor:
+                return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            return data
+
+        exported = 0
+        try:
+            yield emit(format_csv([], names, header=True) if export_format == 'csv' else '')
+
+            if names:
+                for rows in iter_metric_pages(list(names), start_date, end_date):
+                    if export_format == 'csv':
+                        yield emit(format_csv(rows, names))
+                    else:
+                        yield emit(format_ndjson(rows, names))
+                    exported += len(rows)
+        except Exception as e:
+            # Headers are already sent; NDJSON clients get an error record, then the
+            # re-raise aborts the chunked response so a truncated CSV can't pass as complete
+            print(f"❌ Metrics export for user {user_id} failed after {exported} rows: {str(e)}")
+            traceback.print_exc()
+            metrics.incr('export.errors')
+            if export_format == 'ndjson':
+                yield emit(json.dumps({'error': str(e)}) + '\n')
+            raise
+        finally:
+            metrics.incr('export.rows', exported)
+
+        if compressor:
+            yield compressor.flush()
+
+    filename = f"adsurveillance-metrics-{datetime.now().strftime('%Y%m%d')}.{export_format}"
+    headers = {
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    }
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+        headers=headers
+    )
+
+def refresh_snapshot(user_id, full):
+    """Background snapshot refresh (errors are logged, the manifest is left as it was)"""
+    try:
+        snapshot_store.refresh_user(user_id, full)
+    except Exception as e:
+        print(f"❌ Snapshot refresh for user {user_id} failed: {str(e)}")
+        traceback.print_exc()
+        metrics.incr('snapshots.errors')
+
+@metrics_export_bp.route('/snapshots', methods=['GET'])
+@token_required
+def list_snapshots():
+    """
+    The user's Parquet snapshot partitions
+
+    Each partition is one month of daily_metrics, downloadable from
+    /metrics/snapshots/<YYYY-MM>.parquet
+    """
+    if not HAS_PYARROW:
+        return jsonify({'success': False, 'error': 'Parquet snapshots are not available (pyarrow not installed)'}), 503
+
+    user_id = request.user_id
+    manifest = snapshot_store.manifest(user_id)
+    partitions = (manifest or {}).get('partitions', {})
+
+    return jsonify({
+        'success': True,
+        'data': {
+            'refreshed_at': (manifest or {}).get('refreshed_at'),
+            'refreshing': snapshot_store.is_refreshing(user_id),
+            'total_rows': (manifest or {}).get('total_rows', 0),
+            'jobs': (manifest or {}).get('jobs'),
+            'partitions': [
+                {
+                    'month': month,
+                    'rows': entry['rows'],
+                    'bytes': entry.get('bytes'),
+                    'written_at': entry.get('written_at'),
+                    'url': f"{request.script_root}{request.path.rstrip('/')}/{month}.parquet"
+                }
+                for month, entry in sorted(partitions.items())
+            ]
+        }
+    }), 200
+
+@metrics_export_bp.route('/snapshots/refresh', methods=['POST'])
+@token_required
+def refresh_snapshots():
+    """
+    Start refreshing the user's snapshot
+
+    Query params:
+        full: true to rewrite every month (default: only months with new metrics)
+    """
+    if not HAS_PYARROW:
+        return jsonify({'success': False, 'error': 'Parquet snapshots are not available (pyarrow not installed)'}), 503
+    if not supabase:
+        return jsonify({'error': 'Database not configured'}), 500
+
+    user_id = request.user_id
+    if snapshot_store.is_refreshing(user_id):
+        return jsonify({
+            'success': False,
+            'error': 'A snapshot refresh is already running'
+        }), 409
+
+    full = request.args.get('full', 'false').lower() == 'true'
+    threading.Thread(target=refresh_snapshot, args=(user_id, full), daemon=True).start()
+
+    return jsonify({
+        'success': True,
+        'message': 'Snapshot refresh started',
+        'full': full
+    }), 202
+
+@metrics_export_bp.route('/snapshots/<month>.parquet', methods=['GET'])
+@token_required
+def download_snapshot(month):
+    """
+    Download one month's partition
+
+    Supports conditional and Range requests (206 Partial Content), so
+    Parquet readers can fetch the footer and single row groups.
+    """
+    if not HAS_PYARROW:
+        return jsonify({'success': False, 'error': 'Parquet snapshots are not available (pyarrow not installed)'}), 503
+    if not MONTH_PATTERN.match(month):
+        return jsonify({'success': False, 'error': 'month must be YYYY-MM'}), 400
+
+    user_id = request.user_id
+    manifest = snapshot_store.manifest(user_id) or {}
+    path = snapshot_store.partition_path(user_id, month)
+    if month not in manifest.get('partitions', {}) or not os.path.exists(path):
+        return jsonify({'success': False, 'error': 'Snapshot partition not found'}), 404
+
+    metrics.incr('snapshots.downloads')
+    return send_file(
+        os.path.abspath(path),
+        mimetype='application/vnd.apache.parquet',
+        as_attachment=True,
+        download_name=f"adsurveillance-metrics-{month}.parquet",
+        conditional=True,
+        max_age=0
+    )
@@ -10,6 +10,7 @@ from datetime import datetime, timedelta
 from supabase import create_client, Client
 import traceback
 import random
+from collections import Counter
 
 # Create Flask Blueprint
 targeting_intel_bp = Blueprint('targeting_intel', __name__)
@@ -17,6 +18,24 @@ targeting_intel_bp = Blueprint('targeting_intel', __name__)
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import Config
+from AdSurveillance.analytics.anomalies import ALERTS_TABLE
+from AdSurveillance.analytics.keyword_index import keyword_index, tokenize
+from AdSurveillance.analytics.metrics_frame import safe_divide
+from AdSurveillance.analytics.prefix_sums import prefix_sums
+from AdSurveillance.analytics.response_cache import cached_response
+from AdSurveillance.analytics.rollups import load_metrics_frame
+
+# Keywords /audience-insights ranks
+TOP_KEYWORDS = 20
+
+# Keywords shown when no creative text has been collected yet
+DEFAULT_KEYWORDS = [
+    {'keyword': 'technology', 'frequency': 15},
+    {'keyword': 'business', 'frequency': 12},
+    {'keyword': 'solution', 'frequency': 10},
+    {'keyword': 'growth', 'frequency': 8},
+    {'keyword': 'innovation', 'frequency': 7}
+]
 
 # Initialize Supabase
 try:
@@ -70,6 +89,7 @@ def health():
 
 @targeting_intel_bp.route('/audience-insights', methods=['GET'])
 @token_required
+@cached_response('targeting.audience-insights')
 def get_audience_insights():
     """Get audience insights for the user's competitors"""
     try:
@@ -96,23 +116,31 @@ def get_audience_insights():
         competitor_names = [c['name'] for c in competitors_response.data]
         industries = list(set([c.get('industry') for c in competitors_response.data if c.get('industry')]))
         
-        # Get ads data from daily_metrics to analyze targeting
-        ads_response = supabase.table("daily_metrics")\
-            .select("competitor_id, platform, creative")\
-            .in_("competitor_id", competitor_ids)\
-            .limit(50)\
-            .execute()
-        
-        ads_data = ads_response.data if ads_response.data else []
-        
-        # Analyze creatives for keywords (simple text analysis)
-        all_keywords = analyze_creatives_for_keywords([ad.get('creative', '') for ad in ads_data])
-        
-        # Get platform distribution
-        platforms = {}
-        for ad in ads_data:
-            platform = ad.get('platform', 'unknown')
-            platforms[platform] = platforms.get(platform, 0) + 1
+        # Keywords and platforms across every creative, from the user's keyword index
+        index = keyword_index.get(user_id)
+        if index is not None:
+            all_keywords = index.top_keywords(TOP_KEYWORDS, competitor_ids) or DEFAULT_KEYWORDS
+            platforms = index.platforms(competitor_ids)
+            ads_analyzed = index.creative_count(competitor_ids)
+        else:
+            # Index unavailable: sample ads from daily_metrics to analyze targeting
+            ads_response = supabase.table("daily_metrics")\
+                .select("competitor_id, platform, creative")\
+                .in_("competitor_id", competitor_ids)\
+                .limit(50)\
+                .execute()
+            
+            ads_data = ads_response.data if ads_response.data else []
+            
+            # Analyze creatives for keywords (simple text analysis)
+            all_keywords = analyze_creatives_for_keywords([ad.get('creative', '') for ad in ads_data])
+            
+            # Get platform distribution
+            platforms = {}
+            for ad in ads_data:
+                platform = ad.get('platform', 'unknown')
+                platforms[platform] = platforms.get(platform, 0) + 1
+            ads_analyzed = len(ads_data)
         
         # Generate audience insights
         insights = {
@@ -123,16 +151,16 @@ def get_audience_insights():
             'top_keywords': all_keywords[:10],
             'platform_distribution': platforms,
             'competitors_analyzed': competitor_names,
-            'sample_size': len(ads_data),
+            'sample_size': ads_analyzed,
             'industries_targeted': industries,
-            'confidence_score': calculate_confidence_score(len(ads_data), len(competitor_ids))
+            'confidence_score': calculate_confidence_score(ads_analyzed, len(competitor_ids))
         }
         
         return jsonify({
             'success': True,
             'data': insights,
             'competitor_count': len(competitor_ids),
-            'ads_analyzed': len(ads_data)
+            'ads_analyzed': ads_analyzed
         }), 200
         
     except Exception as e:
@@ -146,38 +174,15 @@ def get_audience_insights():
         }), 200
 
 def analyze_creatives_for_keywords(creatives):
-    """Simple keyword extraction from creative texts"""
-    keywords = []
-    common_words = ['the', 'and', 'for', 'with', 'this', 'that', 'your', 'you', 'are', 'get', 'free', 'now', 'best', 'new']
-    
+    """Simple keyword extraction from creative texts (counts every occurrence)"""
+    keyword_counts = Counter()
     for creative in creatives:
-        if not creative:
-            continue
-        
-        # Convert to lowercase and split
-        words = creative.lower().split()
-        for word in words:
-            # Remove punctuation and check if meaningful
-            word = word.strip('.,!?;:"\'()[]{}')
-            if (len(word) > 3 and 
-                word not in common_words and 
-                word.isalpha() and 
-                word not in keywords):
-                keywords.append(word)
-    
-    # Count frequency and return top keywords
-    from collections import Counter
-    if keywords:
-        keyword_counts = Counter(keywords)
-        return [{'keyword': k, 'frequency': v} for k, v in keyword_counts.most_common(20)]
-    
-    return [
-        {'keyword': 'technology', 'frequency': 15},
-        {'keyword': 'business', 'frequency': 12},
-        {'keyword': 'solution', 'frequency': 10},
-        {'keyword': 'growth', 'frequency': 8},
-        {'keyword': 'innovation', 'frequency': 7}
-    ]
+        keyword_counts.update(tokenize(creative))
+    
+    if keyword_counts:
+        return [{'keyword': k, 'frequency': v} for k, v in keyword_counts.most_common(TOP_KEYWORDS)]
+    
+    return DEFAULT_KEYWORDS
 
 def generate_primary_audiences(industries, keywords):
     """Generate primary audience segments"""
@@ -410,6 +415,7 @@ def generate_default_audience_insights():
 
 @targeting_intel_bp.route('/competitive-analysis', methods=['GET'])
 @token_required
+@cached_response('targeting.competitive-analysis')
 def get_competitive_analysis():
     """Get competitive analysis based on ads data"""
     try:
@@ -433,32 +439,40 @@ def get_competitive_analysis():
             }), 200
         
         competitor_ids = [c['id'] for c in competitors_response.data]
+        start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
         
-        # Get ads data for analysis
-        ads_response = supabase.table("daily_metrics")\
-            .select("competitor_id, platform, daily_spend, daily_impressions, daily_ctr, creative, date")\
+        # Spend, platform and volume figures come from the prefix sums, else the daily rollups
+        frame = prefix_sums.window_frame(
+            user_id, competitor_ids, datetime.now().date() - timedelta(days=30), datetime.now().date()
+        )
+        if frame is None:
+            frame = load_metrics_frame(supabase, user_id, competitor_ids, start_date=start_date)
+        
+        # Creative text isn't rolled up, so only that column is read from the raw rows
+        creatives_response = supabase.table("daily_metrics")\
+            .select("creative")\
             .in_("competitor_id", competitor_ids)\
-            .gte("date", (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))\
+            .gte("date", start_date)\
             .execute()
         
-        ads_data = ads_response.data if ads_response.data else []
+        creatives = creatives_response.data if creatives_response.data else []
         
         # Analyze competitive landscape
         analysis = {
-            'market_coverage': analyze_market_coverage(competitors_response.data, ads_data),
-            'spending_patterns': analyze_spending_patterns(ads_data),
-            'creative_strategies': analyze_creative_strategies(ads_data),
-            'platform_effectiveness': analyze_platform_effectiveness(ads_data),
-            'opportunity_areas': identify_opportunity_areas(ads_data, competitors_response.data),
-            'competitive_intensity': calculate_competitive_intensity(ads_data),
-            'trends': identify_trends(ads_data)
+            'market_coverage': analyze_market_coverage(competitors_response.data, frame),
+            'spending_patterns': analyze_spending_patterns(frame),
+            'creative_strategies': analyze_creative_strategies(creatives),
+            'platform_effectiveness': analyze_platform_effectiveness(frame),
+            'opportunity_areas': identify_opportunity_areas(frame, competitors_response.data),
+            'competitive_intensity': calculate_competitive_intensity(frame),
+            'trends': identify_trends(frame)
         }
         
         return jsonify({
             'success': True,
             'data': analysis,
             'competitors_analyzed': len(competitor_ids),
-            'ads_analyzed': len(ads_data),
+            'ads_analyzed': int(frame.count.sum()),
             'time_period': '30 days'
         }), 200
         
@@ -470,18 +484,19 @@ def get_competitive_analysis():
             'error': str(e)
         }), 200
 
-def analyze_market_coverage(competitors, ads_data):
+def analyze_market_coverage(competitors, frame):
     """Analyze market coverage by competitors"""
     return {
         'total_market_presence': len(competitors),
-        'active_competitors': len(set(ad['competitor_id'] for ad in ads_data)),
+        'active_competitors': len(frame.competitor_ids),
         'market_segments': list(set(c.get('industry', 'General') for c in competitors if c.get('industry'))),
         'coverage_score': round(min(100, len(competitors) * 10), 1)
     }
 
-def analyze_spending_patterns(ads_data):
+def analyze_spending_patterns(frame):
     """Analyze spending patterns"""
-    if not ads_data:
+    total = int(frame.count.sum())
+    if not total:
         return {
             'total_spend': 0,
             'avg_daily_spend': 0,
@@ -489,20 +504,16 @@ def analyze_spending_patterns(ads_data):
             'trend': 'stable'
         }
     
-    total_spend = sum(float(ad.get('daily_spend', 0) or 0) for ad in ads_data)
-    avg_spend = total_spend / len(ads_data) if ads_data else 0
+    total_spend = float(frame.spend.sum())
+    avg_spend = total_spend / total
     
-    # Categorize spending
-    spends = [float(ad.get('daily_spend', 0) or 0) for ad in ads_data]
-    low = sum(1 for s in spends if s < 100)
-    medium = sum(1 for s in spends if 100 <= s < 1000)
-    high = sum(1 for s in spends if s >= 1000)
+    # Categorize spending (ads per daily spend band)
+    low, medium, high = frame.bands.sum(axis=0).tolist()
     
-    total = len(spends)
     distribution = {
-        'low': round(low / total * 100, 1) if total > 0 else 0,
-        'medium': round(medium / total * 100, 1) if total > 0 else 0,
-        'high': round(high / total * 100, 1) if total > 0 else 0
+        'low': round(low / total * 100, 1),
+        'medium': round(medium / total * 100, 1),
+        'high': round(high / total * 100, 1)
     }
     
     return {
@@ -541,49 +552,36 @@ def analyze_creative_strategies(ads_data):
     
     return strategies
 
-def analyze_platform_effectiveness(ads_data):
+def analyze_platform_effectiveness(frame):
     """Analyze which platforms are most effective"""
-    platform_data = {}
-    
-    for ad in ads_data:
-        platform = ad.get('platform', 'unknown')
-        if platform not in platform_data:
-            platform_data[platform] = {
-                'spend': 0,
-                'impressions': 0,
-                'clicks': 0,
-                'count': 0
-            }
-        
-        platform_data[platform]['spend'] += float(ad.get('daily_spend', 0) or 0)
-        platform_data[platform]['impressions'] += int(ad.get('daily_impressions', 0) or 0)
-        platform_data[platform]['count'] += 1
+    totals = frame.group_totals('platform')
+    total_spend = float(totals['spend'].sum())
+    cpm = safe_divide(totals['spend'], totals['impressions'], 1000)
     
     # Calculate effectiveness scores
     effectiveness = []
-    for platform, data in platform_data.items():
-        if data['impressions'] > 0:
-            cpm = (data['spend'] / data['impressions']) * 1000
-            score = max(1, min(100, 100 - cpm))  # Lower CPM = higher score
+    for code, platform in enumerate(frame.platforms):
+        if totals['impressions'][code] > 0:
+            score = max(1, min(100, 100 - float(cpm[code])))  # Lower CPM = higher score
         else:
             score = 50
         
         effectiveness.append({
             'platform': platform,
             'effectiveness_score': round(score, 1),
-            'spend_share': round(data['spend'] / sum(d['spend'] for d in platform_data.values()) * 100, 1) if sum(d['spend'] for d in platform_data.values()) > 0 else 0,
-            'ads_count': data['count']
+            'spend_share': round(float(totals['spend'][code]) / total_spend * 100, 1) if total_spend > 0 else 0,
+            'ads_count': int(totals['count'][code])
         })
     
     return sorted(effectiveness, key=lambda x: x['effectiveness_score'], reverse=True)
 
-def identify_opportunity_areas(ads_data, competitors):
+def identify_opportunity_areas(frame, competitors):
     """Identify opportunity areas based on gaps"""
     opportunities = []
     
     # Check for underserved platforms
     all_platforms = ['meta', 'facebook', 'instagram', 'linkedin', 'google', 'tiktok']
-    used_platforms = set(ad.get('platform', '').lower() for ad in ads_data)
+    used_platforms = set((platform or '').lower() for platform in frame.platforms)
     unused_platforms = [p for p in all_platforms if p not in used_platforms]
     
     if unused_platforms:
@@ -595,7 +593,7 @@ def identify_opportunity_areas(ads_data, competitors):
         })
     
     # Check for creative strategy gaps
-    if len(ads_data) < 10:
+    if frame.count.sum() < 10:
         opportunities.append({
             'type': 'content_gap',
             'description': 'Limited creative variety in current ads',
@@ -605,14 +603,14 @@ def identify_opportunity_areas(ads_data, competitors):
     
     return opportunities
 
-def calculate_competitive_intensity(ads_data):
+def calculate_competitive_intensity(frame):
     """Calculate competitive intensity score"""
-    if not ads_data:
+    total_ads = int(frame.count.sum())
+    if not total_ads:
         return {'score': 30, 'level': 'low', 'description': 'Limited competition detected'}
     
     # Simple scoring based on ad volume and diversity
-    unique_competitors = len(set(ad.get('competitor_id') for ad in ads_data))
-    total_ads = len(ads_data)
+    unique_competitors = len(frame.competitor_ids)
     
     score = min(100, (unique_competitors * 15) + (total_ads / 10))
     
@@ -628,9 +626,10 @@ def calculate_competitive_intensity(ads_data):
     
     return {'score': round(score, 1), 'level': level, 'description': desc}
 
-def identify_trends(ads_data):
+def identify_trends(frame):
     """Identify trends in advertising"""
-    if not ads_data or len(ads_data) < 5:
+    total_ads = int(frame.count.sum())
+    if total_ads < 5:
         return {
             'emerging_formats': ['Video content', 'Interactive ads'],
             'content_themes': ['Value-driven messaging', 'Problem-solution approach'],
@@ -646,7 +645,7 @@ def identify_trends(ads_data):
             'Increased AR/VR experimentation',
             'More personalized retargeting'
         ],
-        'data_based': len(ads_data) >= 10
+        'data_based': total_ads >= 10
     }
 
 def generate_default_competitive_analysis():
@@ -778,6 +777,75 @@ def get_recommendations():
             'error': str(e)
         }), 500
 
+@targeting_intel_bp.route('/alerts', methods=['GET'])
+@token_required
+@cached_response('targeting.alerts')
+def get_spend_alerts():
+    """
+    Recent spend anomalies of the user's competitors
+    
+    Query params:
+        days: Alerts for the last N days (default 30, max 365)
+        platform: Only this platform (optional)
+        competitor_id: Only this competitor (optional)
+        direction: spike or drop (optional)
+        limit: Most alerts returned (default 100, max 500)
+    """
+    try:
+        if not supabase:
+            return jsonify({'error': 'Database not configured'}), 500
+        
+        user_id = request.user_id
+        try:
+            days = min(max(int(request.args.get('days', 30)), 1), 365)
+            limit = min(max(int(request.args.get('limit', 100)), 1), 500)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': "'days' and 'limit' must be integers"
+            }), 400
+        
+        direction = request.args.get('direction')
+        if direction and direction not in ('spike', 'drop'):
+            return jsonify({
+                'success': False,
+                'error': "direction must be 'spike' or 'drop'"
+            }), 400
+        
+        start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        query = supabase.table(ALERTS_TABLE)\
+            .select("competitor_id,competitor_name,platform,date,spend,baseline_median,baseline_mad,"
+                    "z_score,direction,change_pct,detected_at")\
+            .eq("user_id", user_id)\
+            .gte("date", start_date)
+        if request.args.get('platform'):
+            query = query.eq("platform", request.args['platform'])
+        if request.args.get('competitor_id'):
+            query = query.eq("competitor_id", request.args['competitor_id'])
+        if direction:
+            query = query.eq("direction", direction)
+        
+        alerts = query.order("date", desc=True).order("detected_at", desc=True).limit(limit).execute().data or []
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'alerts': alerts,
+                'spikes': sum(1 for alert in alerts if alert['direction'] == 'spike'),
+                'drops': sum(1 for alert in alerts if alert['direction'] == 'drop')
+            },
+            'days': days,
+            'threshold': Config.ANOMALY_Z_THRESHOLD
+        }), 200
+        
+    except Exception as e:
+        print(f"❌ Error getting spend alerts: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 # For backward compatibility
 if __name__ == '__main__':
     from flask import Flask
@@ -7,6 +7,7 @@ import sys
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta
 from supabase import create_client, Client
+import numpy as np
 import traceback
 
 # Create Flask Blueprint
@@ -15,6 +16,27 @@ user_analytics_bp = Blueprint('user_analytics', __name__)
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import Config
+from AdSurveillance.analytics.binning import bin_bounds, bin_totals, money_label, parse_bins, percent_label
+from AdSurveillance.analytics.metrics_frame import MetricsFrame, safe_divide, top_indices
+from AdSurveillance.analytics.prefix_sums import prefix_sums
+from AdSurveillance.analytics.query import parse_query, run_query
+from AdSurveillance.analytics.response_cache import cached_response, data_versions
+from AdSurveillance.analytics.rollups import load_metrics_frame, load_metric_digests, stream_metrics_frame
+from AdSurveillance.analytics.sketches import SKETCH_METRICS, TDigest, percentile_summary
+from AdSurveillance.analytics.trends import choose_resolution, daily_series, trend_points, series_cache
+from AdSurveillance.analytics.comparison import (
+    CURRENT, baseline_window, build_comparison, combined_windows, parse_compare, row_periods
+)
+from AdSurveillance.analytics.sql_engine import sql_engine, QueryError, QueryTimeout, SnapshotMissing
+
+# Sections /bundle can return
+BUNDLE_PARTS = ('summary', 'competitor-spend', 'platform-performance', 'trends')
+
+# ctrPerformance tiers, lowest first, when the CTR bins are five fixed brackets
+CTR_TIER_NAMES = ('Poor', 'Average', 'Good', 'Excellent', 'Outstanding')
+
+# Percentiles /distributions returns when none are requested
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90, 95, 99)
 
 # Initialize Supabase
 try:
@@ -68,14 +90,30 @@ def health():
 
 @user_analytics_bp.route('/summary', methods=['GET'])
 @token_required
+@cached_response('analytics.summary')
 def get_user_analytics_summary():
-    """Get analytics summary for the logged-in user"""
+    """
+    Get analytics summary for the logged-in user
+
+    Query params:
+        spend_bins: spendRanges bins by average spend per ad, as comma-separated
+                    edges, 'log:N' or 'quantile:N' (default SPEND_RANGE_BINS)
+        ctr_bins: ctrPerformance bins by CTR, same forms (default CTR_PERFORMANCE_BINS)
+    """
     try:
         if not supabase:
             return jsonify({'error': 'Database not configured'}), 500
             
         user_id = request.user_id
         
+        try:
+            bins = parse_summary_bins(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         # Get user's competitors
         competitors_response = (
             supabase.table("competitors")
@@ -86,66 +124,24 @@ def get_user_analytics_summary():
         )
         
         competitor_ids = [comp['id'] for comp in competitors_response.data]
-        competitor_names = [comp['name'] for comp in competitors_response.data]
         
         if not competitor_ids:
             return jsonify({
                 'success': True,
-                'data': {
-                    'summary': None,
-                    'analytics': {
-                        'competitorSpend': [],
-                        'spendRanges': [],
-                        'ctrPerformance': [],
-                        'spendImpressions': [],
-                        'platformCTR': []
-                    },
-                    'totalCompetitors': 0,
-                    'totalSpend': 0,
-                    'competitorNames': []
-                }
+                'data': build_summary(None, competitors_response.data, None, bins)
             }), 200
         
         # Get summary metrics for user
-        summary_response = (
-            supabase.table("summary_metrics")
-            .select("*")
-            .eq("user_id", user_id)
-            .order("period_end_date", desc=True)
-            .limit(1)
-            .execute()
-        )
+        summary_data = get_summary_row(user_id)
         
-        summary_data = summary_response.data[0] if summary_response.data else None
-        
-        # Get daily metrics for user's competitors (last 30 days)
+        # Every metric of the last 30 days, reduced page by page to per-competitor/platform totals
         thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
         
-        daily_response = (
-            supabase.table("daily_metrics")
-            .select("*")
-            .in_("competitor_id", competitor_ids)
-            .gte("date", thirty_days_ago)
-            .order("date", desc=True)
-            .limit(100)
-            .execute()
-        )
-        
-        # Calculate analytics from daily metrics
-        analytics = calculate_user_analytics(daily_response.data, competitors_response.data)
-        
-        # Calculate total spend from competitors
-        total_spend = sum([comp['estimated_monthly_spend'] or 0 for comp in competitors_response.data])
+        frame = stream_metrics_frame(supabase, user_id, competitor_ids, start_date=thirty_days_ago)
         
         return jsonify({
             'success': True,
-            'data': {
-                'summary': summary_data,
-                'analytics': analytics,
-                'totalCompetitors': len(competitor_ids),
-                'totalSpend': total_spend,
-                'competitorNames': competitor_names
-            }
+            'data': build_summary(frame, competitors_response.data, summary_data, bins)
         }), 200
         
     except Exception as e:
@@ -156,9 +152,126 @@ def get_user_analytics_summary():
             'error': str(e)
         }), 500
 
-def calculate_user_analytics(daily_metrics, competitors_data):
-    """Calculate analytics from daily metrics"""
-    if not daily_metrics:
+def get_summary_row(user_id):
+    """Latest summary_metrics row of a user (or None)"""
+    summary_response = (
+        supabase.table("summary_metrics")
+        .select("*")
+        .eq("user_id", user_id)
+        .order("period_end_date", desc=True)
+        .limit(1)
+        .execute()
+    )
+    
+    return summary_response.data[0] if summary_response.data else None
+
+def build_summary(frame, competitors_data, summary_data, bins=None):
+    """
+    Data of the /summary response for a user's active competitors
+
+    bins holds the spend_bins and ctr_bins of parse_summary_bins.
+    """
+    if not competitors_data:
+        return {
+            'summary': None,
+            'analytics': {
+                'competitorSpend': [],
+                'spendRanges': [],
+                'ctrPerformance': [],
+                'spendImpressions': [],
+                'platformCTR': []
+            },
+            'totalCompetitors': 0,
+            'totalSpend': 0,
+            'competitorNames': []
+        }
+    
+    # Calculate analytics from daily metrics
+    analytics = calculate_user_analytics(frame, competitors_data, **(bins or {}))
+    
+    # Calculate total spend from competitors
+    total_spend = sum([comp['estimated_monthly_spend'] or 0 for comp in competitors_data])
+    
+    return {
+        'summary': summary_data,
+        'analytics': analytics,
+        'totalCompetitors': len(competitors_data),
+        'totalSpend': total_spend,
+        'competitorNames': [comp['name'] for comp in competitors_data]
+    }
+
+def parse_summary_bins(args):
+    """
+    spendRanges and ctrPerformance bins from the spend_bins and ctr_bins query params
+
+    Raises:
+        ValueError: A malformed bin spec
+    """
+    return {
+        'spend_bins': parse_bins(args.get('spend_bins'), Config.SPEND_RANGE_BINS),
+        'ctr_bins': parse_bins(args.get('ctr_bins'), Config.CTR_PERFORMANCE_BINS)
+    }
+
+def build_competitor_spend(frame, limit):
+    """Competitors by total spend, highest first"""
+    totals = frame.group_totals('competitor')
+    
+    result = []
+    for code in top_indices(totals['spend'], limit):
+        result.append({
+            'competitor_name': frame.competitor_name(code),
+            'total_spend': float(totals['spend'][code]),
+            'ad_count': int(totals['count'][code]),
+            'avg_ctr': float(totals['avg_ctr'][code])
+        })
+    return result
+
+def build_platform_performance(frame):
+    """Per-platform totals, CTR, CPM and average spend (platforms with impressions)"""
+    totals = frame.group_totals('platform')
+    
+    cpm = safe_divide(totals['spend'], totals['impressions'], 1000)
+    avg_spend = safe_divide(totals['spend'], totals['count'])
+    
+    result = []
+    for code in np.flatnonzero(totals['impressions'] > 0).tolist():
+        result.append({
+            'platform': frame.platforms[code],
+            'total_spend': float(totals['spend'][code]),
+            'total_impressions': int(totals['impressions'][code]),
+            'avg_ctr': float(totals['ctr'][code]),
+            'cpm': float(cpm[code]),
+            'avg_daily_spend': float(avg_spend[code]),
+            'ad_count': int(totals['count'][code])
+        })
+    return result
+
+def load_compared_frame(user_id, competitor_ids, compare, start, end):
+    """
+    Metrics of [start, end] plus the comparison section, from one query
+
+    Args:
+        compare: A comparison mode ('previous_period' or 'previous_year')
+        start: First day of the current window
+        end: Last day of the current window
+
+    Returns:
+        Tuple of (frame of the current window only, comparison dict,
+        frame of both windows)
+    """
+    frame = load_metrics_frame(supabase, user_id, competitor_ids, windows=combined_windows(compare, start, end))
+    periods = row_periods(frame, (start, end), baseline_window(compare, start, end))
+    return frame.take(periods == CURRENT), build_comparison(frame, compare, start, end), frame
+
+def calculate_user_analytics(daily_metrics, competitors_data, spend_bins=None, ctr_bins=None):
+    """
+    Calculate analytics from daily metrics (rows or a MetricsFrame)
+
+    spend_bins and ctr_bins are BinSpecs for spendRanges and ctrPerformance
+    (SPEND_RANGE_BINS and CTR_PERFORMANCE_BINS by default).
+    """
+    frame = daily_metrics if isinstance(daily_metrics, MetricsFrame) else MetricsFrame.from_rows(daily_metrics)
+    if not len(frame):
         return {
             'competitorSpend': [],
             'spendRanges': [],
@@ -170,47 +283,29 @@ def calculate_user_analytics(daily_metrics, competitors_data):
     # Create competitor map for quick lookup
     competitor_map = {comp['id']: comp for comp in competitors_data}
     
-    # Group by competitor
+    # Group by competitor and platform in one vectorised pass each
+    by_competitor = frame.group_totals('competitor')
+    by_platform = frame.group_totals('platform')
+    
     competitor_analytics = {}
-    platform_analytics = {}
-    
-    for metric in daily_metrics:
-        comp_id = metric['competitor_id']
-        comp_name = competitor_map.get(comp_id, {}).get('name', metric.get('competitor_name', 'Unknown'))
-        platform = metric.get('platform', 'Unknown')
-        
-        if comp_id not in competitor_analytics:
-            competitor_analytics[comp_id] = {
-                'name': comp_name,
-                'total_spend': 0,
-                'total_impressions': 0,
-                'total_clicks': 0,
-                'count': 0
-            }
-        
-        competitor_analytics[comp_id]['total_spend'] += float(metric.get('daily_spend', 0))
-        competitor_analytics[comp_id]['total_impressions'] += int(metric.get('daily_impressions', 0))
-        competitor_analytics[comp_id]['total_clicks'] += int(metric.get('daily_clicks', 0))
-        competitor_analytics[comp_id]['count'] += 1
-        
-        # Platform analytics
-        if platform not in platform_analytics:
-            platform_analytics[platform] = {
-                'total_spend': 0,
-                'total_clicks': 0,
-                'total_impressions': 0,
-                'count': 0
-            }
-        
-        platform_analytics[platform]['total_spend'] += float(metric.get('daily_spend', 0))
-        platform_analytics[platform]['total_impressions'] += int(metric.get('daily_impressions', 0))
-        platform_analytics[platform]['total_clicks'] += int(metric.get('daily_clicks', 0))
-        platform_analytics[platform]['count'] += 1
+    for code, (comp_id, total_spend, total_impressions, total_clicks, count) in enumerate(zip(
+        frame.competitor_ids,
+        by_competitor['spend'].tolist(),
+        by_competitor['impressions'].tolist(),
+        by_competitor['clicks'].tolist(),
+        by_competitor['count'].tolist()
+    )):
+        competitor_analytics[comp_id] = {
+            'name': competitor_map.get(comp_id, {}).get('name', frame.competitor_name(code)),
+            'total_spend': total_spend,
+            'total_impressions': total_impressions,
+            'total_clicks': total_clicks,
+            'count': count
+        }
     
     # Format competitor spend data
     competitor_spend = []
-    for comp_id, data in competitor_analytics.items():
-        avg_ctr = (data['total_clicks'] / data['total_impressions']) if data['total_impressions'] > 0 else 0
+    for data, avg_ctr in zip(competitor_analytics.values(), by_competitor['ctr'].tolist()):
         competitor_spend.append({
             'competitor_name': data['name'],
             'total_spend': data['total_spend'],
@@ -233,21 +328,24 @@ def calculate_user_analytics(daily_metrics, competitors_data):
         'Pinterest': '#E60023'
     }
     
-    for platform, data in platform_analytics.items():
-        avg_ctr = (data['total_clicks'] / data['total_impressions']) if data['total_impressions'] > 0 else 0
+    for platform, avg_ctr, count, total_spend in zip(
+        frame.platforms,
+        by_platform['ctr'].tolist(),
+        by_platform['count'].tolist(),
+        by_platform['spend'].tolist()
+    ):
         platform_ctr.append({
             'platform': platform,
             'avg_ctr': avg_ctr,
-            'ad_count': data['count'],
-            'total_spend': data['total_spend'],
+            'ad_count': count,
+            'total_spend': total_spend,
             'color': platform_colors.get(platform, '#9B51E0')
         })
     
-    # Calculate spend ranges
-    spend_ranges = calculate_spend_ranges(competitor_analytics)
+    # Bin competitors by average spend and by CTR
+    spend_ranges = calculate_spend_ranges(by_competitor, spend_bins)
     
-    # Calculate CTR performance
-    ctr_performance = calculate_ctr_performance(competitor_analytics)
+    ctr_performance = calculate_ctr_performance(by_competitor, ctr_bins)
     
     # Calculate spend impressions correlation
     spend_impressions = calculate_spend_impressions(competitor_analytics)
@@ -260,86 +358,80 @@ def calculate_user_analytics(daily_metrics, competitors_data):
         'platformCTR': platform_ctr
     }
 
-def calculate_spend_ranges(competitor_analytics):
-    """Calculate spend range distribution"""
-    ranges = [
-        {'spend_range': 'Under $100', 'ad_count': 0, 'avg_ctr': 0, 'total_spend': 0},
-        {'spend_range': '$100-$500', 'ad_count': 0, 'avg_ctr': 0, 'total_spend': 0},
-        {'spend_range': '$500-$1K', 'ad_count': 0, 'avg_ctr': 0, 'total_spend': 0},
-        {'spend_range': '$1K-$5K', 'ad_count': 0, 'avg_ctr': 0, 'total_spend': 0},
-        {'spend_range': 'Over $5K', 'ad_count': 0, 'avg_ctr': 0, 'total_spend': 0}
-    ]
-    
-    for comp_id, data in competitor_analytics.items():
-        avg_daily_spend = data['total_spend'] / data['count'] if data['count'] > 0 else 0
-        
-        if avg_daily_spend < 100:
-            ranges[0]['ad_count'] += data['count']
-            ranges[0]['total_spend'] += data['total_spend']
-            ranges[0]['avg_ctr'] += (data['total_clicks'] / data['total_impressions']) if data['total_impressions'] > 0 else 0
-        elif avg_daily_spend < 500:
-            ranges[1]['ad_count'] += data['count']
-            ranges[1]['total_spend'] += data['total_spend']
-            ranges[1]['avg_ctr'] += (data['total_clicks'] / data['total_impressions']) if data['total_impressions'] > 0 else 0
-        elif avg_daily_spend < 1000:
-            ranges[2]['ad_count'] += data['count']
-            ranges[2]['total_spend'] += data['total_spend']
-            ranges[2]['avg_ctr'] += (data['total_clicks'] / data['total_impressions']) if data['total_impressions'] > 0 else 0
-        elif avg_daily_spend < 5000:
-            ranges[3]['ad_count'] += data['count']
-            ranges[3]['total_spend'] += data['total_spend']
-            ranges[3]['avg_ctr'] += (data['total_clicks'] / data['total_impressions']) if data['total_impressions'] > 0 else 0
-        else:
-            ranges[4]['ad_count'] += data['count']
-            ranges[4]['total_spend'] += data['total_spend']
-            ranges[4]['avg_ctr'] += (data['total_clicks'] / data['total_impressions']) if data['total_impressions'] > 0 else 0
+def calculate_spend_ranges(by_competitor, spend_bins=None):
+    """
+    Ads, spend and CTR of competitors binned by average spend per ad
+
+    Args:
+        by_competitor: frame.group_totals('competitor')
+        spend_bins: BinSpec (SPEND_RANGE_BINS by default)
+
+    Returns:
+        Non-empty ranges, lowest first; avg_ctr is clicks / impressions of the range
+    """
+    spend_bins = spend_bins or parse_bins(Config.SPEND_RANGE_BINS)
+    avg_spend = safe_divide(by_competitor['spend'], by_competitor['count'])
     
-    # Calculate average CTR for each range
-    for r in ranges:
-        if r['ad_count'] > 0:
-            r['avg_ctr'] = r['avg_ctr'] / (ranges.index(r) + 1)
+    edges = spend_bins.resolve(avg_spend[by_competitor['count'] > 0])
+    _, sums = bin_totals(avg_spend, edges, {
+        'count': by_competitor['count'],
+        'spend': by_competitor['spend'],
+        'impressions': by_competitor['impressions'],
+        'clicks': by_competitor['clicks']
+    })
+    avg_ctr = safe_divide(sums['clicks'], sums['impressions'])
     
-    return [r for r in ranges if r['ad_count'] > 0]
+    ranges = []
+    for i, (lower, upper) in enumerate(bin_bounds(edges)):
+        if sums['count'][i] > 0:
+            ranges.append({
+                'spend_range': money_label(lower, upper),
+                'ad_count': int(sums['count'][i]),
+                'avg_ctr': float(avg_ctr[i]),
+                'total_spend': float(sums['spend'][i]),
+                'lower': lower,
+                'upper': upper
+            })
+    return ranges
 
-def calculate_ctr_performance(competitor_analytics):
-    """Calculate CTR performance distribution"""
-    brackets = [
-        {'ctr_performance': 'Poor (<1%)', 'ad_count': 0, 'avg_spend': 0, 'percentage': 0},
-        {'ctr_performance': 'Average (1-3%)', 'ad_count': 0, 'avg_spend': 0, 'percentage': 0},
-        {'ctr_performance': 'Good (3-5%)', 'ad_count': 0, 'avg_spend': 0, 'percentage': 0},
-        {'ctr_performance': 'Excellent (5-10%)', 'ad_count': 0, 'avg_spend': 0, 'percentage': 0},
-        {'ctr_performance': 'Outstanding (>10%)', 'ad_count': 0, 'avg_spend': 0, 'percentage': 0}
-    ]
-    
-    total_ads = sum([data['count'] for data in competitor_analytics.values()])
+def calculate_ctr_performance(by_competitor, ctr_bins=None):
+    """
+    Ads and average spend per ad of competitors binned by CTR
+
+    Args:
+        by_competitor: frame.group_totals('competitor')
+        ctr_bins: BinSpec (CTR_PERFORMANCE_BINS by default); four fixed
+                  edges are labelled with CTR_TIER_NAMES
+
+    Returns:
+        Non-empty brackets, lowest first, with their share of all ads
+    """
+    ctr_bins = ctr_bins or parse_bins(Config.CTR_PERFORMANCE_BINS)
+    ctr = safe_divide(by_competitor['clicks'], by_competitor['impressions'])
     
-    for comp_id, data in competitor_analytics.items():
-        ctr = (data['total_clicks'] / data['total_impressions']) if data['total_impressions'] > 0 else 0
-        avg_spend = data['total_spend'] / data['count'] if data['count'] > 0 else 0
-        
-        if ctr < 0.01:
-            brackets[0]['ad_count'] += data['count']
-            brackets[0]['avg_spend'] += data['total_spend']
-        elif ctr < 0.03:
-            brackets[1]['ad_count'] += data['count']
-            brackets[1]['avg_spend'] += data['total_spend']
-        elif ctr < 0.05:
-            brackets[2]['ad_count'] += data['count']
-            brackets[2]['avg_spend'] += data['total_spend']
-        elif ctr < 0.10:
-            brackets[3]['ad_count'] += data['count']
-            brackets[3]['avg_spend'] += data['total_spend']
-        else:
-            brackets[4]['ad_count'] += data['count']
-            brackets[4]['avg_spend'] += data['total_spend']
+    edges = ctr_bins.resolve(ctr[by_competitor['count'] > 0])
+    _, sums = bin_totals(ctr, edges, {
+        'count': by_competitor['count'],
+        'spend': by_competitor['spend']
+    })
+    avg_spend = safe_divide(sums['spend'], sums['count'])
+    percentage = safe_divide(sums['count'], sums['count'].sum(), 100)
     
-    # Calculate percentages and averages
-    for bracket in brackets:
-        if bracket['ad_count'] > 0:
-            bracket['avg_spend'] = bracket['avg_spend'] / bracket['ad_count']
-            bracket['percentage'] = (bracket['ad_count'] / total_ads * 100) if total_ads > 0 else 0
+    named = ctr_bins.mode == 'edges' and len(edges) + 1 == len(CTR_TIER_NAMES)
     
-    return [b for b in brackets if b['ad_count'] > 0]
+    brackets = []
+    for i, (lower, upper) in enumerate(bin_bounds(edges)):
+        if sums['count'][i] > 0:
+            label = percent_label(lower, upper)
+            brackets.append({
+                'ctr_performance': f'{CTR_TIER_NAMES[i]} ({label})' if named else label,
+                'ad_count': int(sums['count'][i]),
+                'avg_spend': float(avg_spend[i]),
+                'percentage': float(percentage[i]),
+                'lower': lower,
+                'upper': upper
+            })
+    return brackets
 
 def calculate_spend_impressions(competitor_analytics):
     """Calculate spend impressions correlation"""
@@ -361,14 +453,31 @@ def calculate_spend_impressions(competitor_analytics):
 
 @user_analytics_bp.route('/competitor-spend', methods=['GET'])
 @token_required
+@cached_response('analytics.competitor-spend')
 def get_competitor_spend():
-    """Get competitor spend distribution for the logged-in user"""
+    """
+    Get competitor spend distribution for the logged-in user
+    
+    Query params:
+        limit: Number of competitors (default 10)
+        compare: previous_period or previous_year; limits the figures to the
+                 last `days` (default 30) and adds a comparison section
+    """
     try:
         if not supabase:
             return jsonify({'error': 'Database not configured'}), 500
             
         user_id = request.user_id
         limit = request.args.get('limit', 10, type=int)
+        days = request.args.get('days', 30, type=int)
+        
+        try:
+            compare = parse_compare(request.args.get('compare'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
         # Get user's competitors
         competitors_response = (
@@ -388,50 +497,26 @@ def get_competitor_spend():
             }), 200
         
         # Get daily metrics for competitors
-        daily_response = (
-            supabase.table("daily_metrics")
-            .select("competitor_id, competitor_name, daily_spend, daily_ctr")
-            .in_("competitor_id", competitor_ids)
-            .execute()
-        )
-        
-        # Group by competitor
-        competitor_data = {}
-        for metric in daily_response.data:
-            comp_id = metric['competitor_id']
-            comp_name = metric.get('competitor_name', 'Unknown')
-            
-            if comp_id not in competitor_data:
-                competitor_data[comp_id] = {
-                    'competitor_name': comp_name,
-                    'total_spend': 0,
-                    'ad_count': 0,
-                    'avg_ctr': 0,
-                    'ctr_sum': 0
-                }
-            
-            competitor_data[comp_id]['total_spend'] += float(metric.get('daily_spend', 0))
-            competitor_data[comp_id]['ad_count'] += 1
-            competitor_data[comp_id]['ctr_sum'] += float(metric.get('daily_ctr', 0))
-        
-        # Format data
-        result = []
-        for comp_id, data in competitor_data.items():
-            avg_ctr = data['ctr_sum'] / data['ad_count'] if data['ad_count'] > 0 else 0
-            result.append({
-                'competitor_name': data['competitor_name'],
-                'total_spend': data['total_spend'],
-                'ad_count': data['ad_count'],
-                'avg_ctr': avg_ctr
-            })
+        comparison = None
+        if compare:
+            end_date = datetime.now().date()
+            frame, comparison, _ = load_compared_frame(
+                user_id, competitor_ids, compare, end_date - timedelta(days=days), end_date
+            )
+        else:
+            frame = load_metrics_frame(supabase, user_id, competitor_ids)
         
         # Sort by total spend and limit
-        result = sorted(result, key=lambda x: x['total_spend'], reverse=True)[:limit]
+        result = build_competitor_spend(frame, limit)
         
-        return jsonify({
+        response = {
             'success': True,
             'data': result
-        }), 200
+        }
+        if comparison:
+            response['days'] = days
+            response['comparison'] = comparison
+        return jsonify(response), 200
         
     except Exception as e:
         print(f"Error getting competitor spend: {str(e)}")
@@ -443,8 +528,15 @@ def get_competitor_spend():
 
 @user_analytics_bp.route('/platform-performance', methods=['GET'])
 @token_required
+@cached_response('analytics.platform-performance')
 def get_platform_performance():
-    """Get platform performance metrics"""
+    """
+    Get platform performance metrics
+    
+    Query params:
+        days: Window length (default 30)
+        compare: previous_period or previous_year (adds a comparison section)
+    """
     try:
         if not supabase:
             return jsonify({'error': 'Database not configured'}), 500
@@ -452,6 +544,14 @@ def get_platform_performance():
         user_id = request.user_id
         days = request.args.get('days', 30, type=int)
         
+        try:
+            compare = parse_compare(request.args.get('compare'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         # Calculate date range
         start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
         
@@ -470,52 +570,30 @@ def get_platform_performance():
             }), 200
         
         # Get platform performance data
-        daily_response = supabase.table("daily_metrics")\
-            .select("platform, daily_spend, daily_impressions, daily_clicks, daily_ctr")\
-            .in_("competitor_id", competitor_ids)\
-            .gte("date", start_date)\
-            .execute()
+        comparison = None
+        if compare:
+            end_date = datetime.now().date()
+            frame, comparison, _ = load_compared_frame(
+                user_id, competitor_ids, compare, end_date - timedelta(days=days), end_date
+            )
+        else:
+            # Window totals by prefix-sum subtraction, or a rollup scan when not cached
+            frame = prefix_sums.window_frame(
+                user_id, competitor_ids, datetime.now().date() - timedelta(days=days), datetime.now().date()
+            )
+            if frame is None:
+                frame = load_metrics_frame(supabase, user_id, competitor_ids, start_date=start_date)
         
-        # Group by platform
-        platform_data = {}
-        for metric in daily_response.data:
-            platform = metric.get('platform', 'Unknown')
-            if platform not in platform_data:
-                platform_data[platform] = {
-                    'total_spend': 0,
-                    'total_impressions': 0,
-                    'total_clicks': 0,
-                    'count': 0
-                }
-            
-            platform_data[platform]['total_spend'] += float(metric.get('daily_spend', 0))
-            platform_data[platform]['total_impressions'] += int(metric.get('daily_impressions', 0))
-            platform_data[platform]['total_clicks'] += int(metric.get('daily_clicks', 0))
-            platform_data[platform]['count'] += 1
-        
-        # Calculate metrics
-        result = []
-        for platform, data in platform_data.items():
-            if data['total_impressions'] > 0:
-                avg_ctr = data['total_clicks'] / data['total_impressions']
-                cpm = (data['total_spend'] / data['total_impressions']) * 1000 if data['total_impressions'] > 0 else 0
-                avg_spend = data['total_spend'] / data['count'] if data['count'] > 0 else 0
-                
-                result.append({
-                    'platform': platform,
-                    'total_spend': data['total_spend'],
-                    'total_impressions': data['total_impressions'],
-                    'avg_ctr': avg_ctr,
-                    'cpm': cpm,
-                    'avg_daily_spend': avg_spend,
-                    'ad_count': data['count']
-                })
+        result = build_platform_performance(frame)
         
-        return jsonify({
+        response = {
             'success': True,
             'data': result,
             'days': days
-        }), 200
+        }
+        if comparison:
+            response['comparison'] = comparison
+        return jsonify(response), 200
         
     except Exception as e:
         print(f"Error getting platform performance: {str(e)}")
@@ -526,8 +604,18 @@ def get_platform_performance():
 
 @user_analytics_bp.route('/trends', methods=['GET'])
 @token_required
+@cached_response('analytics.trends')
 def get_user_trends():
-    """Get user-specific trends over time"""
+    """
+    Get user-specific trends over time
+    
+    Query params:
+        days: Window length (default 30)
+        resolution: day, week, month or auto (default day)
+        points: Target point count for resolution=auto
+        compare: previous_period or previous_year (adds the baseline's
+                 points and a comparison section)
+    """
     try:
         if not supabase:
             return jsonify({'error': 'Database not configured'}), 500
@@ -535,10 +623,30 @@ def get_user_trends():
         user_id = request.user_id
         days = request.args.get('days', 30, type=int)
         
+        try:
+            compare = parse_compare(request.args.get('compare'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         # Calculate date range
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
         
+        try:
+            resolution = choose_resolution(
+                request.args.get('resolution', 'day'),
+                start_date.date(), end_date.date(),
+                request.args.get('points', type=int)
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         # Get user's competitors
         competitors_response = supabase.table("competitors")\
             .select("id")\
@@ -554,48 +662,281 @@ def get_user_trends():
                 'message': 'No competitors found'
             }), 200
         
-        # Get daily trends
-        daily_response = supabase.table("daily_metrics")\
-            .select("date, daily_spend, daily_impressions, daily_clicks, platform")\
-            .in_("competitor_id", competitor_ids)\
-            .gte("date", start_date.strftime('%Y-%m-%d'))\
-            .lte("date", end_date.strftime('%Y-%m-%d'))\
-            .order("date")\
+        comparison = None
+        baseline_trends = None
+        if compare:
+            # Both windows from one query; the baseline is charted at the same resolution
+            _, comparison, frame = load_compared_frame(
+                user_id, competitor_ids, compare, start_date.date(), end_date.date()
+            )
+            series = daily_series(frame, start_date.date(), end_date.date())
+            baseline_start, baseline_end = baseline_window(compare, start_date.date(), end_date.date())
+            baseline_trends = trend_points(daily_series(frame, baseline_start, baseline_end), baseline_start, resolution)
+        else:
+            # Gap-filled daily series for the window, shared by every resolution:
+            # from the prefix sums, else from a recent scan or a new one
+            series = prefix_sums.daily_series(user_id, competitor_ids, start_date.date(), end_date.date())
+            # Keyed on the data version so writes from any process retire the entry;
+            # without a readable version the cache is skipped
+            version = data_versions.get(user_id)
+            cache_key = (user_id, version, tuple(sorted(competitor_ids)), start_date.date(), end_date.date())
+            if series is None and version is not None:
+                series = series_cache.get(cache_key)
+            if series is None:
+                frame = load_metrics_frame(
+                    supabase, user_id, competitor_ids,
+                    start_date=start_date.strftime('%Y-%m-%d'),
+                    end_date=end_date.strftime('%Y-%m-%d')
+                )
+                series = daily_series(frame, start_date.date(), end_date.date())
+                if version is not None:
+                    series_cache.put(cache_key, series)
+        
+        # Format for frontend
+        trends = trend_points(series, start_date.date(), resolution)
+        
+        response = {
+            'success': True,
+            'data': trends,
+            'days': days,
+            'resolution': resolution,
+            'points': len(trends),
+            'date_range': {
+                'start': start_date.strftime('%Y-%m-%d'),
+                'end': end_date.strftime('%Y-%m-%d')
+            }
+        }
+        if comparison:
+            response['baseline_data'] = baseline_trends
+            response['comparison'] = comparison
+        return jsonify(response), 200
+        
+    except Exception as e:
+        print(f"Error getting user trends: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@user_analytics_bp.route('/bundle', methods=['GET'])
+@token_required
+@cached_response('analytics.bundle')
+def get_analytics_bundle():
+    """
+    Several analytics sections from one competitors query and one metrics scan
+    
+    Query params:
+        days: Window used by every section (default 30)
+        parts: Comma-separated subset of summary, competitor-spend,
+               platform-performance, trends (default all)
+        limit: competitor-spend limit (default 10)
+        resolution, points: As for /trends
+        spend_bins, ctr_bins: As for /summary
+    """
+    try:
+        if not supabase:
+            return jsonify({'error': 'Database not configured'}), 500
+            
+        user_id = request.user_id
+        days = request.args.get('days', 30, type=int)
+        limit = request.args.get('limit', 10, type=int)
+        
+        requested = request.args.get('parts')
+        parts = [part.strip() for part in requested.split(',') if part.strip()] if requested else list(BUNDLE_PARTS)
+        unknown = [part for part in parts if part not in BUNDLE_PARTS]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown parts: {', '.join(unknown)}. Valid parts: {', '.join(BUNDLE_PARTS)}"
+            }), 400
+        
+        # Calculate date range
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+        
+        try:
+            bins = parse_summary_bins(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        resolution = None
+        if 'trends' in parts:
+            try:
+                resolution = choose_resolution(
+                    request.args.get('resolution', 'day'),
+                    start_date.date(), end_date.date(),
+                    request.args.get('points', type=int)
+                )
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+        
+        # All competitors once; summary and competitor spend only cover active ones
+        competitors_response = (
+            supabase.table("competitors")
+            .select("id, name, domain, industry, estimated_monthly_spend, is_active")
+            .eq("user_id", user_id)
             .execute()
+        )
+        
+        competitors = competitors_response.data or []
+        active_competitors = [comp for comp in competitors if comp.get('is_active')]
+        competitor_ids = [comp['id'] for comp in competitors]
+        
+        # One scan of the window shared by every section
+        frame = load_metrics_frame(
+            supabase, user_id, competitor_ids,
+            start_date=start_date.strftime('%Y-%m-%d'),
+            end_date=end_date.strftime('%Y-%m-%d')
+        )
+        active_frame = frame.for_competitors(comp['id'] for comp in active_competitors)
         
-        # Group by date
-        daily_totals = {}
-        for metric in daily_response.data:
-            date = metric['date']
-            if date not in daily_totals:
-                daily_totals[date] = {
-                    'spend': 0,
-                    'impressions': 0,
-                    'clicks': 0,
-                    'ad_count': 0
-                }
+        data = {}
+        if 'summary' in parts:
+            summary_data = get_summary_row(user_id) if active_competitors else None
+            data['summary'] = build_summary(active_frame, active_competitors, summary_data, bins)
+        if 'competitor-spend' in parts:
+            data['competitor-spend'] = build_competitor_spend(active_frame, limit)
+        if 'platform-performance' in parts:
+            data['platform-performance'] = build_platform_performance(frame)
+        if 'trends' in parts:
+            series = daily_series(frame, start_date.date(), end_date.date())
+            trends = trend_points(series, start_date.date(), resolution)
+            data['trends'] = {
+                'data': trends,
+                'resolution': resolution,
+                'points': len(trends)
+            }
+        
+        return jsonify({
+            'success': True,
+            'data': data,
+            'parts': parts,
+            'days': days,
+            'date_range': {
+                'start': start_date.strftime('%Y-%m-%d'),
+                'end': end_date.strftime('%Y-%m-%d')
+            }
+        }), 200
+        
+    except Exception as e:
+        print(f"Error getting analytics bundle: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def parse_percentiles(value):
+    """
+    Percentiles from a comma-separated query value
+
+    Raises:
+        ValueError: Non-numeric or outside [0, 100]
+    """
+    if not value:
+        return list(DEFAULT_PERCENTILES)
+    try:
+        percentiles = [float(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise ValueError('percentiles must be comma-separated numbers between 0 and 100')
+    if not percentiles or any(p < 0 or p > 100 for p in percentiles):
+        raise ValueError('percentiles must be comma-separated numbers between 0 and 100')
+    return sorted(set(percentiles))
+
+@user_analytics_bp.route('/distributions', methods=['GET'])
+@token_required
+@cached_response('analytics.distributions')
+def get_metric_distributions():
+    """
+    Percentiles of per-ad daily spend, CTR or CPM over a window
+    
+    Query params:
+        metric: spend, ctr or cpm (default cpm)
+        percentiles: Comma-separated, e.g. 50,90,99 (default 10..99)
+        days: Window length (default 30)
+        platform: Only this platform (optional)
+    """
+    try:
+        if not supabase:
+            return jsonify({'error': 'Database not configured'}), 500
             
-            daily_totals[date]['spend'] += float(metric.get('daily_spend', 0))
-            daily_totals[date]['impressions'] += int(metric.get('daily_impressions', 0))
-            daily_totals[date]['clicks'] += int(metric.get('daily_clicks', 0))
-            daily_totals[date]['ad_count'] += 1
+        user_id = request.user_id
+        days = request.args.get('days', 30, type=int)
+        metric = request.args.get('metric', 'cpm').lower()
+        platform = request.args.get('platform')
         
-        # Format for frontend
-        trends = []
-        for date, data in sorted(daily_totals.items()):
-            ctr = (data['clicks'] / data['impressions']) if data['impressions'] > 0 else 0
-            trends.append({
-                'date': date,
-                'spend': data['spend'],
-                'impressions': data['impressions'],
-                'clicks': data['clicks'],
-                'ctr': ctr,
-                'ad_count': data['ad_count']
+        if metric not in SKETCH_METRICS:
+            return jsonify({
+                'success': False,
+                'error': f"metric must be one of: {', '.join(SKETCH_METRICS)}"
+            }), 400
+        try:
+            percentiles = parse_percentiles(request.args.get('percentiles'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Calculate date range
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+        
+        # Get user's competitors
+        competitors_response = (
+            supabase.table("competitors")
+            .select("id, name")
+            .eq("user_id", user_id)
+            .eq("is_active", True)
+            .execute()
+        )
+        
+        competitors = competitors_response.data or []
+        competitor_names = {comp['id']: comp.get('name') for comp in competitors}
+        
+        # One merged digest per (competitor, platform), combined further below
+        groups = load_metric_digests(
+            supabase, user_id, list(competitor_names), metric,
+            start_date=start_date.strftime('%Y-%m-%d'),
+            end_date=end_date.strftime('%Y-%m-%d')
+        )
+        if platform:
+            groups = [group for group in groups if group['platform'].lower() == platform.lower()]
+        
+        by_platform = {}
+        by_competitor = {}
+        for group in groups:
+            by_platform.setdefault(group['platform'], []).append(group['digest'])
+            by_competitor.setdefault(group['competitor_id'], []).append(group['digest'])
+        
+        platforms = []
+        for name, digests in by_platform.items():
+            platforms.append({'platform': name, **percentile_summary(TDigest.merge(digests), percentiles)})
+        
+        competitors_result = []
+        names = {group['competitor_id']: group['competitor_name'] for group in groups}
+        for comp_id, digests in by_competitor.items():
+            competitors_result.append({
+                'competitor_id': comp_id,
+                'competitor_name': competitor_names.get(comp_id) or names.get(comp_id) or 'Unknown',
+                **percentile_summary(TDigest.merge(digests), percentiles)
             })
         
         return jsonify({
             'success': True,
-            'data': trends,
+            'data': {
+                'metric': metric,
+                'overall': percentile_summary(TDigest.merge(group['digest'] for group in groups), percentiles),
+                'by_platform': sorted(platforms, key=lambda x: x['count'], reverse=True),
+                'by_competitor': sorted(competitors_result, key=lambda x: x['count'], reverse=True)
+            },
+            'percentiles': percentiles,
             'days': days,
             'date_range': {
                 'start': start_date.strftime('%Y-%m-%d'),
@@ -604,12 +945,142 @@ def get_user_trends():
         }), 200
         
     except Exception as e:
-        print(f"Error getting user trends: {str(e)}")
+        print(f"Error getting metric distributions: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@user_analytics_bp.route('/query', methods=['GET'])
+@token_required
+@cached_response('analytics.query')
+def run_analytics_query():
+    """
+    Grouped measures over any mix of dimensions for the logged-in user
+
+    Query params:
+        preset: competitor-spend, platform-performance, trends or industry-spend
+        dimensions: competitor, platform, industry and one of day/week/month
+        measures: spend, impressions, clicks, ad_count, ctr, cpm, cpc, avg_spend
+        competitor, platform, industry: Comma-separated values to keep
+        start, end: YYYY-MM-DD window (or days, default 30)
+        sort: Dimensions or measures, '-' for descending
+        limit: Groups returned (default QUERY_DEFAULT_LIMIT)
+
+    The response's plan names the source that answered the query
+    (prefix_sums, rollups or raw).
+    """
+    try:
+        if not supabase:
+            return jsonify({'error': 'Database not configured'}), 500
+        
+        user_id = request.user_id
+        
+        try:
+            spec = parse_query(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Active competitors, with the names and industries groups are labelled by
+        competitors_response = (
+            supabase.table("competitors")
+            .select("id, name, industry")
+            .eq("user_id", user_id)
+            .eq("is_active", True)
+            .execute()
+        )
+        
+        result = run_query(supabase, user_id, competitors_response.data or [], spec)
+        
+        return jsonify({
+            'success': True,
+            **result
+        }), 200
+
+    except Exception as e:
+        print(f"Error running analytics query: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@user_analytics_bp.route('/sql', methods=['POST'])
+@token_required
+def run_sql():
+    """
+    Run a read-only SQL query over the user's metric snapshot
+    
+    Body (JSON):
+        sql: One SELECT over daily_metrics and ads_fetch_jobs
+        params: Values for $name placeholders (optional)
+        max_rows: Row limit (optional, capped at SQL_MAX_ROWS)
+        timeout: Seconds (optional, capped at SQL_TIMEOUT_SECONDS)
+    
+    Queries read the Parquet snapshot (refresh it with POST
+    /metrics/snapshots/refresh), never the live database.
+    """
+    if not sql_engine.available:
+        return jsonify({
+            'success': False,
+            'error': 'SQL queries are not available (duckdb and pyarrow are required)'
+        }), 503
+    
+    body = request.get_json(silent=True) or {}
+    try:
+        max_rows = int(body['max_rows']) if body.get('max_rows') is not None else None
+        timeout = float(body['timeout']) if body.get('timeout') is not None else None
+        if (max_rows is not None and max_rows < 1) or (timeout is not None and timeout <= 0):
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': "'max_rows' and 'timeout' must be positive numbers"
+        }), 400
+    
+    try:
+        result = sql_engine.execute(request.user_id, body.get('sql'), body.get('params'), max_rows, timeout)
+        return jsonify({
+            'success': True,
+            'data': result
+        }), 200
+        
+    except SnapshotMissing as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except QueryTimeout as e:
+        return jsonify({'success': False, 'error': str(e)}), 408
+    except QueryError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error running SQL query: {str(e)}")
+        traceback.print_exc()
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@user_analytics_bp.route('/sql/schema', methods=['GET'])
+@token_required
+def sql_schema():
+    """Tables and columns /sql queries can read"""
+    manifest = sql_engine.store.manifest(request.user_id) or {}
+    return jsonify({
+        'success': True,
+        'data': {
+            'tables': sql_engine.schema(),
+            'snapshot_at': manifest.get('refreshed_at'),
+            'limits': {
+                'default_rows': Config.SQL_DEFAULT_ROWS,
+                'max_rows': Config.SQL_MAX_ROWS,
+                'timeout_seconds': Config.SQL_TIMEOUT_SECONDS
+            }
+        }
+    }), 200
+
 # For backward compatibility
 if __name__ == '__main__':
     from flask import Flask
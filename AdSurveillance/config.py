@@ -30,7 +30,156 @@ class Config:
     
     # Timeout for ads fetching in seconds (default: 5 minutes)
     ADS_FETCH_TIMEOUT = int(os.getenv('ADS_FETCH_TIMEOUT', 300))
-    
+
+    # ========== JOB LIVENESS CONFIG ==========
+    # How often a running job writes its heartbeat (seconds)
+    JOB_HEARTBEAT_INTERVAL = int(os.getenv('JOB_HEARTBEAT_INTERVAL', 15))
+
+    # A running job whose heartbeat is older than this is considered dead (seconds)
+    JOB_HEARTBEAT_TIMEOUT = int(os.getenv('JOB_HEARTBEAT_TIMEOUT', 120))
+
+    # Background reaper for stale and aged jobs
+    JOB_REAPER_ENABLED = os.getenv('JOB_REAPER_ENABLED', 'true').lower() == 'true'
+    JOB_REAPER_INTERVAL = int(os.getenv('JOB_REAPER_INTERVAL', 60))
+    JOB_REAPER_ACTION = os.getenv('JOB_REAPER_ACTION', 'fail')  # 'fail' or 'requeue'
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+
+    # Finished jobs older than this are purged in batches
+    JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 30))
+    JOB_PURGE_BATCH_SIZE = int(os.getenv('JOB_PURGE_BATCH_SIZE', 500))
+
+    # Finished jobs are moved to compressed archive segments after this many days
+    # (replaces the retention purge while enabled)
+    JOB_ARCHIVE_ENABLED = os.getenv('JOB_ARCHIVE_ENABLED', 'true').lower() == 'true'
+    JOB_ARCHIVE_AFTER_DAYS = int(os.getenv('JOB_ARCHIVE_AFTER_DAYS', 30))
+    JOB_ARCHIVE_BATCH_SIZE = int(os.getenv('JOB_ARCHIVE_BATCH_SIZE', 500))
+
+    # ========== JOB DISPATCH CONFIG ==========
+    # 'thread' runs jobs inside the API process, 'queue' leaves them for fetch workers
+    FETCH_DISPATCH_MODE = os.getenv('FETCH_DISPATCH_MODE', 'thread')
+
+    # 'supabase' claims from ads_fetch_jobs, 'local' uses the in-memory stand-in
+    JOB_QUEUE_BACKEND = os.getenv('JOB_QUEUE_BACKEND', 'supabase')
+
+    # Fetch worker settings
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 60))
+    WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', 2))
+    WORKER_POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', 2))
+
+    # ========== JOB EVENTS / STREAMING CONFIG ==========
+    # Number of recent events kept for Last-Event-ID resume
+    JOB_EVENTS_HISTORY = int(os.getenv('JOB_EVENTS_HISTORY', 1000))
+
+    # How often changes made by other processes are picked up (seconds)
+    JOB_EVENTS_POLL_INTERVAL = float(os.getenv('JOB_EVENTS_POLL_INTERVAL', 1.0))
+
+    # Server-Sent Events keep-alive and maximum stream duration (seconds)
+    SSE_KEEPALIVE_SECONDS = int(os.getenv('SSE_KEEPALIVE_SECONDS', 15))
+    SSE_MAX_STREAM_SECONDS = int(os.getenv('SSE_MAX_STREAM_SECONDS', 300))
+
+    # SSE streams held open concurrently per process, and the Retry-After sent over the cap.
+    # Under the gevent worker a stream is a greenlet, not a thread; streams and long-polls
+    # together must stay below gunicorn's --worker-connections (1000)
+    SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', 500))
+    SSE_RETRY_AFTER = int(os.getenv('SSE_RETRY_AFTER', 30))
+
+    # Long-poll on /status/<job_id>: maximum wait and concurrently held requests per process.
+    # A waiter is a greenlet under the gevent worker; this counts towards --worker-connections too
+    LONG_POLL_MAX_WAIT = int(os.getenv('LONG_POLL_MAX_WAIT', 30))
+    LONG_POLL_MAX_WAITERS = int(os.getenv('LONG_POLL_MAX_WAITERS', 300))
+
+    # ========== JOB CACHE CONFIG ==========
+    # Bounds of the in-memory job cache (entries and approximate bytes)
+    JOB_CACHE_MAX_ENTRIES = int(os.getenv('JOB_CACHE_MAX_ENTRIES', 5000))
+    JOB_CACHE_MAX_BYTES = int(os.getenv('JOB_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+    # Pending/running jobs may change in another process, finished jobs don't (seconds)
+    JOB_CACHE_ACTIVE_TTL = float(os.getenv('JOB_CACHE_ACTIVE_TTL', 3))
+    JOB_CACHE_TERMINAL_TTL = float(os.getenv('JOB_CACHE_TERMINAL_TTL', 3600))
+
+    # Seconds a mirrored job_stats row is trusted without a local job transition
+    JOB_STATS_CACHE_TTL = float(os.getenv('JOB_STATS_CACHE_TTL', 5))
+
+    # ========== ANALYTICS CONFIG ==========
+    # Read analytics from daily_metric_rollups instead of raw daily_metrics.
+    # Off until the rollup backfill has run, otherwise users without rollups see no data
+    ANALYTICS_USE_ROLLUPS = os.getenv('ANALYTICS_USE_ROLLUPS', 'false').lower() == 'true'
+
+    # Rows per request when paging through daily_metrics or rollups
+    ANALYTICS_PAGE_SIZE = int(os.getenv('ANALYTICS_PAGE_SIZE', 1000))
+
+    # Metrics written up to this long before a fetch started are re-rolled up after it (seconds)
+    ROLLUP_CLOCK_SKEW_SECONDS = int(os.getenv('ROLLUP_CLOCK_SKEW_SECONDS', 300))
+
+    # Days of raw metrics rolled up per round trip by the backfill
+    ROLLUP_BACKFILL_WINDOW_DAYS = int(os.getenv('ROLLUP_BACKFILL_WINDOW_DAYS', 14))
+
+    # /analytics/trends: 'auto' picks the finest resolution with at most this many points
+    TRENDS_TARGET_POINTS = int(os.getenv('TRENDS_TARGET_POINTS', 120))
+
+    # Daily series of recently charted windows kept in memory (seconds, 0 disables)
+    TRENDS_CACHE_TTL = float(os.getenv('TRENDS_CACHE_TTL', 60))
+    TRENDS_CACHE_MAX_ENTRIES = int(os.getenv('TRENDS_CACHE_MAX_ENTRIES', 256))
+
+    # Days of per-(competitor, platform) running sums kept per user for window queries (0 disables)
+    PREFIX_SUM_DAYS = int(os.getenv('PREFIX_SUM_DAYS', 400))
+    PREFIX_SUM_MAX_USERS = int(os.getenv('PREFIX_SUM_MAX_USERS', 256))
+
+    # Users whose creative keyword index is kept in memory (0 disables)
+    KEYWORD_INDEX_MAX_USERS = int(os.getenv('KEYWORD_INDEX_MAX_USERS', 256))
+
+    # /summary spendRanges (average spend per ad) and ctrPerformance bins:
+    # comma-separated edges, 'log:N' or 'quantile:N'; overridable per request
+    SPEND_RANGE_BINS = os.getenv('SPEND_RANGE_BINS', '100,500,1000,5000')
+    CTR_PERFORMANCE_BINS = os.getenv('CTR_PERFORMANCE_BINS', '0.01,0.03,0.05,0.10')
+
+    # /analytics/query groups returned by default and at most
+    QUERY_DEFAULT_LIMIT = int(os.getenv('QUERY_DEFAULT_LIMIT', 100))
+    QUERY_MAX_LIMIT = int(os.getenv('QUERY_MAX_LIMIT', 5000))
+
+    # t-digest compression of per-ad metric distributions (higher = more accurate, larger)
+    SKETCH_COMPRESSION = int(os.getenv('SKETCH_COMPRESSION', 100))
+
+    # Serialised analytics/targeting responses kept per process, keyed by data version (0 disables)
+    ANALYTICS_CACHE_MAX_BYTES = int(os.getenv('ANALYTICS_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv('ANALYTICS_CACHE_MAX_ENTRIES', 2000))
+
+    # Seconds a mirrored analytics data version is trusted without a local bump
+    ANALYTICS_VERSION_TTL = float(os.getenv('ANALYTICS_VERSION_TTL', 5))
+
+    # Rows per keyset page of /metrics/export
+    EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', 1000))
+
+    # Per-user Parquet snapshots of daily_metrics (python -m AdSurveillance.analytics.snapshots)
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'data/snapshots')
+    SNAPSHOT_ROW_GROUP_SIZE = int(os.getenv('SNAPSHOT_ROW_GROUP_SIZE', 50000))
+
+    # /analytics/sql: rows returned (default and cap) and seconds before a query is interrupted
+    SQL_DEFAULT_ROWS = int(os.getenv('SQL_DEFAULT_ROWS', 1000))
+    SQL_MAX_ROWS = int(os.getenv('SQL_MAX_ROWS', 10000))
+    SQL_TIMEOUT_SECONDS = float(os.getenv('SQL_TIMEOUT_SECONDS', 5))
+
+    # In-memory DuckDB databases kept loaded, and the resources each may use
+    SQL_MAX_DATABASES = int(os.getenv('SQL_MAX_DATABASES', 8))
+    SQL_THREADS = int(os.getenv('SQL_THREADS', 2))
+    SQL_MEMORY_LIMIT = os.getenv('SQL_MEMORY_LIMIT', '512MB')
+
+    # Spend anomaly alerts, scored after every fetch job (analytics/anomalies.py)
+    ANOMALY_DETECTION_ENABLED = os.getenv('ANOMALY_DETECTION_ENABLED', 'true').lower() == 'true'
+    ANOMALY_WINDOW_DAYS = int(os.getenv('ANOMALY_WINDOW_DAYS', 28))
+    ANOMALY_LOOKBACK_DAYS = int(os.getenv('ANOMALY_LOOKBACK_DAYS', 3))
+    ANOMALY_Z_THRESHOLD = float(os.getenv('ANOMALY_Z_THRESHOLD', 3.5))
+
+    # Alerts need this many days of spend in the window, and a spend or baseline of at least this much
+    ANOMALY_MIN_HISTORY_DAYS = int(os.getenv('ANOMALY_MIN_HISTORY_DAYS', 7))
+    ANOMALY_MIN_SPEND = float(os.getenv('ANOMALY_MIN_SPEND', 50))
+
+    # Smallest move from the baseline median an alert needs (0.5 = 50%)
+    ANOMALY_MIN_CHANGE = float(os.getenv('ANOMALY_MIN_CHANGE', 0.5))
+
+    # Smallest spread a score divides by, as a fraction of the baseline median
+    ANOMALY_MIN_SCALE = float(os.getenv('ANOMALY_MIN_SCALE', 0.05))
+
     # ========== CORS CONFIG ==========
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*').split(',')
     CORS_SUPPORTS_CREDENTIALS = True
@@ -41,6 +190,8 @@ class Config:
         'competitors': 'competitors',
         'advertisements': 'advertisements',
         'daily_metrics': 'daily_metrics',
+        'daily_metric_rollups': 'daily_metric_rollups',
+        'analytics_data_versions': 'analytics_data_versions',
         'summary_metrics': 'summary_metrics',
         'data_source_logs': 'data_source_logs',
         'ads_fetch_jobs': 'ads_fetch_jobs'
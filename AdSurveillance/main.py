@@ -17,6 +17,7 @@ from AdSurveillance.api.ads_refresh import ads_refresh_bp
 from AdSurveillance.api.ads_status import ads_status_bp
 from AdSurveillance.api.competitors import competitors_bp
 from AdSurveillance.api.daily_metrics import daily_metrics_bp
+from AdSurveillance.api.metrics_export import metrics_export_bp
 from AdSurveillance.api.targeting_intel import targeting_intel_bp
 from AdSurveillance.api.user_analytics import user_analytics_bp
 
@@ -55,6 +56,7 @@ def create_app():
     
     # Analytics & Metrics
     app.register_blueprint(daily_metrics_bp, url_prefix=f'{Config.API_PREFIX}/metrics')
+    app.register_blueprint(metrics_export_bp, url_prefix=f'{Config.API_PREFIX}/metrics')
     app.register_blueprint(user_analytics_bp, url_prefix=f'{Config.API_PREFIX}/analytics')
     
     # Targeting Intelligence
@@ -64,6 +66,15 @@ def create_app():
     if HAS_DASHBOARD:
         app.register_blueprint(main_dashboard_bp, url_prefix=f'{Config.API_PREFIX}/dashboard')
     
+    # ========== BACKGROUND SERVICES ==========
+    # Fails or requeues jobs whose heartbeat stopped and purges aged jobs.
+    # In queue mode requeued jobs are picked up by the fetch workers.
+    if Config.JOB_REAPER_ENABLED:
+        from AdSurveillance.ad_fetch_service.job_reaper import start_job_reaper
+        from AdSurveillance.api.ads_refresh import requeue_fetch_job
+        handler = requeue_fetch_job if Config.FETCH_DISPATCH_MODE == 'thread' else None
+        start_job_reaper(requeue_handler=handler)
+    
     # ========== GLOBAL ENDPOINTS ==========
     @app.route('/')
     def root():
@@ -81,7 +92,8 @@ def create_app():
                 'metrics': f'{Config.API_PREFIX}/metrics',
                 'analytics': f'{Config.API_PREFIX}/analytics',
                 'targeting': f'{Config.API_PREFIX}/targeting',
-                'health': '/health'
+                'health': '/health',
+                'service_metrics': '/metrics'
             }
         })
     
@@ -105,6 +117,12 @@ def create_app():
             'service': 'AdSurveillance'
         }), status
     
+    @app.route('/metrics')
+    def service_metrics():
+        """In-process service metrics (job reaper, caches)"""
+        from AdSurveillance.service_metrics import metrics
+        return jsonify(metrics.snapshot())
+    
     @app.route('/api')
     def api_root():
         """API root endpoint"""
@@ -154,6 +172,7 @@ def create_app():
         print("\n🌐 Endpoints:")
         print(f"  • Root: /")
         print(f"  • Health: /health")
+        print(f"  • Metrics: /metrics")
         print(f"  • API Info: /api")
         print("="*80 + "\n")
     
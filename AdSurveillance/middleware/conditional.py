@@ -0,0 +1,96 @@
+"""
+Conditional GET helpers for AdSurveillance
+Weak ETags and If-None-Match handling for polled endpoints
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import request, jsonify, make_response
+
+
+def make_etag(*parts):
+    """Build a weak ETag from the values that determine a response"""
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def job_fingerprint(job, progress=None):
+    """
+    Values identifying a job's displayed state
+
+    updated_at changes on every status transition. Running jobs also
+    carry a time-based progress estimate, which is bucketed so that polls
+    during a long job can still revalidate instead of refetching.
+    """
+    parts = (job.get('job_id'), job.get('updated_at'), job.get('status'))
+    if progress is not None and job.get('status') == 'running':
+        parts += (int(progress // 5),)
+    return parts
+
+
+def etag_matches(etag):
+    """True if the request's If-None-Match contains etag (weak comparison)"""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(etag):
+    """Empty 304 response carrying the ETag"""
+    response = make_response('', 304)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def json_with_etag(payload, etag, status=200):
+    """JSON response carrying the ETag; clients must revalidate before reuse"""
+    response = make_response(jsonify(payload), status)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+class ETagMemo:
+    """
+    Remembers the last ETag served per key with the data version it was
+    computed at, so a revalidation can be answered before querying the
+    database. Entries are only trusted for max_age seconds, which bounds
+    staleness for changes made by other processes.
+    """
+
+    def __init__(self, max_age, max_entries=10000):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key, version):
+        """ETag for key if it was computed at this version recently, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            etag, entry_version, computed_at = entry
+            if entry_version != version or time.monotonic() - computed_at > self.max_age:
+                return None
+            return etag
+
+    def remember(self, key, version, etag):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (etag, version, time.monotonic())
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
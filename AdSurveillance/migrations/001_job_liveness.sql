@@ -0,0 +1,13 @@
+-- Heartbeat-based liveness for ads fetch jobs
+-- Running jobs write heartbeat_at periodically; the job reaper fails or
+-- requeues jobs whose heartbeat is stale and purges aged jobs.
+
+ALTER TABLE ads_fetch_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ;
+ALTER TABLE ads_fetch_jobs ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_ads_fetch_jobs_running_heartbeat
+    ON ads_fetch_jobs (heartbeat_at)
+    WHERE status = 'running';
+
+CREATE INDEX IF NOT EXISTS idx_ads_fetch_jobs_status_created
+    ON ads_fetch_jobs (status, created_at);
@@ -0,0 +1,14 @@
+-- Lease-based job claiming for standalone fetch workers
+-- A worker claims a pending job (or one whose lease expired) with a
+-- conditional update, then renews lease_expires_at while it runs.
+
+ALTER TABLE ads_fetch_jobs ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+ALTER TABLE ads_fetch_jobs ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_ads_fetch_jobs_pending_created
+    ON ads_fetch_jobs (created_at)
+    WHERE status = 'pending';
+
+CREATE INDEX IF NOT EXISTS idx_ads_fetch_jobs_running_lease
+    ON ads_fetch_jobs (lease_expires_at)
+    WHERE status = 'running';
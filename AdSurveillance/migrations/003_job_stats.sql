@@ -0,0 +1,140 @@
+-- Incrementally maintained job statistics
+-- One row per user plus a 'global' row. A trigger on ads_fetch_jobs applies
+-- the difference between the old and the new row in the same transaction,
+-- so counters stay exact no matter which process writes the job.
+
+CREATE TABLE IF NOT EXISTS job_stats (
+    scope TEXT PRIMARY KEY,                 -- user_id, or 'global'
+    total_jobs BIGINT NOT NULL DEFAULT 0,
+    pending BIGINT NOT NULL DEFAULT 0,
+    running BIGINT NOT NULL DEFAULT 0,
+    completed BIGINT NOT NULL DEFAULT 0,
+    failed BIGINT NOT NULL DEFAULT 0,
+    total_ads_fetched BIGINT NOT NULL DEFAULT 0,
+    completed_ads_fetched BIGINT NOT NULL DEFAULT 0,
+    total_duration_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    jobs_with_duration BIGINT NOT NULL DEFAULT 0,
+    platforms JSONB NOT NULL DEFAULT '{}'::jsonb,
+    today_date DATE,
+    today_jobs BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION apply_job_stats_delta(
+    p_scope TEXT,
+    p_sign INT,
+    p_status TEXT,
+    p_platform TEXT,
+    p_ads BIGINT,
+    p_duration DOUBLE PRECISION,
+    p_created DATE
+) RETURNS void AS $$
+BEGIN
+    IF p_scope IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO job_stats (scope) VALUES (p_scope) ON CONFLICT (scope) DO NOTHING;
+
+    UPDATE job_stats SET
+        total_jobs = total_jobs + p_sign,
+        pending = pending + CASE WHEN p_status = 'pending' THEN p_sign ELSE 0 END,
+        running = running + CASE WHEN p_status = 'running' THEN p_sign ELSE 0 END,
+        completed = completed + CASE WHEN p_status = 'completed' THEN p_sign ELSE 0 END,
+        failed = failed + CASE WHEN p_status = 'failed' THEN p_sign ELSE 0 END,
+        total_ads_fetched = total_ads_fetched + p_sign * COALESCE(p_ads, 0),
+        completed_ads_fetched = completed_ads_fetched
+            + CASE WHEN p_status = 'completed' THEN p_sign * COALESCE(p_ads, 0) ELSE 0 END,
+        total_duration_seconds = total_duration_seconds + p_sign * COALESCE(p_duration, 0),
+        jobs_with_duration = jobs_with_duration + CASE WHEN p_duration IS NOT NULL THEN p_sign ELSE 0 END,
+        platforms = jsonb_set(
+            platforms,
+            ARRAY[COALESCE(p_platform, 'unknown')],
+            to_jsonb(COALESCE((platforms ->> COALESCE(p_platform, 'unknown'))::BIGINT, 0) + p_sign)
+        ),
+        -- today_jobs restarts at the first change of a new (UTC) day
+        today_jobs = CASE
+            WHEN today_date IS DISTINCT FROM CURRENT_DATE THEN
+                CASE WHEN p_created = CURRENT_DATE THEN GREATEST(p_sign, 0) ELSE 0 END
+            WHEN p_created = CURRENT_DATE THEN today_jobs + p_sign
+            ELSE today_jobs
+        END,
+        today_date = CURRENT_DATE,
+        updated_at = now()
+    WHERE scope = p_scope;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION ads_fetch_jobs_stats_trigger() RETURNS trigger AS $$
+DECLARE
+    scope TEXT;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        FOREACH scope IN ARRAY ARRAY[OLD.user_id::TEXT, 'global'] LOOP
+            PERFORM apply_job_stats_delta(
+                scope, -1, OLD.status, OLD.platform, OLD.ads_fetched,
+                EXTRACT(EPOCH FROM (OLD.end_time - OLD.start_time)),
+                (OLD.created_at AT TIME ZONE 'UTC')::DATE
+            );
+        END LOOP;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        FOREACH scope IN ARRAY ARRAY[NEW.user_id::TEXT, 'global'] LOOP
+            PERFORM apply_job_stats_delta(
+                scope, 1, NEW.status, NEW.platform, NEW.ads_fetched,
+                EXTRACT(EPOCH FROM (NEW.end_time - NEW.start_time)),
+                (NEW.created_at AT TIME ZONE 'UTC')::DATE
+            );
+        END LOOP;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Heartbeat and lease renewals don't touch these columns and skip the trigger
+DROP TRIGGER IF EXISTS ads_fetch_jobs_stats ON ads_fetch_jobs;
+CREATE TRIGGER ads_fetch_jobs_stats
+    AFTER INSERT OR DELETE OR UPDATE OF status, platform, ads_fetched, start_time, end_time, created_at, user_id
+    ON ads_fetch_jobs
+    FOR EACH ROW EXECUTE FUNCTION ads_fetch_jobs_stats_trigger();
+
+-- Seed the counters from existing jobs
+TRUNCATE job_stats;
+
+INSERT INTO job_stats (
+    scope, total_jobs, pending, running, completed, failed, total_ads_fetched,
+    completed_ads_fetched, total_duration_seconds, jobs_with_duration, today_date, today_jobs
+)
+SELECT
+    CASE WHEN GROUPING(user_id) = 1 THEN 'global' ELSE user_id::TEXT END,
+    COUNT(*),
+    COUNT(*) FILTER (WHERE status = 'pending'),
+    COUNT(*) FILTER (WHERE status = 'running'),
+    COUNT(*) FILTER (WHERE status = 'completed'),
+    COUNT(*) FILTER (WHERE status = 'failed'),
+    COALESCE(SUM(ads_fetched), 0),
+    COALESCE(SUM(ads_fetched) FILTER (WHERE status = 'completed'), 0),
+    COALESCE(SUM(EXTRACT(EPOCH FROM (end_time - start_time))), 0),
+    COUNT(end_time - start_time),
+    CURRENT_DATE,
+    COUNT(*) FILTER (WHERE (created_at AT TIME ZONE 'UTC')::DATE = CURRENT_DATE)
+FROM ads_fetch_jobs
+GROUP BY GROUPING SETS ((user_id), ())
+HAVING GROUPING(user_id) = 1 OR user_id IS NOT NULL;
+
+UPDATE job_stats s SET platforms = p.platforms
+FROM (
+    SELECT scope, jsonb_object_agg(platform, jobs) AS platforms
+    FROM (
+        SELECT
+            CASE WHEN GROUPING(user_id) = 1 THEN 'global' ELSE user_id::TEXT END AS scope,
+            COALESCE(platform, 'unknown') AS platform,
+            COUNT(*) AS jobs
+        FROM ads_fetch_jobs
+        GROUP BY GROUPING SETS ((user_id, COALESCE(platform, 'unknown')), (COALESCE(platform, 'unknown')))
+    ) per_platform
+    GROUP BY scope
+) p
+WHERE s.scope = p.scope;
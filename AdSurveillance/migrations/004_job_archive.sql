@@ -0,0 +1,124 @@
+-- Job history archival
+-- Finished jobs older than JOB_ARCHIVE_AFTER_DAYS are moved out of
+-- ads_fetch_jobs into compressed per-user segments (rows including logs,
+-- zstd or zlib compressed, base64 encoded) plus per-day-per-user summaries.
+-- Rows being archived are first tagged with archive_batch, so concurrent
+-- archivers never take the same job and an interrupted batch can be resumed.
+
+ALTER TABLE ads_fetch_jobs ADD COLUMN IF NOT EXISTS archive_batch TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_ads_fetch_jobs_archive_batch
+    ON ads_fetch_jobs (archive_batch)
+    WHERE archive_batch IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS ads_fetch_jobs_archive (
+    id BIGSERIAL PRIMARY KEY,
+    segment_id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    first_created_at TIMESTAMPTZ NOT NULL,
+    last_created_at TIMESTAMPTZ NOT NULL,
+    job_count INTEGER NOT NULL,
+    job_ids TEXT[] NOT NULL,
+    codec TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    raw_bytes INTEGER,
+    compressed_bytes INTEGER,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ads_fetch_jobs_archive_user_last
+    ON ads_fetch_jobs_archive (user_id, last_created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_ads_fetch_jobs_archive_job_ids
+    ON ads_fetch_jobs_archive USING GIN (job_ids);
+
+CREATE TABLE IF NOT EXISTS job_daily_summary (
+    user_id TEXT NOT NULL,
+    date DATE NOT NULL,
+    total_jobs INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    ads_fetched BIGINT NOT NULL DEFAULT 0,
+    total_duration_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    jobs_with_duration INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, date)
+);
+
+-- Store one segment and add its summaries, exactly once per segment_id
+CREATE OR REPLACE FUNCTION store_job_archive_segment(p_segment JSONB, p_summaries JSONB)
+RETURNS BOOLEAN AS $$
+BEGIN
+    INSERT INTO ads_fetch_jobs_archive (
+        segment_id, user_id, first_created_at, last_created_at, job_count,
+        job_ids, codec, payload, raw_bytes, compressed_bytes
+    )
+    VALUES (
+        p_segment ->> 'segment_id',
+        p_segment ->> 'user_id',
+        (p_segment ->> 'first_created_at')::TIMESTAMPTZ,
+        (p_segment ->> 'last_created_at')::TIMESTAMPTZ,
+        (p_segment ->> 'job_count')::INTEGER,
+        ARRAY(SELECT jsonb_array_elements_text(p_segment -> 'job_ids')),
+        p_segment ->> 'codec',
+        p_segment ->> 'payload',
+        (p_segment ->> 'raw_bytes')::INTEGER,
+        (p_segment ->> 'compressed_bytes')::INTEGER
+    )
+    ON CONFLICT (segment_id) DO NOTHING;
+
+    IF NOT FOUND THEN
+        RETURN FALSE;
+    END IF;
+
+    INSERT INTO job_daily_summary AS s (
+        user_id, date, total_jobs, completed, failed, ads_fetched, total_duration_seconds, jobs_with_duration
+    )
+    SELECT user_id, date, total_jobs, completed, failed, ads_fetched, total_duration_seconds, jobs_with_duration
+    FROM jsonb_to_recordset(p_summaries) AS r(
+        user_id TEXT, date DATE, total_jobs INTEGER, completed INTEGER, failed INTEGER,
+        ads_fetched BIGINT, total_duration_seconds DOUBLE PRECISION, jobs_with_duration INTEGER
+    )
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        total_jobs = s.total_jobs + EXCLUDED.total_jobs,
+        completed = s.completed + EXCLUDED.completed,
+        failed = s.failed + EXCLUDED.failed,
+        ads_fetched = s.ads_fetched + EXCLUDED.ads_fetched,
+        total_duration_seconds = s.total_duration_seconds + EXCLUDED.total_duration_seconds,
+        jobs_with_duration = s.jobs_with_duration + EXCLUDED.jobs_with_duration;
+
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Archived jobs still count in job_stats; only real deletes (retention purge) decrement
+CREATE OR REPLACE FUNCTION ads_fetch_jobs_stats_trigger() RETURNS trigger AS $$
+DECLARE
+    scope TEXT;
+BEGIN
+    IF TG_OP = 'DELETE' AND OLD.archive_batch IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        FOREACH scope IN ARRAY ARRAY[OLD.user_id::TEXT, 'global'] LOOP
+            PERFORM apply_job_stats_delta(
+                scope, -1, OLD.status, OLD.platform, OLD.ads_fetched,
+                EXTRACT(EPOCH FROM (OLD.end_time - OLD.start_time)),
+                (OLD.created_at AT TIME ZONE 'UTC')::DATE
+            );
+        END LOOP;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        FOREACH scope IN ARRAY ARRAY[NEW.user_id::TEXT, 'global'] LOOP
+            PERFORM apply_job_stats_delta(
+                scope, 1, NEW.status, NEW.platform, NEW.ads_fetched,
+                EXTRACT(EPOCH FROM (NEW.end_time - NEW.start_time)),
+                (NEW.created_at AT TIME ZONE 'UTC')::DATE
+            );
+        END LOOP;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,34 @@
+-- Pre-aggregated daily metrics
+-- One row per (user, competitor, platform, date) with the sums of the raw
+-- per-ad daily_metrics rows. Rows are rebuilt for every date a fetch job
+-- touched (see analytics/rollups.py), so re-running a rollup is idempotent.
+-- Backfill existing history with:
+--     python -m AdSurveillance.analytics.rollups --all
+
+CREATE TABLE IF NOT EXISTS daily_metric_rollups (
+    user_id TEXT NOT NULL,
+    competitor_id TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    date DATE NOT NULL,
+    competitor_name TEXT,
+    total_spend DOUBLE PRECISION NOT NULL DEFAULT 0,
+    total_impressions BIGINT NOT NULL DEFAULT 0,
+    total_clicks BIGINT NOT NULL DEFAULT 0,
+    ctr_sum DOUBLE PRECISION NOT NULL DEFAULT 0,      -- sum of daily_ctr, for mean CTR per ad
+    ad_count INTEGER NOT NULL DEFAULT 0,
+    low_spend_count INTEGER NOT NULL DEFAULT 0,       -- ads with daily spend under $100
+    medium_spend_count INTEGER NOT NULL DEFAULT 0,    -- $100 to $1K
+    high_spend_count INTEGER NOT NULL DEFAULT 0,      -- $1K and over
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, competitor_id, platform, date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_metric_rollups_user_date
+    ON daily_metric_rollups (user_id, date DESC);
+
+-- Finding the dates a fetch job wrote, and windowed reads of raw metrics
+CREATE INDEX IF NOT EXISTS idx_daily_metrics_competitor_created
+    ON daily_metrics (competitor_id, created_at);
+
+CREATE INDEX IF NOT EXISTS idx_daily_metrics_competitor_date
+    ON daily_metrics (competitor_id, date);
@@ -0,0 +1,40 @@
+-- Per-user analytics data versions
+-- A counter per user that changes whenever the data behind the analytics
+-- and targeting endpoints does: after a fetch job ingested metrics (bumped by
+-- the job executor) and on any competitor insert, update or delete (bumped
+-- by the trigger below). Cached responses are keyed by this version, see
+-- analytics/response_cache.py.
+
+CREATE TABLE IF NOT EXISTS analytics_data_versions (
+    user_id TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION bump_analytics_version(p_user_id TEXT) RETURNS BIGINT AS $$
+    INSERT INTO analytics_data_versions AS v (user_id, version)
+    VALUES (p_user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE
+        SET version = v.version + 1, updated_at = now()
+    RETURNING version;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION competitors_analytics_version_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.user_id IS NOT NULL THEN
+        PERFORM bump_analytics_version(OLD.user_id::TEXT);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.user_id IS NOT NULL
+            AND (TG_OP = 'INSERT' OR NEW.user_id IS DISTINCT FROM OLD.user_id) THEN
+        PERFORM bump_analytics_version(NEW.user_id::TEXT);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Fetch bookkeeping (ads_count, last_fetch_status, ...) doesn't change analytics
+DROP TRIGGER IF EXISTS competitors_analytics_version ON competitors;
+CREATE TRIGGER competitors_analytics_version
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, name, domain, industry, platform, estimated_monthly_spend, is_active
+    ON competitors
+    FOR EACH ROW EXECUTE FUNCTION competitors_analytics_version_trigger();
@@ -0,0 +1,11 @@
+-- Per-ad metric distributions on the daily rollups
+-- Each rollup row stores a t-digest (see analytics/sketches.py) of the daily
+-- spend, CTR and CPM of the ads it summarises. Percentiles over any window
+-- merge these daily digests instead of rescanning daily_metrics.
+-- Existing rollups get digests when rebuilt:
+--     python -m AdSurveillance.analytics.rollups --all
+
+ALTER TABLE daily_metric_rollups
+    ADD COLUMN IF NOT EXISTS spend_digest JSONB,
+    ADD COLUMN IF NOT EXISTS ctr_digest JSONB,
+    ADD COLUMN IF NOT EXISTS cpm_digest JSONB;
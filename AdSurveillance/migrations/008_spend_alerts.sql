@@ -0,0 +1,25 @@
+-- Spend anomaly alerts
+-- One row per (user, competitor, platform, date) whose daily spend scored a
+-- robust z-score of at least ANOMALY_Z_THRESHOLD against the trailing
+-- ANOMALY_WINDOW_DAYS (see analytics/anomalies.py). Written after every
+-- fetch job; re-scoring a day updates its row.
+
+CREATE TABLE IF NOT EXISTS spend_alerts (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id TEXT NOT NULL,
+    competitor_id TEXT NOT NULL,
+    competitor_name TEXT,
+    platform TEXT NOT NULL,
+    date DATE NOT NULL,
+    spend DOUBLE PRECISION NOT NULL,
+    baseline_median DOUBLE PRECISION NOT NULL,
+    baseline_mad DOUBLE PRECISION NOT NULL,
+    z_score DOUBLE PRECISION NOT NULL,
+    direction TEXT NOT NULL CHECK (direction IN ('spike', 'drop')),
+    change_pct DOUBLE PRECISION,                      -- NULL when the baseline median is 0
+    detected_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    UNIQUE (user_id, competitor_id, platform, date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_spend_alerts_user_date
+    ON spend_alerts (user_id, date DESC);
@@ -0,0 +1,46 @@
+"""
+Service metrics for AdSurveillance
+In-process counters and gauges exposed through the /metrics endpoint
+"""
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any
+
+
+class ServiceMetrics:
+    """Thread-safe registry of named counters and gauges"""
+
+    def __init__(self):
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """Increment a counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: Any) -> None:
+        """Set a gauge to its latest value"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def get(self, name: str, default: Any = 0) -> Any:
+        """Get the current value of a counter or gauge"""
+        with self._lock:
+            if name in self._counters:
+                return self._counters[name]
+            return self._gauges.get(name, default)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a copy of all counters and gauges"""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'timestamp': datetime.now(timezone.utc).isoformat()
+            }
+
+
+# Global registry
+metrics = ServiceMetrics()